@@ -1,15 +1,98 @@
 # celery_config.py
+#
+# Run a worker with:
+#   celery -A app.celery_config worker -Q extraction,ai --concurrency 4
+#
+# and the periodic jobs (escalation sweeps) with:
+#   celery -A app.celery_config beat
+#
+# Deadline timeouts, reminders and escalations are fired on time by a single
+#   python -m app.deadline_scheduler
+#
+# Set DOCUMENT_QUEUE_MODE=local to use an on-disk SQLite broker instead of Redis.
+import os
+from pathlib import Path
 from celery import Celery
+from kombu import Queue
 
-app = Celery('document_processing')
-app.config_from_object('celeryconfig')
+QUEUE_MODE = os.getenv("DOCUMENT_QUEUE_MODE", "redis")
+QUEUE_DIR = Path(os.getenv("DOCUMENT_QUEUE_DIR", Path(__file__).parent.parent / "queue"))
 
-# celeryconfig.py
-broker_url = 'redis://localhost:6379/0'
-result_backend = 'redis://localhost:6379/0'
+if QUEUE_MODE == "local":
+    QUEUE_DIR.mkdir(parents=True, exist_ok=True)
+    broker_url = f"sqla+sqlite:///{QUEUE_DIR / 'broker.sqlite'}"
+    result_backend = f"db+sqlite:///{QUEUE_DIR / 'results.sqlite'}"
+else:
+    broker_url = os.getenv("CELERY_BROKER_URL", "redis://localhost:6379/0")
+    result_backend = os.getenv("CELERY_RESULT_BACKEND", "redis://localhost:6379/0")
 
-task_serializer = 'json'
-result_serializer = 'json'
-accept_content = ['json']
-timezone = 'UTC'
-enable_utc = True
\ No newline at end of file
+celery_app = Celery('document_processing', include=['app.tasks'])
+celery_app.conf.update(
+    broker_url=broker_url,
+    result_backend=result_backend,
+    task_serializer='json',
+    result_serializer='json',
+    accept_content=['json'],
+    timezone='UTC',
+    enable_utc=True,
+
+    # CPU-bound OCR/parsing and network-bound LLM calls are isolated so each
+    # queue can be given its own worker pool and concurrency.
+    task_queues=(
+        Queue('extraction', queue_arguments={'x-max-priority': 10}),
+        Queue('ai', queue_arguments={'x-max-priority': 10}),
+    ),
+    task_default_queue='extraction',
+    task_routes={
+        'documents.extract': {'queue': 'extraction'},
+        'documents.extract_batch': {'queue': 'extraction'},
+        'documents.index_semantic': {'queue': 'extraction'},
+        'audits.export_archive': {'queue': 'extraction'},
+        'documents.encode_version_delta': {'queue': 'extraction'},
+        'requirements.sweep_escalations': {'queue': 'extraction'},
+        'documents.requeue_stuck': {'queue': 'extraction'},
+        'documents.generate_findings': {'queue': 'ai'},
+        'documents.generate_findings_batch': {'queue': 'ai'},
+    },
+    task_annotations={
+        'documents.generate_findings': {'rate_limit': os.getenv("AI_TASK_RATE_LIMIT", "30/m")},
+        'documents.generate_findings_batch': {'rate_limit': os.getenv("AI_TASK_RATE_LIMIT", "30/m")},
+    },
+
+    # Jobs survive worker restarts: a message is only acknowledged once the
+    # task finishes, and workers never hoard more than one job per process.
+    task_acks_late=True,
+    task_reject_on_worker_lost=True,
+    worker_prefetch_multiplier=1,
+    # Each child may start a PDF page pool of PDF_EXTRACTION_WORKERS processes,
+    # which defaults to this host's cores divided by the concurrency; set both
+    # through the environment rather than `celery worker -c`.
+    worker_concurrency=int(os.getenv("DOCUMENT_WORKER_CONCURRENCY", 4)),
+    worker_max_tasks_per_child=int(os.getenv("DOCUMENT_WORKER_MAX_TASKS_PER_CHILD", 100)),
+
+    # Redis emulates priorities with one list per step; 0 is served first.
+    broker_transport_options={
+        'queue_order_strategy': 'priority',
+        'priority_steps': list(range(10)),
+        'sep': ':',
+        'visibility_timeout': 3600,
+    },
+    task_default_priority=5,
+
+    beat_schedule={
+        'sweep-escalations': {
+            'task': 'requirements.sweep_escalations',
+            'schedule': float(os.getenv("ESCALATION_SWEEP_INTERVAL", 300)),  # seconds
+            # A sweep that waited longer than its interval is superseded by the next
+            'options': {'expires': float(os.getenv("ESCALATION_SWEEP_INTERVAL", 300))},
+        },
+        'requeue-stuck-submissions': {
+            'task': 'documents.requeue_stuck',
+            'schedule': float(os.getenv("REQUEUE_SWEEP_INTERVAL", 600)),  # seconds
+            'options': {'expires': float(os.getenv("REQUEUE_SWEEP_INTERVAL", 600))},
+        },
+    },
+)
+
+# `celery -A app.celery_config` looks for an `app` attribute
+app = celery_app
@@ -1,19 +1,24 @@
 # app/crud/document_crud.py
 
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, defer, joinedload, selectinload
 from sqlalchemy.exc import SQLAlchemyError
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
 import os
 import json
 import shutil
 import uuid
+import hashlib
 import logging
 from datetime import datetime, timedelta
-from fastapi import HTTPException
+from fastapi import HTTPException, Request
 from app.models import Document as DocumentModel, DocumentMetadata, Workflow, DocumentWorkflow, Annotation, DocumentVersion, Activity, DocumentAIAnalysis, RelatedDocument,WorkflowExecutionHistory
 from app.schemas.document import DocumentResponse  
+from app.utils.pagination import keyset_page, cached_count
+from app.utils.document_search import refresh_search_vector, search_filter
+from app.utils.file_serving import serve_file
+from app.utils import blob_store
+from app.utils.uploads import ingest_upload
 from sqlalchemy import or_, desc
-from fastapi.responses import StreamingResponse
 from pydantic import ValidationError
 import json
 import traceback
@@ -31,22 +36,10 @@ ALLOWED_FILE_TYPES = [
     "application/vnd.ms-excel",  # Excel (XLS)
     "text/csv"  # CSV files
 ]
-def validate_file(file):
-    if file.content_type not in ALLOWED_FILE_TYPES:
-        raise HTTPException(
-            status_code=400, 
-            detail=f"Invalid file type. Allowed types are: {', '.join(ALLOWED_FILE_TYPES)}"
-        )
-
-def save_upload_file(file, destination):
-    try:
-        with open(destination, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-    except Exception as e:
-        logger.error(f"Error saving file {destination}: {e}")
-        raise HTTPException(status_code=500, detail="File upload failed")
-    finally:
-        file.file.close()
+def save_upload_file(file) -> Tuple[str, str]:
+    """Stores an upload in the blob store and returns its path and SHA-256 hex digest."""
+    upload = ingest_upload(file, blob_store.staging_path(file.filename or ""), max_size=MAX_FILE_SIZE)
+    return blob_store.adopt(upload.path, upload.sha256, file.filename or ""), upload.sha256
 
 def delete_file(path: str):
     try:
@@ -74,41 +67,22 @@ def parse_metadata(metadata: str) -> Dict[str, Any]:
         logger.error(f"Invalid metadata JSON: {str(e)}")
         raise HTTPException(status_code=400, detail="Invalid metadata format")
 def create_document(db: Session, file, metadata: str, current_user):
-    file_location = None
     try:
-        validate_file(file)
-        
-        file_size = len(file.file.read())
-        file.file.seek(0)
-        
-        if file_size > MAX_FILE_SIZE:
-            raise HTTPException(
-                status_code=400, 
-                detail=f"File size exceeds limit of {MAX_FILE_SIZE / 1024 / 1024} MB"
-            )
-        
         metadata_dict = parse_metadata(metadata)
         
-        upload_dir = os.path.join(UPLOAD_DIR, "documents")
-        os.makedirs(upload_dir, exist_ok=True)
-        
-        filename_pattern = "{timestamp}_{user_id}_{company_id}_{original_name}_{unique_id}{extension}"
-        formatted_filename = format_filename(
-            pattern=filename_pattern,
-            user_id=current_user.id,
-            company_id=current_user.company_id,
-            original_filename=file.filename,
+        # One pass: size limit, SHA-256 and the type sniffed from the content
+        upload = ingest_upload(
+            file, blob_store.staging_path(file.filename), max_size=MAX_FILE_SIZE, allowed_types=ALLOWED_FILE_TYPES
         )
-        
-        file_location = os.path.join(upload_dir, formatted_filename)
-        
-        save_upload_file(file, file_location)
+        # Identical content is stored once; an unreferenced blob is garbage collected
+        file_location = blob_store.adopt(upload.path, upload.sha256, file.filename)
         
         db_document = DocumentModel(
             title=metadata_dict.get('title', file.filename),
             file_path=file_location,
-            file_type=file.content_type,
-            file_size=file_size,
+            file_type=upload.mime_type,
+            file_size=upload.size,
+            hash_sha256=upload.sha256,
             owner_id=current_user.id,
             company_id=int(current_user.company_id),
             content=metadata_dict.get('description', ''),
@@ -168,35 +142,102 @@ def create_document(db: Session, file, metadata: str, current_user):
             db.add(upload_history)
         
         db.commit()
+        refresh_search_vector(db, db_document.id)
         return db_document
     
     except ValidationError as e:
         logger.error(f"Validation Error: {e}")
-        if file_location:
-            delete_file(file_location)
         raise HTTPException(status_code=422, detail=str(e))
     
     except SQLAlchemyError as e:
         logger.error(f"Database Error: {str(e)}")
         logger.error(traceback.format_exc())
-        if file_location:
-            delete_file(file_location)
         db.rollback()
         raise HTTPException(status_code=500, detail="Database operation failed")
     
     except HTTPException:
-        if file_location:
-            delete_file(file_location)
         raise
     
     except Exception as e:
         logger.error(f"Unexpected Error: {str(e)}")
         logger.error(traceback.format_exc())
-        if file_location:
-            delete_file(file_location)
         raise HTTPException(status_code=500, detail="An unexpected error occurred")
 
-def list_documents(db: Session, current_user, page: int, limit: int, search: Optional[str], type: Optional[str], status: Optional[str], date_from: Optional[str], date_to: Optional[str], sort_by: str):
+def create_documents_bulk(db: Session, uploads: List[Any], metadata: Dict[str, Any], current_user) -> List[DocumentModel]:
+    """
+    Inserts documents for files already stored by ingest_uploads, with their
+    metadata rows, initial versions and approval workflows, in a few
+    multi-row INSERTs. Flushes but does not commit, so the caller can add
+    dependent rows to the same transaction.
+    """
+    now = datetime.utcnow()
+    documents = [
+        DocumentModel(
+            title=upload.filename,
+            file_path=upload.path,
+            file_type=upload.mime_type,
+            file_size=upload.size,
+            hash_sha256=upload.sha256,
+            owner_id=current_user.id,
+            company_id=int(current_user.company_id),
+            content=metadata.get('description', ''),
+        )
+        for upload in uploads
+    ]
+    db.add_all(documents)
+    db.flush()
+
+    rows = []
+    for document in documents:
+        rows.extend(
+            DocumentMetadata(document_id=document.id, key=key, value=str(value))
+            for key, value in metadata.items() if key not in ['title', 'description']
+        )
+        rows.append(DocumentVersion(
+            document_id=document.id,
+            version_number=1,
+            content="Initial document version",
+            file_path=document.file_path,
+            created_at=now
+        ))
+
+    workflow = db.query(Workflow).filter(
+        Workflow.name == "Document Approval Workflow",
+        Workflow.company_id == current_user.company_id
+    ).first()
+    document_workflows = []
+    if workflow:
+        document_workflows = [
+            DocumentWorkflow(
+                document_id=document.id,
+                workflow_id=workflow.id,
+                current_step=2,  # Start at step 2 (Review)
+                status="in_progress",
+                started_at=now,
+                timeout_at=now + timedelta(hours=24)
+            )
+            for document in documents
+        ]
+        rows.extend(document_workflows)
+    db.add_all(rows)
+    db.flush()
+
+    db.add_all([
+        WorkflowExecutionHistory(
+            document_workflow_id=document_workflow.id,
+            step_number=1,  # Upload step
+            action="Completed Upload",
+            performed_by=current_user.id,
+            performed_at=now,
+            notes="Document uploaded successfully",
+            status="completed"
+        )
+        for document_workflow in document_workflows
+    ])
+    db.flush()
+    return documents
+
+def list_documents(db: Session, current_user, page: int, limit: int, search: Optional[str], type: Optional[str], status: Optional[str], date_from: Optional[str], date_to: Optional[str], sort_by: str, cursor: Optional[str] = None, use_cursor: bool = False, include_total: bool = True):
     try:
         query = db.query(DocumentModel).filter(
             DocumentModel.company_id == current_user.company_id,
@@ -204,13 +245,8 @@ def list_documents(db: Session, current_user, page: int, limit: int, search: Opt
         )
 
         if search:
-            # Search in title and metadata values (as strings)
-            # For JSON content, we'll need to cast it to text for searching
-            query = query.filter(or_(
-                DocumentModel.title.ilike(f"%{search}%"),
-                DocumentModel.content.cast(String).ilike(f"%{search}%"),
-                DocumentMetadata.value.ilike(f"%{search}%")
-            )).join(DocumentMetadata, isouter=True)
+            # Title, metadata, extracted content and raw text via the full-text index
+            query = query.filter(search_filter(search))
 
         if type:
             query = query.filter(DocumentModel.file_type == type)
@@ -225,16 +261,27 @@ def list_documents(db: Session, current_user, page: int, limit: int, search: Opt
             query = query.filter(DocumentModel.created_at <= date_to)
 
         if sort_by == "name":
-            query = query.order_by(DocumentModel.title)
+            sort_column, descending = DocumentModel.title, False
         elif sort_by == "size":
-            query = query.order_by(DocumentModel.file_size)
+            sort_column, descending = DocumentModel.file_size, False
         elif sort_by == "type":
-            query = query.order_by(DocumentModel.file_type)
+            sort_column, descending = DocumentModel.file_type, False
         else:
-            query = query.order_by(desc(DocumentModel.created_at))
-
-        total = query.count()
-        documents = query.offset((page - 1) * limit).limit(limit).all()
+            sort_column, descending = DocumentModel.created_at, True
+
+        next_cursor = None
+        if use_cursor or cursor:
+            total = cached_count(
+                query,
+                ("documents", current_user.company_id, search, type, status, date_from, date_to)
+            ) if include_total else None
+            result = keyset_page(query, DocumentModel.id, cursor, limit, sort_column=sort_column, descending=descending)
+            documents = result["items"]
+            next_cursor = result["next_cursor"]
+        else:
+            query = query.order_by(desc(sort_column) if descending else sort_column)
+            total = query.count()
+            documents = query.offset((page - 1) * limit).limit(limit).all()
 
         document_responses = []
         for doc in documents:
@@ -248,6 +295,15 @@ def list_documents(db: Session, current_user, page: int, limit: int, search: Opt
             doc_response.workflow_status = workflow_status
             document_responses.append(doc_response)
 
+        if use_cursor or cursor:
+            return {
+                "documents": document_responses,
+                "total": total,
+                "limit": limit,
+                "next_cursor": next_cursor,
+                "has_more": next_cursor is not None
+            }
+
         return {
             "documents": document_responses,
             "total": total,
@@ -255,6 +311,8 @@ def list_documents(db: Session, current_user, page: int, limit: int, search: Opt
             "limit": limit,
             "total_pages": (total + limit - 1) // limit
         }
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error in list_documents: {str(e)}")
         raise HTTPException(status_code=500, detail="An error occurred while retrieving documents")
@@ -290,8 +348,53 @@ def batch_operation(db: Session, operation: str, document_ids: List[int], curren
         raise HTTPException(status_code=500, detail="Error performing batch operation")
 
 
-def get_document(db: Session, document_id: int, current_user):
-    document = db.query(DocumentModel).filter(
+# Sections of the document detail response; `include` selects a subset
+DOCUMENT_DETAIL_SECTIONS = (
+    "metadata", "annotations", "versions", "workflows", "activityLog",
+    "aiAnalysis", "relatedDocuments", "content", "raw_content"
+)
+
+def parse_include(include: Optional[str]) -> set:
+    """
+    Parses a comma-separated `include` parameter; None means every section.
+    """
+    if not include:
+        return set(DOCUMENT_DETAIL_SECTIONS)
+    sections = {section.strip() for section in include.split(",") if section.strip()}
+    unknown = sections - set(DOCUMENT_DETAIL_SECTIONS)
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown include section(s): {', '.join(sorted(unknown))}. Allowed: {', '.join(DOCUMENT_DETAIL_SECTIONS)}"
+        )
+    return sections
+
+def get_document(db: Session, document_id: int, current_user, include: Optional[str] = None):
+    """
+    Loads the document detail aggregate. Each selected collection is fetched
+    with one IN query (selectinload) instead of one query per row, so the
+    number of queries is fixed whatever the document's history; sections that
+    are not selected, and the large text columns, are not loaded at all.
+    """
+    sections = parse_include(include)
+
+    options = [defer(DocumentModel.search_vector)]
+    if "content" not in sections:
+        options.append(defer(DocumentModel.content))
+    if "raw_content" not in sections:
+        options.append(defer(DocumentModel.raw_content))
+    if "metadata" in sections:
+        options.append(selectinload(DocumentModel.document_metadata))
+    if "annotations" in sections:
+        options.append(selectinload(DocumentModel.annotations))
+    if "versions" in sections:
+        options.append(selectinload(DocumentModel.versions))
+    if "workflows" in sections:
+        options.append(selectinload(DocumentModel.document_workflows).selectinload(DocumentWorkflow.execution_history))
+    if "aiAnalysis" in sections:
+        options.append(selectinload(DocumentModel.ai_analyses))
+
+    document = db.query(DocumentModel).options(*options).filter(
         DocumentModel.id == document_id,
         DocumentModel.company_id == current_user.company_id,
         DocumentModel.is_deleted == False
@@ -300,162 +403,120 @@ def get_document(db: Session, document_id: int, current_user):
     if not document:
         raise HTTPException(status_code=404, detail="Document not found")
 
-    # Parse the document.content field into a Python dictionary
-    try:
-        content = json.loads(document.content) if document.content else {}
-        print('Content:', content)
-    except json.JSONDecodeError:
-        content = {}  # Fallback to an empty dictionary if JSON is invalid
-    
-    try:
-        raw_content = document.raw_content if document.raw_content else ''
-    except json.JSONDecodeError:
-        raw_content = ''
-
-    # Use the SQLAlchemy model for the query
-    metadata = db.query(DocumentMetadata).filter(
-        DocumentMetadata.document_id == document_id
-    ).all()
-
-    metadata_dict = {m.key: m.value for m in metadata}
-
-    annotations = db.query(Annotation).filter(
-        Annotation.document_id == document_id
-    ).all()
-    annotations_list = [
-        {
-            "id": annotation.id,
-            "text": annotation.text,
-            "user_id": annotation.user_id,
-            "created_at": annotation.created_at.isoformat() if annotation.created_at else None
-        }
-        for annotation in annotations
-    ]
-
-    versions = db.query(DocumentVersion).filter(
-        DocumentVersion.document_id == document_id
-    ).order_by(DocumentVersion.version_number.desc()).all()
-    versions_list = [
-        {
-            "id": version.id,
-            "version_number": version.version_number,
-            "content": version.content,
-            "created_at": version.created_at.isoformat() if version.created_at else None
-        }
-        for version in versions
-    ]
-
-    workflows = db.query(DocumentWorkflow).filter(
-        DocumentWorkflow.document_id == document_id
-    ).all()
-    workflows_list = [
-        {
-            "id": workflow.id,
-            "workflow_id": workflow.workflow_id,
-            "current_step": workflow.current_step,
-            "status": workflow.status,
-            "started_at": workflow.started_at.isoformat() if workflow.started_at else None,
-            "completed_at": workflow.completed_at.isoformat() if workflow.completed_at else None,
-            "timeout_at": workflow.timeout_at.isoformat() if workflow.timeout_at else None,
-            "execution_history": [
-                {
-                    "id": history.id,
-                    "step_number": history.step_number,
-                    "action": history.action,
-                    "performed_by": history.performed_by,
-                    "performed_at": history.performed_at.isoformat() if history.performed_at else None,
-                    "notes": history.notes,
-                    "status": history.status
-                }
-                for history in workflow.execution_history
-            ]
-        }
-        for workflow in workflows
-    ]
-
-    activities = db.query(Activity).filter(
-        Activity.document_id == document_id
-    ).order_by(Activity.created_at.desc()).all()
-    activities_list = [
-        {
-            "action": activity.action,
-            "user": activity.user.username,
-            "timestamp": activity.created_at.isoformat() if activity.created_at else None,
-            "type": activity.details.get("type") if activity.details else None
-        }
-        for activity in activities
-    ]
-
-    ai_analysis = db.query(DocumentAIAnalysis).filter(
-        DocumentAIAnalysis.document_id == document_id
-    ).first()
-    print('AI Analysis:', ai_analysis)
-
-    # Initialize an empty dictionary for AI analysis results
-    ai_analysis_dict = {}
-
-    # Check if ai_analysis exists and results is a dictionary
-    if ai_analysis and isinstance(ai_analysis.results, dict):
-        # Iterate over the keys and values in ai_analysis.results
-        for key, value in ai_analysis.results.items():
-            # Add each key-value pair to ai_analysis_dict
-            ai_analysis_dict[key] = value
-    else:
-        # If ai_analysis is None or results is not a dictionary, initialize with an empty dictionary
-        ai_analysis_dict = {}
-
-    print('AI Analysis Dict:', ai_analysis_dict)
-
-    related_documents = db.query(DocumentModel).join(
-        RelatedDocument, RelatedDocument.related_document_id == DocumentModel.id
-    ).filter(
-        RelatedDocument.document_id == document_id
-    ).all()
-    related_documents_list = [
-        {
-            "id": doc.id,
-            "name": doc.title,
-            "type": doc.file_type,
-            "size": f"{doc.file_size / 1024 / 1024:.2f} MB"
-        }
-        for doc in related_documents
-    ]
-
-    return {
+    result = {
         "id": document.id,
         "title": document.title,
         "file_type": document.file_type,
         "file_size": document.file_size,
         "name": document.title,
-        "metadata": metadata_dict,
-        "annotations": annotations_list,
-        "versions": versions_list,
-        "workflows": workflows_list,
-        "activityLog": activities_list,
-        "aiAnalysis": [ai_analysis_dict],  # Wrap the AI analysis in a list to match the frontend's expected format
-        "relatedDocuments": related_documents_list,
-        "content": content,
-        "raw_content": raw_content
     }
 
-def get_document_content(db: Session, document_id: int, current_user):
-    document = db.query(DocumentModel).filter(
-        DocumentModel.id == document_id,
-        DocumentModel.company_id == current_user.company_id,
-        DocumentModel.is_deleted == False
-    ).first()
-
-    if not document:
-        raise HTTPException(status_code=404, detail="Document not found")
-
-    def iterfile():
-        with open(document.file_path, "rb") as file:
-            yield from file
-
-    return StreamingResponse(iterfile(), media_type=document.file_type)
-
-def download_document(db: Session, document_id: int, current_user):
-    document = db.query(DocumentModel).filter(
+    if "metadata" in sections:
+        result["metadata"] = {m.key: m.value for m in document.document_metadata}
+
+    if "annotations" in sections:
+        result["annotations"] = [
+            {
+                "id": annotation.id,
+                "text": annotation.text,
+                "user_id": annotation.user_id,
+                "created_at": annotation.created_at.isoformat() if annotation.created_at else None
+            }
+            for annotation in document.annotations
+        ]
+
+    if "versions" in sections:
+        result["versions"] = [
+            {
+                "id": version.id,
+                "version_number": version.version_number,
+                "content": version.content,
+                "created_at": version.created_at.isoformat() if version.created_at else None
+            }
+            for version in sorted(document.versions, key=lambda v: v.version_number or 0, reverse=True)
+        ]
+
+    if "workflows" in sections:
+        result["workflows"] = [
+            {
+                "id": workflow.id,
+                "workflow_id": workflow.workflow_id,
+                "current_step": workflow.current_step,
+                "status": workflow.status,
+                "started_at": workflow.started_at.isoformat() if workflow.started_at else None,
+                "completed_at": workflow.completed_at.isoformat() if workflow.completed_at else None,
+                "timeout_at": workflow.timeout_at.isoformat() if workflow.timeout_at else None,
+                "execution_history": [
+                    {
+                        "id": history.id,
+                        "step_number": history.step_number,
+                        "action": history.action,
+                        "performed_by": history.performed_by,
+                        "performed_at": history.performed_at.isoformat() if history.performed_at else None,
+                        "notes": history.notes,
+                        "status": history.status
+                    }
+                    for history in workflow.execution_history
+                ]
+            }
+            for workflow in document.document_workflows
+        ]
+
+    if "activityLog" in sections:
+        activities = db.query(Activity).options(joinedload(Activity.user)).filter(
+            Activity.document_id == document_id
+        ).order_by(Activity.created_at.desc()).all()
+        result["activityLog"] = [
+            {
+                "action": activity.action,
+                "user": activity.user.username if activity.user else None,
+                "timestamp": activity.created_at.isoformat() if activity.created_at else None,
+                "type": activity.details.get("type") if activity.details else None
+            }
+            for activity in activities
+        ]
+
+    if "aiAnalysis" in sections:
+        # Only the first analysis is shown; its results are wrapped in a list
+        # to match the frontend's expected format
+        ai_analysis = min(document.ai_analyses, key=lambda a: a.id, default=None)
+        result["aiAnalysis"] = [dict(ai_analysis.results) if ai_analysis and isinstance(ai_analysis.results, dict) else {}]
+
+    if "relatedDocuments" in sections:
+        related_documents = db.query(
+            DocumentModel.id, DocumentModel.title, DocumentModel.file_type, DocumentModel.file_size
+        ).join(
+            RelatedDocument, RelatedDocument.related_document_id == DocumentModel.id
+        ).filter(
+            RelatedDocument.document_id == document_id
+        ).all()
+        result["relatedDocuments"] = [
+            {
+                "id": doc.id,
+                "name": doc.title,
+                "type": doc.file_type,
+                "size": f"{doc.file_size / 1024 / 1024:.2f} MB"
+            }
+            for doc in related_documents
+        ]
+
+    if "content" in sections:
+        # Parse the document.content field into a Python dictionary
+        try:
+            result["content"] = json.loads(document.content) if document.content else {}
+        except json.JSONDecodeError:
+            result["content"] = {}  # Fallback to an empty dictionary if JSON is invalid
+
+    if "raw_content" in sections:
+        result["raw_content"] = document.raw_content or ''
+
+    return result
+
+def _document_file(db: Session, document_id: int, current_user):
+    # Only the columns needed to serve the file, not the extracted text
+    document = db.query(
+        DocumentModel.title, DocumentModel.file_path, DocumentModel.file_type, DocumentModel.hash_sha256
+    ).filter(
         DocumentModel.id == document_id,
         DocumentModel.company_id == current_user.company_id,
         DocumentModel.is_deleted == False
@@ -463,23 +524,28 @@ def download_document(db: Session, document_id: int, current_user):
 
     if not document:
         raise HTTPException(status_code=404, detail="Document not found")
+    return document
 
-    def iterfile():
-        with open(document.file_path, "rb") as file:
-            yield from file
-
-    # Create a filename without path components for security
-    filename = os.path.basename(document.title)
-    
-    headers = {
-        "Content-Disposition": f'attachment; filename="{filename}"'
-    }
+def get_document_content(db: Session, document_id: int, current_user, request: Request):
+    document = _document_file(db, document_id, current_user)
+    return serve_file(
+        request,
+        document.file_path,
+        media_type=document.file_type,
+        content_hash=document.hash_sha256
+    )
 
-    return StreamingResponse(
-        iterfile(), 
+def download_document(db: Session, document_id: int, current_user, request: Request):
+    document = _document_file(db, document_id, current_user)
+    return serve_file(
+        request,
+        document.file_path,
         media_type=document.file_type,
-        headers=headers
+        filename=document.title,
+        disposition="attachment",
+        content_hash=document.hash_sha256
     )
+
 def update_document_metadata(db: Session, document_id: int, metadata: Dict[str, Any], current_user):
     try:
         document = db.query(DocumentModel).filter(
@@ -509,6 +575,7 @@ def update_document_metadata(db: Session, document_id: int, metadata: Dict[str,
 
         document.updated_at = datetime.utcnow()
         db.commit()
+        refresh_search_vector(db, document_id)
 
         return {"message": "Metadata updated successfully", "metadata": metadata}
     
@@ -538,34 +605,46 @@ def delete_document(db: Session, document_id: int, current_user):
         db.rollback()
         raise HTTPException(status_code=500, detail="Error deleting document")
 
-def cleanup_deleted_documents(db: Session, current_user):
+def cleanup_deleted_documents(db: Session, current_user, migrate_legacy_files: bool = False):
     try:
         thirty_days_ago = datetime.utcnow() - timedelta(days=30)
-        deleted_documents = db.query(DocumentModel).filter(
+        deleted_documents = db.query(DocumentModel).options(selectinload(DocumentModel.versions)).filter(
             DocumentModel.is_deleted == True,
             DocumentModel.updated_at < thirty_days_ago,
             DocumentModel.company_id == current_user.company_id
         ).all()
 
         deleted_count = 0
+        legacy_paths = set()
         for document in deleted_documents:
             db.query(DocumentMetadata).filter(
                 DocumentMetadata.document_id == document.id
             ).delete()
 
-            if os.path.exists(document.file_path):
-                try:
-                    os.remove(document.file_path)
-                except OSError as e:
-                    logger.error(f"Error deleting file {document.file_path}: {e}")
+            # Deleting the rows releases their blob references; files outside
+            # the blob store are removed below once nothing points at them
+            for version in document.versions:
+                if version.file_path and not blob_store.sha_for_path(version.file_path):
+                    legacy_paths.add(version.file_path)
+                db.delete(version)
+            if document.file_path and not blob_store.sha_for_path(document.file_path):
+                legacy_paths.add(document.file_path)
 
             db.delete(document)
             deleted_count += 1
 
         db.commit()
+        blob_store.remove_unreferenced_files(db, legacy_paths)
+
+        migrated = blob_store.import_legacy_files(db, current_user.company_id) if migrate_legacy_files else 0
+        collected = blob_store.collect_garbage(db)
         return {
             "message": f"Successfully cleaned up {deleted_count} documents",
-            "details": f"Removed documents deleted before {thirty_days_ago}"
+            "details": (
+                f"Removed documents deleted before {thirty_days_ago}; "
+                f"freed {collected['blobs_removed']} unreferenced files"
+                + (f"; moved {migrated} files into the blob store" if migrate_legacy_files else "")
+            )
         }
     
     except SQLAlchemyError as e:
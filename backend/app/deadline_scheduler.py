@@ -0,0 +1,356 @@
+# deadline_scheduler.py
+#
+# Fires deadline events when they fall due:
+#   - workflow timeouts: an in-progress DocumentWorkflow past its timeout_at
+#     is marked timed_out, with a history entry;
+#   - requirement reminders (DEADLINE_REMINDER_HOURS before the deadline of a
+#     requirement with no submission yet) and escalations at the deadline of
+#     auto-escalating requirements, handled by the escalation sweeper;
+#   - action item reminders before due_date, and overdue notices that mark
+#     the item overdue at due_date.
+#
+# Run a single instance next to the workers with:
+#   python -m app.deadline_scheduler
+#
+# Upcoming events are held in a hierarchical timer wheel (app.utils.timer_wheel).
+# Every DEADLINE_REFRESH_INTERVAL seconds the scheduler loads, through the
+# deadline indexes, the events of the next DEADLINE_LOAD_WINDOW seconds plus
+# those of rows created since the last load, so deadlines added or moved into
+# the window are picked up without rescanning the tables. The watermark (all
+# events due up to `fired_through` have fired, rows up to `max_ids` are
+# loaded) is stored in deadline_scheduler_state after each pass, so a
+# restart resumes from it. Fired events are recorded in deadline_events in
+# the transaction that fires them, which keeps a restart or a second
+# instance from firing one twice. Once an event is older than the watermark
+# it can no longer be loaded again, so its record is deleted after
+# DEADLINE_EVENT_RETENTION_DAYS.
+import logging
+import os
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import and_, delete, func, insert as core_insert, or_, select, true, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal
+from app.models import (
+    ActionItem, ActionItemStatus, Audit, AuditFinding, AuditNotification, DeadlineEvent, DeadlineSchedulerState,
+    DocumentRequirement, DocumentWorkflow, NotificationPriority, WorkflowExecutionHistory
+)
+from app.utils import domain_events, kpi_store, response_cache  # register the ORM hooks for the scheduler's writes
+from app.utils.escalation_sweeper import escalation_targets, sweep_escalations
+from app.utils.timer_wheel import TimerWheel
+
+logger = logging.getLogger(__name__)
+
+SCHEDULER_NAME = "deadlines"
+DEADLINE_LOAD_WINDOW = int(os.getenv("DEADLINE_LOAD_WINDOW", 3600))  # seconds of upcoming events kept in memory
+DEADLINE_REFRESH_INTERVAL = int(os.getenv("DEADLINE_REFRESH_INTERVAL", 60))  # seconds between loads
+DEADLINE_REMINDER_HOURS = int(os.getenv("DEADLINE_REMINDER_HOURS", 24))
+DEADLINE_INITIAL_LOOKBACK_HOURS = int(os.getenv("DEADLINE_INITIAL_LOOKBACK_HOURS", 24))
+DEADLINE_EVENT_RETENTION_DAYS = int(os.getenv("DEADLINE_EVENT_RETENTION_DAYS", 30))
+DEADLINE_FIRE_BATCH_SIZE = 1000
+DEADLINE_PRUNE_BATCH_SIZE = 5000
+
+WORKFLOW = "workflow"
+REQUIREMENT = "requirement"
+ACTION_ITEM = "action_item"
+
+TIMEOUT = "timeout"
+REMINDER = "reminder"
+ESCALATION = "escalation"
+OVERDUE = "overdue"
+
+OPEN_ACTION_ITEM_STATUSES = (ActionItemStatus.pending, ActionItemStatus.in_progress)
+REMINDER_LEAD = timedelta(hours=DEADLINE_REMINDER_HOURS)
+
+# kind: (model, deadline column, rows that can still fire)
+SOURCES = {
+    WORKFLOW: (DocumentWorkflow, DocumentWorkflow.timeout_at, DocumentWorkflow.status == "in_progress"),
+    REQUIREMENT: (DocumentRequirement, DocumentRequirement.deadline, true()),
+    ACTION_ITEM: (ActionItem, ActionItem.due_date, ActionItem.status.in_(OPEN_ACTION_ITEM_STATUSES)),
+}
+
+# (kind, event, offset from the deadline, extra condition)
+EVENTS = (
+    (WORKFLOW, TIMEOUT, timedelta(0), None),
+    (REQUIREMENT, REMINDER, -REMINDER_LEAD, None),
+    (REQUIREMENT, ESCALATION, timedelta(0), DocumentRequirement.auto_escalate == True),
+    (ACTION_ITEM, REMINDER, -REMINDER_LEAD, None),
+    (ACTION_ITEM, OVERDUE, timedelta(0), None),
+)
+
+_EPOCH = datetime(1970, 1, 1)
+
+def _seconds(moment: datetime) -> float:
+    return (moment - _EPOCH).total_seconds()
+
+def _datetime(seconds: float) -> datetime:
+    return _EPOCH + timedelta(seconds=seconds)
+
+# ==================== WATERMARK ====================
+
+def _max_ids(db: Session) -> Dict[str, int]:
+    return {kind: db.query(func.max(model.id)).scalar() or 0 for kind, (model, _, _) in SOURCES.items()}
+
+def _load_state(db: Session, now: datetime) -> DeadlineSchedulerState:
+    state = db.query(DeadlineSchedulerState).filter(DeadlineSchedulerState.name == SCHEDULER_NAME).first()
+    if state is None:
+        # First run: pick up recent history only, not every deadline ever set
+        db.execute(
+            insert(DeadlineSchedulerState.__table__).values(
+                name=SCHEDULER_NAME,
+                fired_through=now - timedelta(hours=DEADLINE_INITIAL_LOOKBACK_HOURS),
+                max_ids=_max_ids(db),
+                updated_at=now
+            ).on_conflict_do_nothing(index_elements=["name"])
+        )
+        db.commit()
+        state = db.query(DeadlineSchedulerState).filter(DeadlineSchedulerState.name == SCHEDULER_NAME).one()
+    return state
+
+# ==================== LOADING ====================
+
+def _schedule_window(db: Session, wheel: TimerWheel, state: DeadlineSchedulerState, end: datetime) -> int:
+    """
+    Schedules the events due in (fired_through, end] and those of rows
+    created since the last load, then moves the row watermark. Returns the
+    number of timers added or moved.
+    """
+    max_ids = dict(state.max_ids or {})
+    latest = _max_ids(db)
+    scheduled = 0
+    for kind, event, offset, condition in EVENTS:
+        model, column, can_fire = SOURCES[kind]
+        query = db.query(model.id, column).filter(
+            can_fire,
+            or_(
+                and_(column > state.fired_through - offset, column <= end - offset),
+                and_(model.id > max_ids.get(kind, 0), model.id <= latest[kind], column <= end - offset)
+            )
+        )
+        if condition is not None:
+            query = query.filter(condition)
+        for ref_id, deadline in query:
+            due = deadline + offset
+            scheduled += wheel.schedule((kind, ref_id, event), _seconds(due), due)
+    state.max_ids = latest
+    return scheduled
+
+def _prune_events(db: Session, state: DeadlineSchedulerState) -> int:
+    """
+    Deletes fired events due more than DEADLINE_EVENT_RETENTION_DAYS before
+    the watermark, a batch per transaction. Events before the watermark are
+    never loaded again, so their claims are no longer needed.
+    """
+    events = DeadlineEvent.__table__
+    cutoff = state.fired_through - timedelta(days=DEADLINE_EVENT_RETENTION_DAYS)
+    pruned = 0
+    while True:
+        batch = select(events.c.id).where(events.c.due_at < cutoff).limit(DEADLINE_PRUNE_BATCH_SIZE)
+        deleted = db.execute(delete(events).where(events.c.id.in_(batch.scalar_subquery()))).rowcount
+        db.commit()
+        pruned += deleted
+        if deleted < DEADLINE_PRUNE_BATCH_SIZE:
+            return pruned
+
+# ==================== FIRING ====================
+
+def _claim(db: Session, expired: List[Tuple[Tuple[str, int, str], datetime]], now: datetime) -> Set[Tuple[str, int, str]]:
+    events = DeadlineEvent.__table__
+    claimed = db.execute(
+        insert(events).values([
+            {"kind": kind, "ref_id": ref_id, "event": event, "due_at": due, "fired_at": now}
+            for (kind, ref_id, event), due in expired
+        ]).on_conflict_do_nothing(
+            index_elements=["kind", "ref_id", "event", "due_at"]
+        ).returning(events.c.kind, events.c.ref_id, events.c.event)
+    )
+    return {tuple(row) for row in claimed}
+
+def _notify(db: Session, notifications: List[Dict[str, Any]], now: datetime):
+    if notifications:
+        db.execute(core_insert(AuditNotification.__table__), [
+            {"read": False, "created_at": now, **notification} for notification in notifications
+        ])
+
+def _fire_workflow_timeouts(db: Session, due: Dict[int, datetime], now: datetime):
+    workflows = db.query(DocumentWorkflow).filter(
+        DocumentWorkflow.id.in_(list(due)),
+        DocumentWorkflow.status == "in_progress",
+        DocumentWorkflow.timeout_at <= now
+    ).with_for_update().all()
+    for workflow in workflows:
+        if workflow.timeout_at != due[workflow.id]:
+            continue  # the step moved on and set a new timeout
+        workflow.status = "timed_out"
+        db.add(WorkflowExecutionHistory(
+            document_workflow_id=workflow.id,
+            step_number=workflow.current_step,
+            action="Timed Out",
+            performed_by=None,
+            performed_at=now,
+            notes=f"Step timed out at {workflow.timeout_at.isoformat()}",
+            status="timed_out"
+        ))
+
+def _fire_requirement_reminders(db: Session, due: Dict[int, datetime], now: datetime,
+                                targets: Dict[int, List[int]], companies: Set[int]):
+    rows = db.query(
+        DocumentRequirement.id,
+        DocumentRequirement.audit_id,
+        DocumentRequirement.document_type,
+        DocumentRequirement.deadline,
+        Audit.company_id
+    ).join(
+        Audit, DocumentRequirement.audit_id == Audit.id
+    ).filter(
+        DocumentRequirement.id.in_(list(due)),
+        DocumentRequirement.deadline > now,
+        ~DocumentRequirement.submissions.any()
+    ).all()
+    rows = [row for row in rows if row.deadline - REMINDER_LEAD == due[row.id]]
+    if not rows:
+        return
+    escalation_targets(db, targets, {row.company_id for row in rows})
+    _notify(db, [
+        {
+            "user_id": user_id,
+            "audit_id": row.audit_id,
+            "notification_type": "deadline_reminder",
+            "title": f"Requirement Due Soon: {row.document_type}",
+            "message": f"No document has been submitted yet; the deadline is {row.deadline:%Y-%m-%d %H:%M} UTC",
+            "priority": NotificationPriority.normal,
+            "data": {"requirement_id": row.id, "deadline": row.deadline.isoformat()},
+        }
+        for row in rows for user_id in targets[row.company_id]
+    ], now)
+    requirements = DocumentRequirement.__table__
+    db.execute(
+        update(requirements).where(requirements.c.id.in_([row.id for row in rows])).values(notification_sent_at=now)
+    )
+    companies.update(row.company_id for row in rows)
+
+def _fire_action_items(db: Session, due: Dict[int, datetime], now: datetime, event: str):
+    overdue = event == OVERDUE
+    rows = db.query(
+        ActionItem.id,
+        ActionItem.assigned_to,
+        ActionItem.description,
+        ActionItem.due_date,
+        AuditFinding.audit_id
+    ).join(
+        AuditFinding, ActionItem.finding_id == AuditFinding.id
+    ).filter(
+        ActionItem.id.in_(list(due)),
+        ActionItem.status.in_(OPEN_ACTION_ITEM_STATUSES),
+        ActionItem.due_date <= now if overdue else ActionItem.due_date > now
+    ).all()
+    offset = timedelta(0) if overdue else REMINDER_LEAD
+    rows = [row for row in rows if row.due_date - offset == due[row.id]]
+    if not rows:
+        return
+    _notify(db, [
+        {
+            "user_id": row.assigned_to,
+            "audit_id": row.audit_id,
+            "notification_type": "action_item_overdue" if overdue else "action_item_reminder",
+            "title": "Action Item Overdue" if overdue else "Action Item Due Soon",
+            "message": f"{row.description[:200]} (due {row.due_date:%Y-%m-%d %H:%M} UTC)",
+            "priority": NotificationPriority.high if overdue else NotificationPriority.normal,
+            "data": {"action_item_id": row.id, "due_date": row.due_date.isoformat()},
+        }
+        for row in rows if row.assigned_to is not None
+    ], now)
+    if overdue:
+        items = ActionItem.__table__
+        db.execute(
+            update(items).where(
+                items.c.id.in_([row.id for row in rows]),
+                items.c.status.in_(OPEN_ACTION_ITEM_STATUSES)
+            ).values(status=ActionItemStatus.overdue)
+        )
+
+def fire(db: Session, expired: List[Tuple[Tuple[str, int, str], datetime]], now: datetime,
+         targets: Dict[int, List[int]], companies: Set[int]) -> Tuple[int, bool]:
+    """
+    Claims and fires a batch of due events; the caller commits. Returns the
+    number of events claimed and whether requirement escalations fell due.
+    """
+    claimed = _claim(db, expired, now)
+    groups: Dict[Tuple[str, str], Dict[int, datetime]] = defaultdict(dict)
+    for key, due in expired:
+        if key in claimed:
+            kind, ref_id, event = key
+            groups[(kind, event)][ref_id] = due
+
+    for (kind, event), due in groups.items():
+        if kind == WORKFLOW:
+            _fire_workflow_timeouts(db, due, now)
+        elif kind == REQUIREMENT and event == REMINDER:
+            _fire_requirement_reminders(db, due, now, targets, companies)
+        elif kind == ACTION_ITEM:
+            _fire_action_items(db, due, now, event)
+    return len(claimed), (REQUIREMENT, ESCALATION) in groups
+
+# ==================== LOOP ====================
+
+def run_once(db: Session, wheel: TimerWheel, state: DeadlineSchedulerState, now: datetime,
+             targets: Dict[int, List[int]]) -> int:
+    """Fires everything due by `now`, then moves the watermark. Returns the number of events fired."""
+    expired = [(key, due) for key, _, due in wheel.advance(_seconds(now))]
+    fired, sweep = 0, False
+    companies: Set[int] = set()
+    for start in range(0, len(expired), DEADLINE_FIRE_BATCH_SIZE):
+        claimed, escalations = fire(db, expired[start:start + DEADLINE_FIRE_BATCH_SIZE], now, targets, companies)
+        fired += claimed
+        sweep = sweep or escalations
+        db.commit()
+    # A crash before this commit reloads the batches above; their claims stop a second firing
+    state.fired_through = max(state.fired_through, _datetime(wheel.time))
+    db.commit()
+
+    # The Core writes above bypass the ORM hooks that would queue this event
+    for company_id in companies:
+        domain_events.emit(domain_events.REQUIREMENT_UPDATED, company_id)
+    if sweep:
+        # Escalations follow the sweeper's rules; firing only makes it run on time
+        sweep_escalations(db, now)
+    return fired
+
+def run():
+    """Runs the scheduler until interrupted."""
+    db = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        state = _load_state(db, now)
+        wheel = TimerWheel(_seconds(now))
+        targets: Dict[int, List[int]] = {}
+        next_load: Optional[datetime] = None
+        while True:
+            now = datetime.utcnow()
+            try:
+                if next_load is None or now >= next_load:
+                    _schedule_window(db, wheel, state, now + timedelta(seconds=DEADLINE_LOAD_WINDOW))
+                    db.commit()
+                    _prune_events(db, state)
+                    targets.clear()  # pick up role changes
+                    next_load = now + timedelta(seconds=DEADLINE_REFRESH_INTERVAL)
+                fired = run_once(db, wheel, state, now, targets)
+                if fired:
+                    logger.info(f"Fired {fired} deadline events")
+            except Exception as e:
+                db.rollback()
+                logger.error(f"Deadline scheduler iteration failed: {e}")
+                next_load = None  # reload the window; claimed events are not fired twice
+            until_load = (next_load - datetime.utcnow()).total_seconds() if next_load else 1.0
+            time.sleep(wheel.next_expiry(max(until_load, wheel.tick)))
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    run()
@@ -36,6 +36,7 @@ from .models import (
     WorkflowExecutionHistory,
     AIModel,
     DocumentAIAnalysis,
+    ExtractionCache,
     DocumentMetadata,
     Annotation,
     RelatedDocument,
@@ -66,11 +67,23 @@ from .models import (
     AuditReport,
     AuditNotification,
     DocumentAuditTrail,
+    CompanyKPI,
+    AuditExportJob,
+    FileBlob,
+    DocumentVersionDelta,
+    SubmissionChainTip,
+    AuditSeal,
+    AuditSealLeaf,
+    AuditSealNode,
+    BulkVerificationRequest,
+    DeadlineSchedulerState,
+    DeadlineEvent,
     AIDocumentValidation,
     MeetingMinutes,
     MeetingFeedback,
     ComplianceCheckpoint,
     RequirementEscalation,
+    EscalationType,
     NotificationPriority,
     ComplianceStatus,
     FindingType,
@@ -111,6 +124,7 @@ __all__ = [
     'MeetingFeedback',
     'ComplianceCheckpoint',
     'RequirementEscalation',
+    'EscalationType',
     'NotificationPriority',
     'ComplianceStatus',
     'FindingType',
@@ -135,6 +149,7 @@ __all__ = [
     'WorkflowExecutionHistory',
     'AIModel',
     'DocumentAIAnalysis',
+    'ExtractionCache',
     'DocumentMetadata',
     'Annotation',
     'RelatedDocument',
@@ -166,6 +181,17 @@ __all__ = [
     'AuditReport',
     'AuditNotification',
     'DocumentAuditTrail',
+    'CompanyKPI',
+    'AuditExportJob',
+    'FileBlob',
+    'DocumentVersionDelta',
+    'SubmissionChainTip',
+    'AuditSeal',
+    'AuditSealLeaf',
+    'AuditSealNode',
+    'BulkVerificationRequest',
+    'DeadlineSchedulerState',
+    'DeadlineEvent',
     
     # Association tables
     'audit_auditor_assignment',
@@ -1,7 +1,7 @@
 from sqlalchemy import (
-    Date,Column, Integer, String, DateTime, ForeignKey, JSON, Text, Boolean, Enum, Float, Table
+    Date,Column, Integer, String, DateTime, ForeignKey, JSON, Text, Boolean, Enum, Float, Table, UniqueConstraint, Index, BigInteger, LargeBinary
 )
-from sqlalchemy.dialects.postgresql import INET,JSONB
+from sqlalchemy.dialects.postgresql import INET,JSONB,TSVECTOR
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 import enum
@@ -305,16 +305,24 @@ class Document(Base):
     title = Column(String, index=True, nullable=False)
     content = Column(JSON, nullable=True)
     raw_content = Column(Text, nullable=True)
+    page_offsets = Column(JSON, nullable=True)  # [{"page", "start", "end"}] character ranges into raw_content
     file_path = Column(String, nullable=False)
     file_type = Column(String, nullable=False)
     file_size = Column(Float, nullable=False)
     hash_sha256 = Column(String(64))
+    search_vector = Column(TSVECTOR, nullable=True)  # maintained by app.utils.document_search
     owner_id = Column(Integer, ForeignKey("users.id"), nullable=True)
     company_id = Column(Integer, ForeignKey("companies.id"), nullable=True)
     is_deleted = Column(Boolean, default=False)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    __table_args__ = (
+        Index("ix_documents_search_vector", "search_vector", postgresql_using="gin"),
+        # Documents still waiting for the search backfill, matched by title meanwhile
+        Index("ix_documents_search_unindexed", "id", postgresql_where=search_vector.is_(None)),
+    )
+    
     owner = relationship("User")
     company = relationship("Company", back_populates="documents")
     versions = relationship("DocumentVersion", back_populates="document")
@@ -333,7 +341,7 @@ class Activity(Base):
     id = Column(Integer, primary_key=True, index=True)
     action = Column(String)
     user_id = Column(Integer, ForeignKey("users.id"))
-    document_id = Column(Integer, ForeignKey("documents.id"))
+    document_id = Column(Integer, ForeignKey("documents.id"), index=True)
     details = Column(JSON)
     created_at = Column(DateTime, default=datetime.utcnow)
 
@@ -373,6 +381,7 @@ class DocumentVersion(Base):
     file_path = Column(String, nullable=True)
 
     document = relationship("Document", back_populates="versions")
+    delta_record = relationship("DocumentVersionDelta", back_populates="version", uselist=False, cascade="all, delete-orphan")
 
 class Comment(Base):
     __tablename__ = "comments"
@@ -425,7 +434,7 @@ class DocumentWorkflow(Base):
     completed_at = Column(DateTime, nullable=True)
     rejected_by = Column(Integer, ForeignKey("users.id"), nullable=True)
     rejected_at = Column(DateTime, nullable=True)
-    timeout_at = Column(DateTime, nullable=True)
+    timeout_at = Column(DateTime, nullable=True, index=True)
 
     document = relationship("Document", back_populates="document_workflows")
     workflow = relationship("Workflow", back_populates="document_workflows")
@@ -473,6 +482,22 @@ class DocumentAIAnalysis(Base):
     document = relationship("Document", back_populates="ai_analyses")
     ai_model = relationship("AIModel", back_populates="document_analyses")
 
+class ExtractionCache(Base):
+    __tablename__ = "extraction_cache"
+    __table_args__ = (UniqueConstraint("hash_sha256", "pipeline_version", name="uq_extraction_cache_hash_version"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    hash_sha256 = Column(String(64), nullable=False, index=True)
+    pipeline_version = Column(String(50), nullable=False)
+    file_type = Column(String)
+    raw_content = Column(Text)
+    page_offsets = Column(JSON)
+    parsed_content = Column(JSON)
+    ai_analysis = Column(JSON)
+    hit_count = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    last_hit_at = Column(DateTime, nullable=True)
+
 class DocumentMetadata(Base):
     __tablename__ = "document_metadata"
 
@@ -727,11 +752,11 @@ class DocumentRequirement(Base):
     __tablename__ = "document_requirements"
     
     id = Column(Integer, primary_key=True)
-    audit_id = Column(Integer, ForeignKey("audits.id"))
+    audit_id = Column(Integer, ForeignKey("audits.id"), index=True)
     document_type = Column(String(255), nullable=False)
     required_fields = Column(JSON)
     validation_rules = Column(JSON)
-    deadline = Column(DateTime)
+    deadline = Column(DateTime, index=True)
     is_mandatory = Column(Boolean, default=True)
     auto_escalate = Column(Boolean, default=False)
     created_by = Column(Integer, ForeignKey("users.id"))
@@ -742,6 +767,13 @@ class DocumentRequirement(Base):
     last_escalated_at = Column(DateTime)
     notification_sent_at = Column(DateTime)
     compliance_framework = Column(String(50))
+    # Deadline order for the escalation sweeper (app.utils.escalation_sweeper)
+    __table_args__ = (
+        Index(
+            "ix_document_requirements_escalation_due", "deadline", "id",
+            postgresql_where=auto_escalate == True
+        ),
+    )
     audit = relationship("Audit", back_populates="requirements")
     submissions = relationship("DocumentSubmission", back_populates="requirement")
     creator = relationship("User")
@@ -749,7 +781,7 @@ class DocumentSubmission(Base):
     __tablename__ = "document_submissions"
     
     id = Column(Integer, primary_key=True)
-    requirement_id = Column(Integer, ForeignKey("document_requirements.id"))
+    requirement_id = Column(Integer, ForeignKey("document_requirements.id"), index=True)
     document_id = Column(Integer, ForeignKey("documents.id"))
     submitted_by = Column(Integer, ForeignKey("users.id"))
     submitted_at = Column(DateTime, default=datetime.utcnow)
@@ -792,7 +824,7 @@ class AuditFinding(Base):
     __tablename__ = "audit_findings"
     
     id = Column(Integer, primary_key=True)
-    audit_id = Column(Integer, ForeignKey("audits.id"))
+    audit_id = Column(Integer, ForeignKey("audits.id"), index=True)
     title = Column(String(255), nullable=False)
     description = Column(Text, nullable=False)
     severity = Column(Enum(FindingSeverity), nullable=False)
@@ -897,7 +929,7 @@ class ActionItem(Base):
     finding_id = Column(Integer, ForeignKey("audit_findings.id"))
     assigned_to = Column(Integer, ForeignKey("users.id"))
     description = Column(Text, nullable=False)
-    due_date = Column(DateTime)
+    due_date = Column(DateTime, index=True)
     status = Column(Enum(ActionItemStatus), default=ActionItemStatus.pending)
     created_at = Column(DateTime, default=datetime.utcnow)
     completed_at = Column(DateTime)
@@ -1214,4 +1246,149 @@ class MeetingFeedback(Base):
     comments = Column(Text)
     submitted_at = Column(DateTime, default=datetime.utcnow)
     
-    user = relationship("User")
\ No newline at end of file
+    user = relationship("User")
+class CompanyKPI(Base):
+    """Per-company dashboard counters, maintained incrementally by app.utils.kpi_store."""
+    __tablename__ = "company_kpis"
+    
+    company_id = Column(Integer, ForeignKey("companies.id"), primary_key=True)
+    metric = Column(String(64), primary_key=True)
+    bucket = Column(String(128), primary_key=True, default="")
+    value = Column(Float, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class AuditExportJob(Base):
+    """Archive export of an audit, built by a worker; see app.utils.audit_archive."""
+    __tablename__ = "audit_export_jobs"
+    
+    id = Column(Integer, primary_key=True)
+    audit_id = Column(Integer, ForeignKey("audits.id"), nullable=False, index=True)
+    company_id = Column(Integer, ForeignKey("companies.id"), nullable=False)
+    requested_by = Column(Integer, ForeignKey("users.id"))
+    status = Column(String(20), default="queued")  # queued, running, completed, failed
+    fingerprint = Column(String(64), nullable=False)  # audit state the archive was built from
+    files_total = Column(Integer, default=0)
+    files_done = Column(Integer, default=0)
+    file_path = Column(String(500))
+    file_size = Column(BigInteger)
+    sha256 = Column(String(64))
+    download_token = Column(String(64), unique=True, index=True)
+    token_expires_at = Column(DateTime)
+    error = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime)
+    completed_at = Column(DateTime)
+    
+    audit = relationship("Audit")
+    requester = relationship("User")
+
+class FileBlob(Base):
+    """Content-addressed stored file, shared by every Document/DocumentVersion with that content; see app.utils.blob_store."""
+    __tablename__ = "file_blobs"
+    
+    sha256 = Column(String(64), primary_key=True)
+    path = Column(String(500), nullable=False)
+    size = Column(BigInteger)
+    ref_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class DocumentVersionDelta(Base):
+    """Version content stored as a line delta against newer content; see app.utils.version_deltas."""
+    __tablename__ = "document_version_deltas"
+    
+    version_id = Column(Integer, ForeignKey("document_versions.id", ondelete="CASCADE"), primary_key=True)
+    document_id = Column(Integer, ForeignKey("documents.id"), nullable=False, index=True)
+    content_sha256 = Column(String(64), nullable=False)  # hash of the reconstructed file
+    base_sha256 = Column(String(64), nullable=False)  # content the delta applies to
+    size = Column(BigInteger)
+    delta = Column(LargeBinary, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    version = relationship("DocumentVersion", back_populates="delta_record")
+
+class SubmissionChainTip(Base):
+    """Last link of a submission's verification or audit-trail hash chain; see app.utils.hash_chain."""
+    __tablename__ = "submission_chain_tips"
+    
+    submission_id = Column(Integer, ForeignKey("document_submissions.id"), primary_key=True)
+    chain = Column(String(20), primary_key=True)  # verification, trail
+    tip_hash = Column(String(64), nullable=False)
+    length = Column(Integer, nullable=False, default=0)
+    legacy_length = Column(Integer)  # links written before canonical hashing; None until seeded
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class AuditSeal(Base):
+    """Merkle root over an audit's evidence, verification blocks and findings; see app.utils.audit_seal."""
+    __tablename__ = "audit_seals"
+    
+    audit_id = Column(Integer, ForeignKey("audits.id"), primary_key=True)
+    root_hash = Column(String(64), nullable=False)
+    leaf_count = Column(Integer, nullable=False, default=0)
+    frontier = Column(JSON, nullable=False, default=list)  # roots of the perfect subtrees, largest first
+    sealed_by = Column(Integer, ForeignKey("users.id"))
+    sealed_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    audit = relationship("Audit")
+
+class AuditSealLeaf(Base):
+    __tablename__ = "audit_seal_leaves"
+    __table_args__ = (
+        UniqueConstraint("audit_id", "kind", "ref_id", name="uq_audit_seal_leaf_record"),
+    )
+    
+    audit_id = Column(Integer, ForeignKey("audits.id"), primary_key=True)
+    position = Column(Integer, primary_key=True)
+    kind = Column(String(20), nullable=False)  # evidence, verification, finding
+    ref_id = Column(Integer, nullable=False)  # submission, chain block or finding id
+    document_id = Column(Integer, ForeignKey("documents.id"), index=True)
+    leaf_hash = Column(String(64), nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class AuditSealNode(Base):
+    """Interior node of an audit seal tree: the root of leaves [position * 2**level, (position + 1) * 2**level)."""
+    __tablename__ = "audit_seal_nodes"
+    
+    audit_id = Column(Integer, ForeignKey("audits.id"), primary_key=True)
+    level = Column(Integer, primary_key=True)
+    position = Column(Integer, primary_key=True)
+    hash = Column(String(64), nullable=False)
+
+class BulkVerificationRequest(Base):
+    """Stored outcome of an idempotent bulk verification call; see app.utils.bulk_verification."""
+    __tablename__ = "bulk_verification_requests"
+    __table_args__ = (
+        UniqueConstraint("company_id", "idempotency_key", name="uq_bulk_verification_idempotency_key"),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    company_id = Column(Integer, ForeignKey("companies.id"), nullable=False)
+    requested_by = Column(Integer, ForeignKey("users.id"))
+    idempotency_key = Column(String(255), nullable=False)
+    request_hash = Column(String(64), nullable=False)  # same key with a different request is rejected
+    response = Column(JSON)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class DeadlineSchedulerState(Base):
+    """Progress of app.deadline_scheduler, so a restart resumes from its watermark instead of rescanning."""
+    __tablename__ = "deadline_scheduler_state"
+    
+    name = Column(String(50), primary_key=True)
+    fired_through = Column(DateTime, nullable=False)  # every deadline event due up to here has fired
+    max_ids = Column(JSON)  # highest row id already loaded, per deadline source
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class DeadlineEvent(Base):
+    """A fired deadline event; the unique key keeps a restarted or second scheduler from firing it again."""
+    __tablename__ = "deadline_events"
+    __table_args__ = (
+        UniqueConstraint("kind", "ref_id", "event", "due_at", name="uq_deadline_event"),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    kind = Column(String(20), nullable=False)  # workflow, requirement, action_item
+    ref_id = Column(Integer, nullable=False)
+    event = Column(String(20), nullable=False)  # timeout, reminder, escalation, overdue
+    due_at = Column(DateTime, nullable=False, index=True)  # pruned by due date
+    fired_at = Column(DateTime, default=datetime.utcnow)
@@ -7,11 +7,13 @@ import json
 import logging
 from typing import List, Dict, Any, Optional
 from datetime import datetime
-from groq import Groq
 from sqlalchemy.orm import Session
 
 from app.models import *
 from app.tasks import parse_content_with_genai
+from app.utils.pdf_extraction import find_page
+from app.utils.llm_batching import run_batched
+from app.utils.llm_client import llm_client
 
 # Configure logging
 logging.basicConfig(
@@ -20,9 +22,48 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Initialize Groq client
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-groq_client = Groq(api_key=GROQ_API_KEY) if GROQ_API_KEY else None
+FINDINGS_SYSTEM_PROMPT = "You are a senior financial auditor with expertise in identifying audit findings. You are conservative and only identify material, well-supported findings."
+
+FINDINGS_INSTRUCTIONS = """
+            INSTRUCTIONS:
+            Analyze this document and identify 1-3 potential audit findings. Focus ONLY on:
+            1. Compliance violations or gaps
+            2. Control deficiencies 
+            3. Financial misstatements or irregularities
+            4. Documentation issues that could impact audit conclusions
+            5. Process inefficiencies that create audit risk
+            
+            Be STRICT and CONSERVATIVE - only identify findings that are:
+            - Clearly evident in the document
+            - Relevant to the audit type and compliance frameworks
+            - Material or significant enough to warrant attention
+            - Specific and actionable
+            
+            Report at most 3 findings, each as a JSON object with:
+            {
+                "title": "Specific, clear title (max 100 chars)",
+                "description": "Detailed description of what was found and why it's concerning (max 500 chars)",
+                "finding_type": "compliance|control_deficiency|documentation_issue|process_inefficiency|risk_exposure|financial_misstatement",
+                "severity": "critical|major|minor|informational",
+                "confidence_score": 0.0-1.0,
+                "evidence_reference": "Specific reference to document section/page/line",
+                "evidence_quote": "Short verbatim excerpt from the document that supports the finding",
+                "impact_assessment": "Brief impact description (max 200 chars)",
+                "recommendation": "Specific actionable recommendation (max 300 chars)"
+            }
+"""
+
+# The response contract differs: one document gets a bare array, a batch one
+# object of arrays keyed by document id (see llm_batching.build_batch_prompt)
+FINDINGS_SINGLE_FORMAT = """
+            Return a JSON array of the findings. If no significant findings are identified, return an empty array [].
+            
+            IMPORTANT: Return ONLY the JSON array, no other text or formatting.
+"""
+
+FINDINGS_BATCH_FORMAT = """
+            For each document, the value under its id is a JSON array of its findings, or an empty array [] if no significant findings are identified.
+"""
 
 class AIFindingGenerator:
     def __init__(self, db: Session):
@@ -41,148 +82,226 @@ class AIFindingGenerator:
         """
         logger.info(f"Starting finding generation for document {document_id}, audit {audit_id}, submission {document_submission_id}")
         
-        if not groq_client:
+        if not llm_client.is_configured("groq"):
             logger.error("Groq API key not configured")
             return []
             
         try:
-            # Get document and its content
-            document = self.db.query(Document).filter(Document.id == document_id).first()
-            if not document:
-                logger.warning(f"Document {document_id} not found")
-                return []
-            
-            logger.info(f"Retrieved document: {document.title} (ID: {document.id})")
-            
-            # Get audit context
-            audit = self.db.query(Audit).filter(Audit.id == audit_id).first()
-            if not audit:
-                logger.warning(f"Audit {audit_id} not found")
-                return []
-            
-            logger.info(f"Retrieved audit: {audit.name} (ID: {audit.id})")
-            
-            # Get document requirement context
-            doc_submission = self.db.query(DocumentSubmission).filter(
-                DocumentSubmission.id == document_submission_id
-            ).first()
-            
-            requirement_context = ""
-            if doc_submission and doc_submission.requirement:
-                requirement_context = f"Document Type: {doc_submission.requirement.document_type}\n"
-                requirement_context += f"Compliance Framework: {doc_submission.requirement.compliance_framework}\n"
-                logger.info(f"Retrieved requirement context: {requirement_context.strip()}")
-            
-            # Parse document content if not already parsed
-            document_content = ""
-            if document.content:
-                logger.info("Document has existing content, attempting to parse")
-                try:
-                    content_data = json.loads(document.content) if isinstance(document.content, str) else document.content
-                    document_content = str(content_data)
-                    logger.info("Successfully parsed document content")
-                except Exception as e:
-                    document_content = str(document.content)
-                    logger.warning(f"Failed to parse document content as JSON, using string representation: {str(e)}")
-            elif document.raw_content:
-                logger.info("Using raw document content")
-                document_content = document.raw_content
-            else:
-                logger.info("No parsed content found, attempting to parse document")
-                try:
-                    from app.tasks import process_pdf, process_excel, process_csv, process_image
-                    
-                    if document.file_type.lower() == 'pdf':
-                        logger.info(f"Processing PDF document: {document.file_path}")
-                        process_pdf(document.file_path, document.id)
-                    elif document.file_type.lower() in ['xlsx', 'xls']:
-                        logger.info(f"Processing Excel document: {document.file_path}")
-                        process_excel(document.file_path, document.id)
-                    elif document.file_type.lower() == 'csv':
-                        logger.info(f"Processing CSV document: {document.file_path}")
-                        process_csv(document.file_path, document.id)
-                    elif document.file_type.lower() in ['png', 'jpg', 'jpeg']:
-                        logger.info(f"Processing image document: {document.file_path}")
-                        process_image(document.file_path, document.id)
-                    else:
-                        logger.warning(f"Unsupported file type: {document.file_type}")
-                    
-                    # Refresh document to get parsed content
-                    self.db.refresh(document)
-                    document_content = document.raw_content or str(document.content) if document.content else ""
-                    logger.info(f"Document processed, content length: {len(document_content)} characters")
-                except Exception as e:
-                    logger.error(f"Error parsing document: {str(e)}")
-                    document_content = f"Document: {document.title} (Content parsing failed)"
-            
-            if not document_content or len(document_content.strip()) < 50:
-                logger.warning(f"Insufficient content for finding generation: {len(document_content)} chars")
+            context = self._prepare_document_context(document_id, audit_id, document_submission_id)
+            if not context:
                 return []
             
-            logger.info(f"Document content prepared, length: {len(document_content)} characters")
-            
             # Generate findings using Groq
             findings = await self._generate_findings_with_groq(
-                document_content=document_content,
-                audit_context=audit,
-                requirement_context=requirement_context,
-                document_title=document.title,
-                document_type=document.file_type
+                document_content=context["document_content"],
+                audit_context=context["audit"],
+                requirement_context=context["requirement_context"],
+                document_title=context["document"].title,
+                document_type=context["document"].file_type
             )
             
             logger.info(f"Received {len(findings)} potential findings from Groq API")
-            
-            # Create findings in database
-            created_findings = []
-            for finding_data in findings:
-                try:
-                    created_finding = await self._create_ai_finding(
-                        finding_data=finding_data,
-                        audit_id=audit_id,
-                        document_submission_id=document_submission_id,
-                        current_user=current_user
-                    )
-                    if created_finding:
-                        created_findings.append(created_finding)
-                        logger.info(f"Created finding: {created_finding['title']} (ID: {created_finding['id']})")
-                except Exception as e:
-                    logger.error(f"Error creating finding: {str(e)}")
-                    continue
-            
-            logger.info(f"Successfully created {len(created_findings)} findings in database")
-            return created_findings
+            return await self._save_findings(findings, context["document"], audit_id, document_submission_id, current_user)
             
         except Exception as e:
             logger.error(f"Error in generate_findings_from_document: {str(e)}", exc_info=True)
             return []
     
-    async def _generate_findings_with_groq(
+    async def generate_findings_for_documents(self, requests: List[Dict[str, Any]]) -> Dict[int, List[Dict[str, Any]]]:
+        """
+        Generate findings for many submissions with batched Groq calls.
+        Each request holds document_id, audit_id, document_submission_id and current_user.
+        Submissions of the same audit share one prompt header and are packed
+        several per call; anything the batched response misses is retried alone.
+        Returns the created findings keyed by document_submission_id.
+        """
+        logger.info(f"Starting batched finding generation for {len(requests)} submissions")
+        
+        if not llm_client.is_configured("groq"):
+            logger.error("Groq API key not configured")
+            return {}
+        
+        contexts = {}
+        for request in requests:
+            try:
+                context = self._prepare_document_context(
+                    request["document_id"], request["audit_id"], request["document_submission_id"]
+                )
+            except Exception as e:
+                logger.error(f"Error preparing submission {request['document_submission_id']}: {str(e)}", exc_info=True)
+                context = None
+            if context:
+                contexts[request["document_submission_id"]] = {**context, **request}
+        
+        created = {request["document_submission_id"]: [] for request in requests}
+        for audit_id in {context["audit_id"] for context in contexts.values()}:
+            group = {key: context for key, context in contexts.items() if context["audit_id"] == audit_id}
+            audit = next(iter(group.values()))["audit"]
+            
+            async def single_call(item, group=group):
+                context = group[item["key"]]
+                return await self._generate_findings_with_groq(
+                    document_content=context["document_content"],
+                    audit_context=context["audit"],
+                    requirement_context=context["requirement_context"],
+                    document_title=context["document"].title,
+                    document_type=context["document"].file_type
+                )
+            
+            findings_by_submission = await run_batched(
+                [
+                    {"key": key, "content": self._document_section(
+                        context["requirement_context"], context["document"].title,
+                        context["document"].file_type, context["document_content"]
+                    )}
+                    for key, context in group.items()
+                ],
+                self._audit_section(audit) + FINDINGS_INSTRUCTIONS + FINDINGS_BATCH_FORMAT,
+                self._call_groq_batch,
+                single_call
+            )
+            
+            for key, findings in findings_by_submission.items():
+                context = group[key]
+                # Batched results are raw JSON and still need validation; single-call results already are
+                findings = self._validate_findings(findings)
+                created[key] = await self._save_findings(
+                    findings, context["document"], context["audit_id"], key, context["current_user"]
+                )
+        
+        logger.info(f"Batched finding generation created {sum(len(f) for f in created.values())} findings")
+        return created
+    
+    def _prepare_document_context(
         self,
-        document_content: str,
-        audit_context: Audit,
-        requirement_context: str,
-        document_title: str,
-        document_type: str
+        document_id: int,
+        audit_id: int,
+        document_submission_id: int
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Load the document, audit and requirement context for finding generation,
+        extracting the document first if it was never processed
+        """
+        # Get document and its content
+        document = self.db.query(Document).filter(Document.id == document_id).first()
+        if not document:
+            logger.warning(f"Document {document_id} not found")
+            return None
+        
+        logger.info(f"Retrieved document: {document.title} (ID: {document.id})")
+        
+        # Get audit context
+        audit = self.db.query(Audit).filter(Audit.id == audit_id).first()
+        if not audit:
+            logger.warning(f"Audit {audit_id} not found")
+            return None
+        
+        logger.info(f"Retrieved audit: {audit.name} (ID: {audit.id})")
+        
+        # Get document requirement context
+        doc_submission = self.db.query(DocumentSubmission).filter(
+            DocumentSubmission.id == document_submission_id
+        ).first()
+        
+        requirement_context = ""
+        if doc_submission and doc_submission.requirement:
+            requirement_context = f"Document Type: {doc_submission.requirement.document_type}\n"
+            requirement_context += f"Compliance Framework: {doc_submission.requirement.compliance_framework}\n"
+            logger.info(f"Retrieved requirement context: {requirement_context.strip()}")
+        
+        # Parse document content if not already parsed
+        document_content = ""
+        if document.content:
+            logger.info("Document has existing content, attempting to parse")
+            try:
+                content_data = json.loads(document.content) if isinstance(document.content, str) else document.content
+                document_content = str(content_data)
+                logger.info("Successfully parsed document content")
+            except Exception as e:
+                document_content = str(document.content)
+                logger.warning(f"Failed to parse document content as JSON, using string representation: {str(e)}")
+        elif document.raw_content:
+            logger.info("Using raw document content")
+            document_content = document.raw_content
+        else:
+            logger.info("No parsed content found, attempting to parse document")
+            try:
+                from app.tasks import process_document
+                
+                logger.info(f"Processing {document.file_type} document: {document.file_path}")
+                if process_document(document.file_path, document.id, document.file_type) is None:
+                    logger.warning(f"Unsupported file type: {document.file_type}")
+                
+                # Refresh document to get parsed content
+                self.db.refresh(document)
+                document_content = document.raw_content or str(document.content) if document.content else ""
+                logger.info(f"Document processed, content length: {len(document_content)} characters")
+            except Exception as e:
+                logger.error(f"Error parsing document: {str(e)}")
+                document_content = f"Document: {document.title} (Content parsing failed)"
+        
+        if not document_content or len(document_content.strip()) < 50:
+            logger.warning(f"Insufficient content for finding generation: {len(document_content)} chars")
+            return None
+        
+        logger.info(f"Document content prepared, length: {len(document_content)} characters")
+        return {
+            "document": document,
+            "audit": audit,
+            "requirement_context": requirement_context,
+            "document_content": document_content
+        }
+    
+    async def _save_findings(
+        self,
+        findings: List[Dict[str, Any]],
+        document: Document,
+        audit_id: int,
+        document_submission_id: int,
+        current_user: User
     ) -> List[Dict[str, Any]]:
         """
-        Use Groq API to generate audit findings from document content
+        Create findings in database
         """
-        logger.info("Starting Groq API finding generation")
+        created_findings = []
+        for finding_data in findings:
+            try:
+                # Resolve the cited excerpt to a page using the stored extraction offsets
+                finding_data["document_page"] = find_page(
+                    document.raw_content, document.page_offsets, finding_data.get("evidence_quote")
+                )
+                created_finding = await self._create_ai_finding(
+                    finding_data=finding_data,
+                    audit_id=audit_id,
+                    document_submission_id=document_submission_id,
+                    current_user=current_user
+                )
+                if created_finding:
+                    created_findings.append(created_finding)
+                    logger.info(f"Created finding: {created_finding['title']} (ID: {created_finding['id']})")
+            except Exception as e:
+                logger.error(f"Error creating finding: {str(e)}")
+                continue
         
-        try:
-            # Format materiality threshold safely
-            materiality_threshold = "$0"
-            if audit_context.materiality_threshold is not None:
-                try:
-                    materiality_threshold = f"${audit_context.materiality_threshold:,.2f}"
-                except (TypeError, ValueError) as e:
-                    logger.warning(f"Error formatting materiality threshold: {str(e)}")
-                    materiality_threshold = "$0"
-            
-            logger.info(f"Formatted materiality threshold: {materiality_threshold}")
-
-            # Create a focused prompt for audit finding generation
-            prompt = f"""
+        logger.info(f"Successfully created {len(created_findings)} findings in database")
+        return created_findings
+    
+    def _audit_section(self, audit_context: Audit) -> str:
+        """
+        Audit context block shared by every document of the same audit
+        """
+        # Format materiality threshold safely
+        materiality_threshold = "$0"
+        if audit_context.materiality_threshold is not None:
+            try:
+                materiality_threshold = f"${audit_context.materiality_threshold:,.2f}"
+            except (TypeError, ValueError) as e:
+                logger.warning(f"Error formatting materiality threshold: {str(e)}")
+                materiality_threshold = "$0"
+        
+        logger.info(f"Formatted materiality threshold: {materiality_threshold}")
+        
+        return f"""
             You are a senior financial auditor analyzing a document for potential audit findings. 
             
             AUDIT CONTEXT:
@@ -191,7 +310,13 @@ class AIFindingGenerator:
             - Industry: {audit_context.industry_type.value if audit_context.industry_type else 'general'}
             - Materiality Threshold: {materiality_threshold}
             - Compliance Frameworks: {', '.join(audit_context.compliance_frameworks) if audit_context.compliance_frameworks else 'General'}
-            
+            """
+    
+    def _document_section(self, requirement_context: str, document_title: str, document_type: str, document_content: str) -> str:
+        """
+        Per-document context block
+        """
+        return f"""
             DOCUMENT CONTEXT:
             {requirement_context}
             - Document Title: {document_title}
@@ -199,44 +324,50 @@ class AIFindingGenerator:
             
             DOCUMENT CONTENT:
             {document_content[:4000]}  # Limit content to avoid token limits
-            
-            INSTRUCTIONS:
-            Analyze this document and identify 1-3 potential audit findings. Focus ONLY on:
-            1. Compliance violations or gaps
-            2. Control deficiencies 
-            3. Financial misstatements or irregularities
-            4. Documentation issues that could impact audit conclusions
-            5. Process inefficiencies that create audit risk
-            
-            Be STRICT and CONSERVATIVE - only identify findings that are:
-            - Clearly evident in the document
-            - Relevant to the audit type and compliance frameworks
-            - Material or significant enough to warrant attention
-            - Specific and actionable
-            
-            Return a JSON array with 1-3 findings maximum. Each finding must have:
-            {{
-                "title": "Specific, clear title (max 100 chars)",
-                "description": "Detailed description of what was found and why it's concerning (max 500 chars)",
-                "finding_type": "compliance|control_deficiency|documentation_issue|process_inefficiency|risk_exposure|financial_misstatement",
-                "severity": "critical|major|minor|informational",
-                "confidence_score": 0.0-1.0,
-                "evidence_reference": "Specific reference to document section/page/line",
-                "impact_assessment": "Brief impact description (max 200 chars)",
-                "recommendation": "Specific actionable recommendation (max 300 chars)"
-            }}
-            
-            If no significant findings are identified, return an empty array [].
-            
-            IMPORTANT: Return ONLY the JSON array, no other text or formatting.
             """
+    
+    async def _call_groq_batch(self, prompt: str) -> str:
+        """
+        Send a multi-document prompt to Groq and return the raw JSON text
+        """
+        return await llm_client.complete(
+            "groq",
+            prompt,
+            system=FINDINGS_SYSTEM_PROMPT,
+            model="llama-3.3-70b-versatile",
+            temperature=0.1,
+            max_tokens=8000,
+            json_mode=True
+        )
+    
+    async def _generate_findings_with_groq(
+        self,
+        document_content: str,
+        audit_context: Audit,
+        requirement_context: str,
+        document_title: str,
+        document_type: str
+    ) -> List[Dict[str, Any]]:
+        """
+        Use Groq API to generate audit findings from document content
+        """
+        logger.info("Starting Groq API finding generation")
+        
+        try:
+            # Create a focused prompt for audit finding generation
+            prompt = (
+                self._audit_section(audit_context) +
+                self._document_section(requirement_context, document_title, document_type, document_content) +
+                FINDINGS_INSTRUCTIONS +
+                FINDINGS_SINGLE_FORMAT
+            )
             
             logger.info("Constructed prompt for Groq API")
             
             messages = [
                 {
                     "role": "system",
-                    "content": "You are a senior financial auditor with expertise in identifying audit findings. You are conservative and only identify material, well-supported findings."
+                    "content": FINDINGS_SYSTEM_PROMPT
                 },
                 {
                     "role": "user", 
@@ -245,49 +376,21 @@ class AIFindingGenerator:
             ]
             
             logger.info("Sending request to Groq API")
-            response = groq_client.chat.completions.create(
-                messages=messages,
+            response_content = await llm_client.chat(
+                "groq",
+                messages,
                 model="llama-3.3-70b-versatile",
                 temperature=0.1,  # Low temperature for consistency
                 max_tokens=2000,
-                response_format={"type": "json_object"}
+                json_mode=True
             )
-            
-            response_content = response.choices[0].message.content
             logger.info(f"Received response from Groq API: {response_content}")
             
             # Parse the response
             try:
                 findings_data = json.loads(response_content)
                 logger.info("Successfully parsed Groq response as JSON")
-                
-                # Handle different response formats
-                if isinstance(findings_data, dict):
-                    if "findings" in findings_data:
-                        findings_list = findings_data["findings"]
-                        logger.info("Found findings in 'findings' key")
-                    elif "audit_findings" in findings_data:
-                        findings_list = findings_data["audit_findings"]
-                        logger.info("Found findings in 'audit_findings' key")
-                    else:
-                        # Assume the dict itself is a single finding
-                        findings_list = [findings_data]
-                        logger.info("Assuming entire response is a single finding")
-                else:
-                    findings_list = findings_data
-                    logger.info("Response is already a list of findings")
-                
-                # Validate and clean findings
-                validated_findings = []
-                for finding in findings_list[:3]:  # Max 3 findings
-                    if self._validate_finding(finding):
-                        validated_findings.append(finding)
-                        logger.info(f"Validated finding: {finding.get('title', 'Untitled')}")
-                    else:
-                        logger.warning(f"Invalid finding discarded: {finding}")
-                
-                logger.info(f"Generated {len(validated_findings)} validated findings")
-                return validated_findings
+                return self._validate_findings(findings_data)
                 
             except json.JSONDecodeError as e:
                 logger.error(f"Failed to parse Groq response as JSON: {str(e)}")
@@ -297,6 +400,38 @@ class AIFindingGenerator:
             logger.error(f"Error calling Groq API: {str(e)}", exc_info=True)
             return []
     
+    def _validate_findings(self, findings_data: Any) -> List[Dict[str, Any]]:
+        """
+        Normalise a parsed Groq response into a list of validated findings
+        """
+        # Handle different response formats
+        if isinstance(findings_data, dict):
+            if "findings" in findings_data:
+                findings_list = findings_data["findings"]
+                logger.info("Found findings in 'findings' key")
+            elif "audit_findings" in findings_data:
+                findings_list = findings_data["audit_findings"]
+                logger.info("Found findings in 'audit_findings' key")
+            else:
+                # Assume the dict itself is a single finding
+                findings_list = [findings_data]
+                logger.info("Assuming entire response is a single finding")
+        else:
+            findings_list = findings_data
+            logger.info("Response is already a list of findings")
+        
+        # Validate and clean findings
+        validated_findings = []
+        for finding in findings_list[:3]:  # Max 3 findings
+            if isinstance(finding, dict) and self._validate_finding(finding):
+                validated_findings.append(finding)
+                logger.info(f"Validated finding: {finding.get('title', 'Untitled')}")
+            else:
+                logger.warning(f"Invalid finding discarded: {finding}")
+        
+        logger.info(f"Generated {len(validated_findings)} validated findings")
+        return validated_findings
+    
     def _validate_finding(self, finding: Dict[str, Any]) -> bool:
         """
         Validate that a finding has all required fields and reasonable values
@@ -383,7 +518,11 @@ class AIFindingGenerator:
                 ai_recommendations=[finding_data.get("recommendation", "Review and address")],
                 priority_level=self._map_severity_to_priority(finding_data["severity"]),
                 impact_assessment=finding_data.get("impact_assessment", ""),
-                evidence={"evidence_reference": finding_data.get("evidence_reference", "")},
+                evidence={
+                    "evidence_reference": finding_data.get("evidence_reference", ""),
+                    "evidence_quote": finding_data.get("evidence_quote", "")
+                },
+                document_page=finding_data.get("document_page"),
                 created_by=current_user.id,
                 created_at=datetime.utcnow()
             )
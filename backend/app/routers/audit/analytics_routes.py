@@ -11,6 +11,10 @@ from typing import Optional
 from app.database import get_db
 from app.routers.auth import get_current_user
 from app.models import *
+from app.utils.domain_events import (
+    SUBMISSION_CREATED, SUBMISSION_UPDATED, VERIFICATION_RECORDED, FINDING_UPDATED, AUDIT_UPDATED, REQUIREMENT_UPDATED
+)
+from app.utils.response_cache import cached_endpoint
 
 analytics_router = APIRouter(prefix="/api/audits", tags=["audit-analytics"])
 
@@ -87,6 +91,10 @@ async def get_auditor_performance(
     return {"auditors": performance_data}
 
 @analytics_router.get("/analytics/compliance")
+@cached_endpoint(
+    "analytics.compliance",
+    invalidate_on=(SUBMISSION_CREATED, SUBMISSION_UPDATED, VERIFICATION_RECORDED, FINDING_UPDATED, AUDIT_UPDATED, REQUIREMENT_UPDATED)
+)
 async def get_compliance_status(
     timeframe: str = Query("6months"),
     db: Session = Depends(get_db),
@@ -12,6 +12,7 @@ import uuid
 from app.database import get_db
 from app.routers.auth import get_current_user
 from app.models import *
+from app.utils.pagination import PaginationMode, keyset_page, cached_count
 from .models import AuditorInviteRequest
 from .services import invite_auditor_with_credentials,send_auditor_invitation_email
 auditors_router = APIRouter(prefix="/api/auditors", tags=["auditors"])
@@ -22,6 +23,9 @@ async def get_auditors(
     status: Optional[str] = Query("all"),
     page: int = Query(1, ge=1),
     limit: int = Query(20, ge=1, le=100),
+    pagination: PaginationMode = Query("offset"),
+    cursor: Optional[str] = Query(None),
+    include_total: bool = Query(True),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
@@ -49,12 +53,20 @@ async def get_auditors(
         elif status == "inactive":
             query = query.filter(User.availability_status != "available")
     
-    # Get total count
-    total = query.count()
-    
-    # Apply pagination
-    offset = (page - 1) * limit
-    auditors = query.offset(offset).limit(limit).all()
+    use_cursor = pagination == "cursor" or cursor is not None
+    next_cursor = None
+    if use_cursor:
+        total = cached_count(query, ("auditors", search, status)) if include_total else None
+        result = keyset_page(query, User.id, cursor, limit)
+        auditors = result["items"]
+        next_cursor = result["next_cursor"]
+    else:
+        # Get total count
+        total = query.count()
+        
+        # Apply pagination
+        offset = (page - 1) * limit
+        auditors = query.offset(offset).limit(limit).all()
     print('Auditors fetched:', auditors)
     # Build auditor list with additional data
     auditor_list = []
@@ -107,6 +119,17 @@ async def get_auditors(
             "certifications": auditor.certifications or []
         })
     
+    if use_cursor:
+        return {
+            "auditors": auditor_list,
+            "pagination": {
+                "limit": limit,
+                "total": total,
+                "next_cursor": next_cursor,
+                "has_more": next_cursor is not None
+            }
+        }
+    
     return {
         "auditors": auditor_list,
         "pagination": {
@@ -12,10 +12,17 @@ import calendar
 from app.database import get_db
 from app.routers.auth import get_current_user
 from app.models import *
+from app.utils.domain_events import (
+    SUBMISSION_CREATED, SUBMISSION_UPDATED, VERIFICATION_RECORDED, FINDING_UPDATED, AUDIT_UPDATED, REQUIREMENT_UPDATED
+)
+from app.utils.response_cache import cached_endpoint
+
+COMPLIANCE_EVENTS = (SUBMISSION_CREATED, SUBMISSION_UPDATED, VERIFICATION_RECORDED, FINDING_UPDATED, AUDIT_UPDATED, REQUIREMENT_UPDATED)
 
 compliance_router = APIRouter(prefix="/api/compliance", tags=["compliance"])
 
 @compliance_router.get("/company-status")
+@cached_endpoint("compliance.company_status", invalidate_on=COMPLIANCE_EVENTS)
 async def get_company_compliance_status(
     timeframe: str = Query("6months", regex="^(3months|6months|12months)$"),
     db: Session = Depends(get_db),
@@ -513,6 +520,7 @@ async def generate_compliance_report(
     return report
 
 @compliance_router.get("/dashboard-metrics")
+@cached_endpoint("compliance.dashboard_metrics", invalidate_on=COMPLIANCE_EVENTS)
 async def get_compliance_dashboard_metrics(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
@@ -6,12 +6,14 @@ from typing import List, Dict, Any
 from app.database import get_db
 from app.models import *
 from app.routers.auth import get_current_user
+from app.utils.kpi_store import load_company_kpis
 from sqlalchemy.dialects.postgresql import JSONB # Import JSONB
 
 router = APIRouter()
 
 @router.get("/auditee/dashboard", response_model=Dict[str, Any])
 async def get_auditee_dashboard_data(
+  refresh_kpis: bool = False,
   current_user: User = Depends(get_current_user),
   db: Session = Depends(get_db)
 ):
@@ -30,17 +32,17 @@ async def get_auditee_dashboard_data(
 
   twelve_months_ago = datetime.utcnow() - timedelta(days=365)
 
+  twelve_months_ago_month = twelve_months_ago.strftime('%Y-%m')
+
+  # Counters over audits, requirements, submissions, findings and documents
+  # are maintained on write (app.utils.kpi_store) and loaded in one read
+  counters = load_company_kpis(db, company_id, rebuild=refresh_kpis)
+
   # I. Dashboard Overview & Key Performance Indicators (KPIs)
-  total_audits = db.query(Audit).filter(Audit.company_id == company_id).count()
-  active_audits = db.query(Audit).filter(
-      Audit.company_id == company_id,
-      Audit.status.in_([AuditStatus.planned, AuditStatus.in_progress])
-  ).count()
+  total_audits = counters.count("audits_total")
+  active_audits = counters.count("audits_status", AuditStatus.planned.value) + counters.count("audits_status", AuditStatus.in_progress.value)
 
-  pending_submissions_count = db.query(DocumentSubmission).join(DocumentRequirement).join(Audit).filter(
-      Audit.company_id == company_id,
-      DocumentSubmission.verification_status.in_([EvidenceStatus.pending, EvidenceStatus.needs_revision])
-  ).count()
+  pending_submissions_count = counters.count("submissions_status", EvidenceStatus.pending.value) + counters.count("submissions_status", EvidenceStatus.needs_revision.value)
 
   overdue_action_items_count = db.query(ActionItem).join(AuditFinding).join(Audit).filter(
       Audit.company_id == company_id,
@@ -48,45 +50,19 @@ async def get_auditee_dashboard_data(
       ActionItem.status != ActionItemStatus.completed
   ).count()
 
-  total_mandatory_requirements = db.query(DocumentRequirement).join(Audit).filter(
-      Audit.company_id == company_id,
-      DocumentRequirement.is_mandatory == True
-  ).count()
-  approved_submissions_count = db.query(DocumentSubmission).join(DocumentRequirement).join(Audit).filter(
-      Audit.company_id == company_id,
-      DocumentSubmission.verification_status == EvidenceStatus.approved
-  ).count()
+  total_mandatory_requirements = counters.count("requirements_mandatory")
+  approved_submissions_count = counters.count("submissions_status", EvidenceStatus.approved.value)
   compliance_score = (approved_submissions_count / total_mandatory_requirements * 100) if total_mandatory_requirements > 0 else 0
 
-  total_submissions_attempted = db.query(DocumentSubmission).join(DocumentRequirement).join(Audit).filter(
-      Audit.company_id == company_id
-  ).count()
-  first_pass_approved_submissions = db.query(DocumentSubmission).join(DocumentRequirement).join(Audit).filter(
-      Audit.company_id == company_id,
-      DocumentSubmission.revision_round == 1,
-      DocumentSubmission.verification_status == EvidenceStatus.approved
-  ).count()
+  total_submissions_attempted = counters.count("submissions_total")
+  first_pass_approved_submissions = counters.count("submissions_first_pass_approved")
   avg_document_approval_rate_first_pass = (first_pass_approved_submissions / total_submissions_attempted * 100) if total_submissions_attempted > 0 else 0
 
-  avg_audit_duration_days_result = db.query(
-      func.avg(func.extract('day', Audit.end_date - Audit.start_date))
-  ).filter(
-      Audit.company_id == company_id,
-      Audit.status == AuditStatus.completed,
-      Audit.start_date.isnot(None),
-      Audit.end_date.isnot(None)
-  ).scalar()
+  avg_audit_duration_days_result = counters.average("audits_duration_days")
   avg_audit_duration = round(avg_audit_duration_days_result, 2) if avg_audit_duration_days_result else 0
 
-  total_completed_audits = db.query(Audit).filter(
-      Audit.company_id == company_id,
-      Audit.status == AuditStatus.completed
-  ).count()
-  on_time_completed_audits = db.query(Audit).filter(
-      Audit.company_id == company_id,
-      Audit.status == AuditStatus.completed,
-      Audit.end_date <= Audit.deadline
-  ).count()
+  total_completed_audits = counters.count("audits_status", AuditStatus.completed.value)
+  on_time_completed_audits = counters.count("audits_completed_on_time")
   avg_audit_completion_rate = (on_time_completed_audits / total_completed_audits * 100) if total_completed_audits > 0 else 0
 
 
@@ -102,43 +78,19 @@ async def get_auditee_dashboard_data(
   }
 
   # II. Audit Portfolio & Progress
-  audit_status_distribution = db.query(Audit.status, func.count(Audit.id)).filter(
-      Audit.company_id == company_id
-  ).group_by(Audit.status).all()
-  status_distribution_data = [{"status": s.value, "count": c} for s, c in audit_status_distribution]
+  status_distribution_data = [{"status": s, "count": c} for s, c in counters.buckets("audits_status").items()]
 
-  audit_type_distribution = db.query(Audit.audit_type, func.count(Audit.id)).filter(
-      Audit.company_id == company_id
-  ).group_by(Audit.audit_type).all()
-  type_distribution_data = [{"type": t.value, "count": c} for t, c in audit_type_distribution]
+  type_distribution_data = [{"type": t, "count": c} for t, c in counters.buckets("audits_type").items()]
 
-  compliance_frameworks_raw = db.query(Audit.compliance_frameworks).filter(
-      Audit.company_id == company_id,
-      Audit.compliance_frameworks.isnot(None)
-  ).all()
-  framework_counts = {}
-  for frameworks_json in compliance_frameworks_raw:
-      frameworks = frameworks_json[0]
-      if isinstance(frameworks, list):
-          for framework in frameworks:
-              framework_counts[framework] = framework_counts.get(framework, 0) + 1
-  compliance_frameworks_data = [{"framework": f, "count": c} for f, c in framework_counts.items()]
-
-  audit_progress_over_time = db.query(
-      func.to_char(Audit.updated_at, 'YYYY-MM'),
-      func.count(Audit.id)
-  ).filter(
-      Audit.company_id == company_id,
-      Audit.status == AuditStatus.completed,
-      Audit.updated_at >= twelve_months_ago
-  ).group_by(func.to_char(Audit.updated_at, 'YYYY-MM')).order_by(func.to_char(Audit.updated_at, 'YYYY-MM')).all()
-  progress_over_time_data = [{"month": m, "completed_count": c} for m, c in audit_progress_over_time]
+  compliance_frameworks_data = [{"framework": f, "count": c} for f, c in counters.buckets("audits_framework").items()]
 
-  audit_approval_status_distribution = db.query(Audit.approval_status, func.count(Audit.id)).filter(
-      Audit.company_id == company_id,
-      Audit.requires_approval == True
-  ).group_by(Audit.approval_status).all()
-  approval_status_data = [{"status": s.value, "count": c} for s, c in audit_approval_status_distribution]
+  progress_over_time_data = [
+      {"month": m, "completed_count": c}
+      for m, c in sorted(counters.buckets("audits_completed_month").items())
+      if m >= twelve_months_ago_month
+  ]
+
+  approval_status_data = [{"status": s, "count": c} for s, c in counters.buckets("audits_approval").items()]
 
   audit_portfolio_analysis = {
       "status_distribution": status_distribution_data,
@@ -149,15 +101,9 @@ async def get_auditee_dashboard_data(
   }
 
   # III. Document Compliance Hub
-  doc_submission_status_breakdown = db.query(DocumentSubmission.verification_status, func.count(DocumentSubmission.id)).join(DocumentRequirement).join(Audit).filter(
-      Audit.company_id == company_id
-  ).group_by(DocumentSubmission.verification_status).all()
-  submission_status_breakdown_data = [{"status": s.value, "count": c} for s, c in doc_submission_status_breakdown]
+  submission_status_breakdown_data = [{"status": s, "count": c} for s, c in counters.buckets("submissions_status").items()]
 
-  doc_workflow_stages = db.query(DocumentSubmission.workflow_stage, func.count(DocumentSubmission.id)).join(DocumentRequirement).join(Audit).filter(
-      Audit.company_id == company_id
-  ).group_by(DocumentSubmission.workflow_stage).all()
-  workflow_stages_data = [{"stage": s.value, "count": c} for s, c in doc_workflow_stages]
+  workflow_stages_data = [{"stage": s, "count": c} for s, c in counters.buckets("submissions_stage").items()]
 
   overdue_requirements = db.query(
       DocumentRequirement.document_type,
@@ -171,30 +117,14 @@ async def get_auditee_dashboard_data(
   ).limit(5).all()
   overdue_requirements_data = [{"document_type": r.document_type, "deadline": r.deadline.isoformat(), "audit_name": r.audit_name, "audit_id": r.audit_id} for r in overdue_requirements]
 
-  documents_by_type = db.query(Document.file_type, func.count(Document.id)).filter(
-      Document.company_id == company_id
-  ).group_by(Document.file_type).all()
-  documents_by_type_data = [{"type": t, "count": c} for t, c in documents_by_type]
+  documents_by_type_data = [{"type": t, "count": c} for t, c in counters.buckets("documents_type").items()]
 
-  avg_revision_rounds_result = db.query(func.avg(DocumentSubmission.revision_round)).join(DocumentRequirement).join(Audit).filter(
-      Audit.company_id == company_id,
-      DocumentSubmission.revision_round.isnot(None)
-  ).scalar()
+  avg_revision_rounds_result = counters.average("submissions_revision")
   avg_revision_rounds = round(avg_revision_rounds_result, 2) if avg_revision_rounds_result else 0
 
-  total_doc_requirements = db.query(DocumentRequirement).join(Audit).filter(
-      Audit.company_id == company_id
-  ).count()
-  on_time_submissions = db.query(DocumentSubmission).join(DocumentRequirement).join(Audit).filter(
-      Audit.company_id == company_id,
-      DocumentSubmission.submitted_at <= DocumentRequirement.deadline,
-      DocumentSubmission.submitted_at.isnot(None)
-  ).count()
-  late_submissions = db.query(DocumentSubmission).join(DocumentRequirement).join(Audit).filter(
-      Audit.company_id == company_id,
-      DocumentSubmission.submitted_at > DocumentRequirement.deadline,
-      DocumentSubmission.submitted_at.isnot(None)
-  ).count()
+  total_doc_requirements = counters.count("requirements_total")
+  on_time_submissions = counters.count("submissions_on_time")
+  late_submissions = counters.count("submissions_late")
   
   submission_timeliness_data = [
       {"label": "On-Time", "value": on_time_submissions, "color": "#059669"},
@@ -213,39 +143,26 @@ async def get_auditee_dashboard_data(
   }
 
   # IV. Findings & Remediation Tracking
-  findings_by_severity = db.query(AuditFinding.severity, func.count(AuditFinding.id)).join(Audit).filter(
-      Audit.company_id == company_id
-  ).group_by(AuditFinding.severity).all()
-  findings_by_severity_data = [{"severity": s.value, "count": c} for s, c in findings_by_severity]
+  findings_by_severity_data = [{"severity": s, "count": c} for s, c in counters.buckets("findings_severity").items()]
 
-  findings_by_status = db.query(AuditFinding.status, func.count(AuditFinding.id)).join(Audit).filter(
-      Audit.company_id == company_id
-  ).group_by(AuditFinding.status).all()
-  findings_by_status_data = [{"status": s.value, "count": c} for s, c in findings_by_status]
+  findings_by_status_data = [{"status": s, "count": c} for s, c in counters.buckets("findings_status").items()]
 
   action_item_status_breakdown = db.query(ActionItem.status, func.count(ActionItem.id)).join(AuditFinding).join(Audit).filter(
       Audit.company_id == company_id
   ).group_by(ActionItem.status).all()
   action_item_status_breakdown_data = [{"status": s.value, "count": c} for s, c in action_item_status_breakdown]
 
-  findings_trend_new = db.query(
-      func.to_char(AuditFinding.created_at, 'YYYY-MM'),
-      func.count(AuditFinding.id)
-  ).filter(
-      AuditFinding.created_at >= twelve_months_ago,
-      AuditFinding.audit_id.in_(db.query(Audit.id).filter(Audit.company_id == company_id))
-  ).group_by(func.to_char(AuditFinding.created_at, 'YYYY-MM')).order_by(func.to_char(AuditFinding.created_at, 'YYYY-MM')).all()
-  findings_trend_new_data = [{"month": m, "count": c} for m, c in findings_trend_new]
-
-  findings_trend_resolved = db.query(
-      func.to_char(AuditFinding.resolved_at, 'YYYY-MM'),
-      func.count(AuditFinding.id)
-  ).filter(
-      AuditFinding.resolved_at.isnot(None),
-      AuditFinding.resolved_at >= twelve_months_ago,
-      AuditFinding.audit_id.in_(db.query(Audit.id).filter(Audit.company_id == company_id))
-  ).group_by(func.to_char(AuditFinding.resolved_at, 'YYYY-MM')).order_by(func.to_char(AuditFinding.resolved_at, 'YYYY-MM')).all()
-  findings_trend_resolved_data = [{"month": m, "count": c} for m, c in findings_trend_resolved]
+  findings_trend_new_data = [
+      {"month": m, "count": c}
+      for m, c in sorted(counters.buckets("findings_new_month").items())
+      if m >= twelve_months_ago_month
+  ]
+
+  findings_trend_resolved_data = [
+      {"month": m, "count": c}
+      for m, c in sorted(counters.buckets("findings_resolved_month").items())
+      if m >= twelve_months_ago_month
+  ]
 
   top_overdue_action_items = db.query(
       ActionItem.description,
@@ -268,32 +185,16 @@ async def get_auditee_dashboard_data(
       "audit_id": a.audit_id
   } for a in top_overdue_action_items]
 
-  findings_by_type = db.query(AuditFinding.finding_type, func.count(AuditFinding.id)).join(Audit).filter(
-      Audit.company_id == company_id,
-      AuditFinding.finding_type.isnot(None)
-  ).group_by(AuditFinding.finding_type).all()
-  findings_by_type_data = [{"type": t, "count": c} for t, c in findings_by_type]
+  findings_by_type_data = [{"type": t, "count": c} for t, c in counters.buckets("findings_type").items()]
 
-  ai_detected_findings_count = db.query(AuditFinding).join(Audit).filter(
-      Audit.company_id == company_id,
-      AuditFinding.ai_detected == True
-  ).count()
-  manual_findings_count = db.query(AuditFinding).join(Audit).filter(
-      Audit.company_id == company_id,
-      AuditFinding.ai_detected == False
-  ).count()
+  ai_detected_findings_count = counters.count("findings_ai_detected")
+  manual_findings_count = counters.count("findings_manual")
   ai_vs_manual_findings_data = [
       {"label": "AI Detected", "value": ai_detected_findings_count, "color": "#003366"},
       {"label": "Manual", "value": manual_findings_count, "color": "#F59E0B"}
   ]
 
-  avg_time_to_resolve_findings_result = db.query(
-      func.avg(func.extract('day', AuditFinding.resolved_at - AuditFinding.created_at))
-  ).filter(
-      AuditFinding.audit_id.in_(db.query(Audit.id).filter(Audit.company_id == company_id)),
-      AuditFinding.resolved_at.isnot(None),
-      AuditFinding.created_at.isnot(None)
-  ).scalar()
+  avg_time_to_resolve_findings_result = counters.average("findings_resolve_days")
   avg_time_to_resolve_findings = round(avg_time_to_resolve_findings_result, 2) if avg_time_to_resolve_findings_result else 0
 
   top_assignees_open_actions = db.query(
@@ -421,10 +322,7 @@ async def get_auditee_dashboard_data(
   ).group_by(ComplianceCheckpoint.status).all()
   compliance_checkpoints_status_data = [{"status": s.value, "count": c} for s, c in compliance_checkpoints_status]
 
-  avg_ai_risk_score_audits_result = db.query(func.avg(Audit.ai_risk_score)).filter(
-      Audit.company_id == company_id,
-      Audit.ai_risk_score.isnot(None)
-  ).scalar()
+  avg_ai_risk_score_audits_result = counters.average("audits_risk_score")
   avg_ai_risk_score_audits = round(avg_ai_risk_score_audits_result, 2) if avg_ai_risk_score_audits_result else 0
 
   escalated_requirements_count = db.query(RequirementEscalation).join(DocumentRequirement).join(Audit).filter(
@@ -534,15 +432,8 @@ async def get_auditee_dashboard_data(
   ).group_by(AuditReport.status).all()
   report_status_distribution_data = [{"status": s.value, "count": c} for s, c in audit_report_status_distribution]
 
-  peer_reviewed_audits_count = db.query(Audit).filter(
-      Audit.company_id == company_id,
-      Audit.peer_reviewed == True
-  ).count()
-  total_completed_audits_for_peer_review = db.query(Audit).filter(
-      Audit.company_id == company_id,
-      Audit.status == AuditStatus.completed,
-      Audit.peer_reviewed.isnot(None)
-  ).count()
+  peer_reviewed_audits_count = counters.count("audits_peer_reviewed")
+  total_completed_audits_for_peer_review = counters.count("audits_completed_peer_known")
   peer_review_rate = (peer_reviewed_audits_count / total_completed_audits_for_peer_review * 100) if total_completed_audits_for_peer_review > 0 else 0
 
   avg_findings_per_audit_trend = db.query(
@@ -4,7 +4,7 @@ Document requirements and submission routes - FIXED
 
 from fastapi import APIRouter, Depends, HTTPException, File, UploadFile, Form, Query, Request
 from sqlalchemy.orm import Session, joinedload
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Literal
 from datetime import datetime, timedelta
 import hashlib
 import os
@@ -13,6 +13,7 @@ import json
 from app.database import get_db
 from app.routers.auth import get_current_user
 from app.models import *
+from app.utils.semantic_index import similar_documents, attach_documents
 
 document_router = APIRouter(prefix="/api/audits", tags=["audit-documents"])
 
@@ -421,6 +422,63 @@ async def get_submission_document(
         }
     }
 
+@document_router.get("/{audit_id}/submissions/{submission_id}/similar-evidence")
+async def get_similar_evidence(
+    audit_id: int,
+    submission_id: int,
+    scope: Literal["audit", "company"] = Query("audit"),
+    limit: int = Query(10, ge=1, le=50),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Find evidence whose content is semantically close to a submitted document"""
+    
+    audit = db.query(Audit).filter(
+        Audit.id == audit_id,
+        Audit.company_id == current_user.company_id
+    ).first()
+    
+    if not audit:
+        raise HTTPException(status_code=404, detail="Audit not found")
+    
+    submission = db.query(DocumentSubmission).join(
+        DocumentRequirement
+    ).filter(
+        DocumentSubmission.id == submission_id,
+        DocumentRequirement.audit_id == audit_id
+    ).first()
+    
+    if not submission:
+        raise HTTPException(status_code=404, detail="Submission not found")
+    
+    # Submissions of this audit, keyed by document, to label the matches
+    audit_submissions = {}
+    for sub_id, document_id, document_type in db.query(
+        DocumentSubmission.id, DocumentSubmission.document_id, DocumentRequirement.document_type
+    ).join(DocumentRequirement).filter(DocumentRequirement.audit_id == audit_id).all():
+        audit_submissions.setdefault(document_id, []).append({"submission_id": sub_id, "document_type": document_type})
+    
+    try:
+        hits = similar_documents(
+            current_user.company_id,
+            submission.document_id,
+            limit=limit,
+            document_ids=list(audit_submissions) if scope == "audit" else None
+        )
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Semantic search is unavailable: {str(e)}")
+    
+    results = attach_documents(db, hits)
+    for result in results:
+        result["submissions"] = audit_submissions.get(result["document_id"], [])
+    
+    return {
+        "submission_id": submission_id,
+        "document_id": submission.document_id,
+        "scope": scope,
+        "results": results
+    }
+
 @document_router.get("/submissions/{submission_id}/status")
 async def get_submission_status(
     submission_id: int,
@@ -2,7 +2,7 @@
 Enhanced document submission routes with AI finding generation
 """
 
-from fastapi import APIRouter, Depends, HTTPException, File, UploadFile, Form, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, File, UploadFile, Form
 from sqlalchemy.orm import Session
 from typing import Dict, Any, List
 from datetime import datetime, timedelta
@@ -10,11 +10,22 @@ from datetime import datetime, timedelta
 from app.database import get_db
 from app.routers.auth import get_current_user
 from app.models import *
-from app.cruds.document import create_document
+from app.cruds.document import ALLOWED_FILE_TYPES, MAX_FILE_SIZE, create_document, create_documents_bulk
 from app.routers.audit.ai_findings_generator import AIFindingGenerator
+from app.tasks import enqueue_document_batch, enqueue_document_pipeline
+from app.utils import blob_store
+from app.utils.document_search import refresh_search_vectors
+from app.utils.uploads import ingest_uploads
 
 router = APIRouter(prefix="/api/audits", tags=["audit-document-submission-enhanced"])
 
+def _ai_analysis_status(queued) -> str:
+    # A submission the broker refused is stored anyway and re-queued by the worker's sweep
+    return "processing" if queued else "not_queued"
+
+def _ai_analysis_message(queued) -> str:
+    return "AI analysis queued." if queued else "AI analysis will be queued once the job queue is available."
+
 async def generate_ai_findings_background(
     document_id: int,
     audit_id: int, 
@@ -23,12 +34,11 @@ async def generate_ai_findings_background(
     db_session_factory
 ):
     """
-    Background task to generate AI findings from submitted document
+    Worker job body that generates AI findings from a submitted document.
+    Errors are re-raised so the queue can retry the stage.
     """
+    db = db_session_factory()
     try:
-        # Create new database session for background task
-        db = db_session_factory()
-        
         # Get user for the background task
         user = db.query(User).filter(User.id == user_id).first()
         if not user:
@@ -58,17 +68,60 @@ async def generate_ai_findings_background(
             submission.ai_validation_notes = f"AI analysis completed. Generated {len(findings)} findings."
             db.commit()
         
+    except Exception as e:
+        print(f"Error in background AI finding generation: {e}")
+        db.rollback()
+        raise
+    finally:
         db.close()
+
+async def generate_ai_findings_batch_background(submissions: List[Dict[str, Any]], db_session_factory):
+    """
+    Worker job body for many submissions at once ({"document_id", "audit_id",
+    "submission_id", "user_id"}). Groq calls are batched per audit.
+    """
+    db = db_session_factory()
+    try:
+        users = {
+            user.id: user for user in db.query(User).filter(
+                User.id.in_({item["user_id"] for item in submissions})
+            ).all()
+        }
+        requests = [
+            {
+                "document_id": item["document_id"],
+                "audit_id": item["audit_id"],
+                "document_submission_id": item["submission_id"],
+                "current_user": users[item["user_id"]]
+            }
+            for item in submissions if item["user_id"] in users
+        ]
+        
+        ai_generator = AIFindingGenerator(db)
+        findings_by_submission = await ai_generator.generate_findings_for_documents(requests)
+        
+        submission_rows = db.query(DocumentSubmission).filter(
+            DocumentSubmission.id.in_(findings_by_submission.keys())
+        ).all()
+        for submission in submission_rows:
+            findings = findings_by_submission[submission.id]
+            submission.ai_validation_score = 8.5 if findings else 6.0
+            submission.ai_validation_notes = f"AI analysis completed. Generated {len(findings)} findings."
+        db.commit()
+        
+        print(f"Generated AI findings for {len(findings_by_submission)} submissions in batch")
+        return findings_by_submission
         
     except Exception as e:
-        print(f"Error in background AI finding generation: {e}")
-        if 'db' in locals():
-            db.close()
+        print(f"Error in batched background AI finding generation: {e}")
+        db.rollback()
+        raise
+    finally:
+        db.close()
 
 @router.post("/{audit_id}/submit-document-enhanced")
 async def submit_document_enhanced(
     audit_id: int,
-    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     requirement_id: int = Form(...),
     db: Session = Depends(get_db),
@@ -104,32 +157,32 @@ async def submit_document_enhanced(
             submitted_at=datetime.utcnow(),
             verification_status=EvidenceStatus.pending,
             revision_round=1,
-            workflow_stage=WorkflowStage.ai_validating
+            workflow_stage=WorkflowStage.submitted
         )
         
         db.add(submission)
         db.commit()
         db.refresh(submission)
         
-        # Schedule AI finding generation as background task
-        from app.database import SessionLocal
-        background_tasks.add_task(
-            generate_ai_findings_background,
+        # Queue extraction followed by AI finding generation
+        queued = enqueue_document_pipeline(
             document_id=document.id,
+            file_path=document.file_path,
+            file_type=document.file_type,
+            submission_id=submission.id,
             audit_id=audit_id,
-            document_submission_id=submission.id,
             user_id=current_user.id,
-            db_session_factory=SessionLocal
+            ai_priority_score=requirement.ai_priority_score
         )
         
         return {
-            "message": "Document uploaded and submitted successfully. AI analysis in progress.",
+            "message": f"Document uploaded and submitted successfully. {_ai_analysis_message(queued)}",
             "submission_id": submission.id,
             "document_id": document.id,
-            "status": "ai_validating",
+            "status": "submitted",
             "next_stage": "under_review",
             "estimated_review_time": "2-4 hours",
-            "ai_analysis_status": "processing",
+            "ai_analysis_status": _ai_analysis_status(queued),
             "workflow_id": f"wf_{submission.id}"
         }
         
@@ -137,10 +190,97 @@ async def submit_document_enhanced(
         db.rollback()
         raise HTTPException(status_code=500, detail=f"Failed to submit document: {str(e)}")
 
+@router.post("/{audit_id}/submit-documents-bulk")
+async def submit_documents_bulk(
+    audit_id: int,
+    files: List[UploadFile] = File(...),
+    requirement_id: int = Form(...),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Submits many files, or ZIP archives of files, to one requirement. Files
+    are stored concurrently, all rows are inserted in one transaction and the
+    whole set is queued as a single extraction/AI batch. Rejected files are
+    reported without failing the others.
+    """
+    requirement = db.query(DocumentRequirement).join(
+        Audit, DocumentRequirement.audit_id == Audit.id
+    ).filter(
+        DocumentRequirement.id == requirement_id,
+        DocumentRequirement.audit_id == audit_id,
+        Audit.company_id == current_user.company_id
+    ).first()
+    
+    if not requirement:
+        raise HTTPException(status_code=404, detail="Requirement not found")
+    
+    stored, rejected = await ingest_uploads(files, blob_store.staging_path, MAX_FILE_SIZE, ALLOWED_FILE_TYPES)
+    if not stored:
+        raise HTTPException(status_code=400, detail={"message": "No file was accepted", "rejected": rejected})
+    for upload in stored:
+        upload.path = blob_store.adopt(upload.path, upload.sha256, upload.filename)
+    
+    try:
+        metadata = {
+            "description": f"Document for audit requirement: {requirement.document_type}",
+            "category": "audit_submission",
+            "audit_id": audit_id,
+            "requirement_id": requirement_id
+        }
+        documents = create_documents_bulk(db, stored, metadata, current_user)
+        
+        submissions = [
+            DocumentSubmission(
+                requirement_id=requirement_id,
+                document_id=document.id,
+                submitted_by=current_user.id,
+                submitted_at=datetime.utcnow(),
+                verification_status=EvidenceStatus.pending,
+                revision_round=1,
+                workflow_stage=WorkflowStage.submitted
+            )
+            for document in documents
+        ]
+        db.add_all(submissions)
+        db.flush()
+        
+        refresh_search_vectors(db, [document.id for document in documents], commit=False)
+        batch = [
+            {
+                "document_id": document.id,
+                "file_path": document.file_path,
+                "file_type": document.file_type,
+                "submission_id": submission.id,
+                "audit_id": audit_id,
+                "user_id": current_user.id
+            }
+            for document, submission in zip(documents, submissions)
+        ]
+        accepted = [
+            {"filename": upload.filename, "document_id": item["document_id"], "submission_id": item["submission_id"]}
+            for upload, item in zip(stored, batch)
+        ]
+        db.commit()
+    except Exception as e:
+        # Stored blobs left unreferenced are garbage collected
+        db.rollback()
+        raise HTTPException(status_code=500, detail=f"Failed to submit documents: {str(e)}")
+    
+    # One pipeline for the whole set, so the LLM stages pack several documents per call
+    queued = enqueue_document_batch(batch, ai_priority_score=requirement.ai_priority_score)
+    
+    return {
+        "message": f"{len(accepted)} documents uploaded and submitted. {_ai_analysis_message(queued)}",
+        "submitted": accepted,
+        "rejected": rejected,
+        "status": "submitted",
+        "ai_analysis_status": _ai_analysis_status(queued)
+    }
+
 @router.post("/{audit_id}/submit-selected-document")
 async def submit_selected_document(
     audit_id: int,
-    background_tasks: BackgroundTasks,
     submission_data: Dict[str, Any],
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
@@ -182,31 +322,32 @@ async def submit_selected_document(
             submitted_at=datetime.utcnow(),
             verification_status=EvidenceStatus.pending,
             revision_round=1,
-            workflow_stage=WorkflowStage.ai_validating
+            workflow_stage=WorkflowStage.submitted
         )
         
         db.add(submission)
         db.commit()
         db.refresh(submission)
         
-        # Schedule AI finding generation as background task
-        from app.database import SessionLocal
-        background_tasks.add_task(
-            generate_ai_findings_background,
+        # Queue AI finding generation, extracting first if the document was never processed
+        queued = enqueue_document_pipeline(
             document_id=document.id,
+            file_path=document.file_path,
+            file_type=document.file_type,
+            submission_id=submission.id,
             audit_id=audit_id,
-            document_submission_id=submission.id,
             user_id=current_user.id,
-            db_session_factory=SessionLocal
+            ai_priority_score=requirement.ai_priority_score,
+            extract=document.raw_content is None
         )
         
         return {
-            "message": "Document submitted successfully. AI analysis in progress.",
+            "message": f"Document submitted successfully. {_ai_analysis_message(queued)}",
             "submission_id": submission.id,
-            "status": "ai_validating",
+            "status": "submitted",
             "next_stage": "under_review",
             "estimated_review_time": "2-4 hours",
-            "ai_analysis_status": "processing",
+            "ai_analysis_status": _ai_analysis_status(queued),
             "document": {"id": document.id, "title": document.title}
         }
         
@@ -279,7 +420,6 @@ async def get_ai_generated_findings(
 async def regenerate_ai_findings(
     audit_id: int,
     document_submission_id: int,
-    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
@@ -311,21 +451,22 @@ async def regenerate_ai_findings(
         
         db.commit()
         
-        # Schedule new AI finding generation
-        from app.database import SessionLocal
-        background_tasks.add_task(
-            generate_ai_findings_background,
+        # Queue new AI finding generation
+        queued = enqueue_document_pipeline(
             document_id=submission.document_id,
+            file_path=submission.document.file_path,
+            file_type=submission.document.file_type,
+            submission_id=document_submission_id,
             audit_id=audit_id,
-            document_submission_id=document_submission_id,
             user_id=current_user.id,
-            db_session_factory=SessionLocal
+            ai_priority_score=submission.requirement.ai_priority_score if submission.requirement else None,
+            extract=False
         )
         
         return {
-            "message": "AI finding regeneration started",
+            "message": "AI finding regeneration started" if queued else "AI finding regeneration will start once the job queue is available",
             "submission_id": document_submission_id,
-            "status": "processing"
+            "status": _ai_analysis_status(queued)
         }
         
     except Exception as e:
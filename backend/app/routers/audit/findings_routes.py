@@ -2,7 +2,7 @@
 Enhanced Audit Finding Routes with Simplified 3-Table Structure
 """
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.orm import Session, joinedload
 from sqlalchemy import and_, or_, desc
 from typing import Optional, List, Dict, Any
@@ -12,6 +12,9 @@ from pydantic import BaseModel, validator
 from app.database import get_db
 from app.routers.auth import get_current_user
 from app.models import *
+from app.utils.domain_events import FINDING_UPDATED, AUDIT_UPDATED
+from app.utils.response_cache import cached_endpoint
+from app.utils.pagination import PaginationMode, keyset_page, cached_count
 
 findings_router = APIRouter(prefix="/api/findings", tags=["enhanced-findings"])
 
@@ -426,6 +429,9 @@ async def get_findings_enhanced(
     finding_source: Optional[str] = None,
     page: int = 1,
     per_page: int = 20,
+    pagination: PaginationMode = Query("offset"),
+    cursor: Optional[str] = None,
+    include_total: bool = True,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
@@ -456,8 +462,19 @@ async def get_findings_enhanced(
             query = query.filter(AuditFinding.finding_source == finding_source)
         
         # Pagination
-        total = query.count()
-        findings = query.offset((page - 1) * per_page).limit(per_page).all()
+        use_cursor = pagination == "cursor" or cursor is not None
+        next_cursor = None
+        if use_cursor:
+            total = cached_count(
+                query,
+                ("findings_enhanced", current_user.company_id, audit_id, status, severity, finding_type, assigned_to, finding_source)
+            ) if include_total else None
+            result = keyset_page(query, AuditFinding.id, cursor, per_page, sort_column=AuditFinding.created_at, descending=True)
+            findings = result["items"]
+            next_cursor = result["next_cursor"]
+        else:
+            total = query.count()
+            findings = query.offset((page - 1) * per_page).limit(per_page).all()
         
         findings_list = []
         for finding in findings:
@@ -507,6 +524,17 @@ async def get_findings_enhanced(
             
             findings_list.append(finding_data)
         
+        if use_cursor:
+            return {
+                "findings": findings_list,
+                "pagination": {
+                    "per_page": per_page,
+                    "total": total,
+                    "next_cursor": next_cursor,
+                    "has_more": next_cursor is not None
+                }
+            }
+        
         return {
             "findings": findings_list,
             "pagination": {
@@ -517,6 +545,8 @@ async def get_findings_enhanced(
             }
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get findings: {str(e)}")
 
@@ -672,6 +702,7 @@ async def get_finding_comments(
 
 # Dashboard and statistics endpoints
 @findings_router.get("/dashboard/stats")
+@cached_endpoint("findings.dashboard_stats", invalidate_on=(FINDING_UPDATED, AUDIT_UPDATED))
 async def get_dashboard_stats(
     audit_id: Optional[int] = None,
     db: Session = Depends(get_db),
@@ -4,13 +4,15 @@ Main audit routes - Core audit management functionality
 
 from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import desc, or_, text, union_all, select, literal
+from sqlalchemy import desc, func, or_, text, union_all, select, literal, bindparam
 from typing import Optional
 from datetime import datetime, timedelta
 
 from app.database import get_db
 from app.routers.auth import get_current_user
 from app.models import *
+from app.utils import hash_chain
+from app.utils.pagination import PaginationMode, keyset_page, cached_count
 from .models import *
 from .services import *
 
@@ -27,16 +29,15 @@ async def get_audits_list(
     sort: str = Query("created_at"),
     page: int = Query(1, ge=1),
     limit: int = Query(20, ge=1, le=100),
+    pagination: PaginationMode = Query("offset"),
+    cursor: Optional[str] = Query(None),
+    include_total: bool = Query(True),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """Get company's audits with filters and pagination - FIXED VERSION"""
     
-    query = db.query(Audit).options(
-        joinedload(Audit.creator),
-        joinedload(Audit.requirements),
-        joinedload(Audit.findings)
-    ).filter(Audit.company_id == current_user.company_id)
+    query = db.query(Audit).filter(Audit.company_id == current_user.company_id)
     
     # Apply filters
     if status and status != "all":
@@ -73,60 +74,84 @@ async def get_audits_list(
     
     # Apply sorting
     if sort == "deadline":
-        query = query.order_by(Audit.deadline.asc())
+        sort_column, descending = Audit.deadline, False
     elif sort == "name":
-        query = query.order_by(Audit.name.asc())
+        sort_column, descending = Audit.name, False
     else:
-        query = query.order_by(desc(Audit.created_at))
+        sort_column, descending = Audit.created_at, True
+    use_cursor = pagination == "cursor" or cursor is not None
     
     # Get total count
-    total = query.count()
+    if use_cursor:
+        total = cached_count(
+            query,
+            ("audits", current_user.company_id, status, industry_type, audit_methodology, approval_status, search)
+        ) if include_total else None
+    else:
+        query = query.order_by(desc(sort_column) if descending else sort_column.asc())
+        total = query.count()
+    
+    # Per-audit aggregates as correlated subqueries, evaluated only for the page rows
+    requirements_count = db.query(func.count(DocumentRequirement.id)).filter(
+        DocumentRequirement.audit_id == Audit.id
+    ).correlate(Audit).scalar_subquery()
+    approved_count = db.query(func.count(DocumentSubmission.id)).join(
+        DocumentRequirement, DocumentSubmission.requirement_id == DocumentRequirement.id
+    ).filter(
+        DocumentRequirement.audit_id == Audit.id,
+        DocumentSubmission.verification_status == EvidenceStatus.approved
+    ).correlate(Audit).scalar_subquery()
+    findings_total = db.query(func.count(AuditFinding.id)).filter(
+        AuditFinding.audit_id == Audit.id
+    ).correlate(Audit).scalar_subquery()
+    critical_open = db.query(func.count(AuditFinding.id)).filter(
+        AuditFinding.audit_id == Audit.id,
+        AuditFinding.severity == FindingSeverity.critical,
+        AuditFinding.status != FindingStatus.resolved
+    ).correlate(Audit).scalar_subquery()
     
     # Apply pagination
-    offset = (page - 1) * limit
-    audits = query.offset(offset).limit(limit).all()
+    page_query = query.options(joinedload(Audit.creator)).add_columns(
+        requirements_count, approved_count, findings_total, critical_open
+    )
+    next_cursor = None
+    if use_cursor:
+        result = keyset_page(
+            page_query, Audit.id, cursor, limit,
+            sort_column=sort_column, descending=descending, entity=lambda row: row[0]
+        )
+        rows = result["items"]
+        next_cursor = result["next_cursor"]
+    else:
+        offset = (page - 1) * limit
+        rows = page_query.offset(offset).limit(limit).all()
     
-    # Calculate progress and metrics for each audit
-    audit_list = []
-    for audit in audits:
-        # Get assigned auditors
+    # Assigned auditors for the whole page in one query
+    auditors_by_audit = {}
+    if rows:
         auditor_assignments = db.execute(
             text("""
-                SELECT u.id, u.f_name, u.l_name, u.email, aaa.role 
+                SELECT aaa.audit_id, u.id, u.f_name, u.l_name, u.email, aaa.role 
                 FROM users u 
                 JOIN audit_auditor_assignments aaa ON u.id = aaa.auditor_id 
-                WHERE aaa.audit_id = :audit_id AND aaa.is_active = true
-            """),
-            {"audit_id": audit.id}
+                WHERE aaa.audit_id IN :audit_ids AND aaa.is_active = true
+            """).bindparams(bindparam("audit_ids", expanding=True)),
+            {"audit_ids": [row[0].id for row in rows]}
         ).fetchall()
-        
-        assigned_auditors = [
-            f"{row.f_name or ''} {row.l_name or ''}".strip() or row.email
-            for row in auditor_assignments
-        ]
+        for row in auditor_assignments:
+            auditors_by_audit.setdefault(row.audit_id, []).append(
+                f"{row.f_name or ''} {row.l_name or ''}".strip() or row.email
+            )
+    
+    # Calculate progress and metrics for each audit
+    audit_list = []
+    for audit, total_requirements, approved_submissions, findings_count, critical_findings in rows:
+        assigned_auditors = auditors_by_audit.get(audit.id, [])
         
         # Calculate progress
-        total_requirements = len(audit.requirements) if audit.requirements else 0
-        completed_requirements = 0
-        if total_requirements > 0:
-            completed_requirements = db.query(DocumentSubmission).join(
-                DocumentRequirement
-            ).filter(
-                DocumentRequirement.audit_id == audit.id,
-                DocumentSubmission.verification_status == EvidenceStatus.approved
-            ).count()
-        
+        completed_requirements = approved_submissions if total_requirements > 0 else 0
         progress = (completed_requirements / total_requirements * 100) if total_requirements > 0 else 0
         
-        # Get findings count
-        findings_count = len(audit.findings) if audit.findings else 0
-        critical_findings = 0
-        if audit.findings:
-            critical_findings = len([
-                f for f in audit.findings 
-                if f.severity == FindingSeverity.critical and f.status != FindingStatus.resolved
-            ])
-        
         # Determine risk level based on AI risk score
         ai_risk_score = audit.ai_risk_score or 5.0
         if ai_risk_score >= 8:
@@ -176,6 +201,17 @@ async def get_audits_list(
         
         audit_list.append(audit_dict)
     
+    if use_cursor:
+        return {
+            "audits": audit_list,
+            "pagination": {
+                "limit": limit,
+                "total": total,
+                "next_cursor": next_cursor,
+                "has_more": next_cursor is not None
+            }
+        }
+    
     return {
         "audits": audit_list,
         "pagination": {
@@ -1594,6 +1630,34 @@ async def get_verification_chain(
     
     return {"verification_chain": chain_list}
 
+@router.get("/{audit_id}/verification-chain/verify")
+async def verify_audit_chains(
+    audit_id: int,
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    """Recompute every verification and audit trail link of an audit"""
+    
+    audit = db.query(Audit).filter(Audit.id == audit_id).first()
+    if not audit:
+        raise HTTPException(status_code=404, detail="Audit not found")
+    
+    return hash_chain.verify_audit(db, audit_id)
+
+@router.get("/{audit_id}/chain-root")
+async def get_audit_chain_root(
+    audit_id: int,
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    """Merkle root committing to the current head of every chain of an audit"""
+    
+    audit = db.query(Audit).filter(Audit.id == audit_id).first()
+    if not audit:
+        raise HTTPException(status_code=404, detail="Audit not found")
+    
+    return hash_chain.audit_chain_root(db, audit_id)
+
 @router.get("/{audit_id}/enhanced-details")
 async def get_enhanced_audit_details(
     audit_id: int,
@@ -9,28 +9,15 @@ from datetime import datetime, timedelta
 from typing import List, Dict, Any
 import uuid # Import uuid for token generation
 
-# Assuming AI SDK Python packages are installed as 'ai', 'ai_sdk_google'
-import google.generativeai as genai
-
-from groq import Groq # For Grok AI
-
 from sqlalchemy.orm import Session, joinedload
 from sqlalchemy import text, and_, or_
 from fastapi import HTTPException
 import bcrypt
 
 from app.models import *
-
-# Configure AI SDK models using environment variables
-# Ensure GROQ_API_KEY and GOOGLE_API_KEY are set in your environment
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-GEMINI_API_KEY = os.getenv("GOOGLE_API_KEY") # Using GOOGLE_API_KEY for Gemini
-
-# Initialize models
-# Note: In a production environment, you might want to handle API key absence more robustly
-grok_client = Groq(api_key=GROQ_API_KEY) # Initialize Groq client directly
-genai.configure(api_key=GEMINI_API_KEY)
-gemini_model = genai.GenerativeModel('gemini-1.5-flash')
+# Groq (GROQ_API_KEY) and Gemini (GOOGLE_API_KEY) calls go through the shared client
+from app.utils.llm_client import llm_client
+from app.utils.llm_cache import LLM_CACHE_DEFAULT_TTL, materiality_bucket
 
 
 class AuditValidationService:
@@ -218,14 +205,24 @@ class AIEnhancementService:
             }
         ]
         
-        response = grok_client.chat.completions.create(
+        response_content = await llm_client.chat(
+            "groq",
             messages=messages,
             model="llama-3.3-70b-versatile",
-            response_format={"type": "json_object"}
+            json_mode=True,
+            cache_ttl=LLM_CACHE_DEFAULT_TTL,
+            cache_key=(
+                "intelligent_requirements",
+                audit_data.financial_audit_type,
+                audit_data.industry_type,
+                audit_data.compliance_frameworks,
+                materiality_bucket(audit_data.materiality_threshold),
+                risk_assessment.get('risk_categories', []),
+                risk_assessment.get('key_recommendations', [])
+            )
         )
         
         # Handle both direct array responses and object with array
-        response_content = response.choices[0].message.content
         print('AI Response Content:', response_content)
         if isinstance(response_content, str):
             try:
@@ -363,11 +360,12 @@ class AIEnhancementService:
           }
       ]
       try:
-          chat_completion = grok_client.chat.completions.create(
+          summary = await llm_client.chat(
+              "groq",
               messages=messages,
               model="llama-3.3-70b-versatile" # Using llama-3.3-70b-versatile as a common Grok model, adjust if a specific version is preferred
           )
-          return chat_completion.choices[0].message.content
+          return summary
       except Exception as e:
           print(f"Error generating audit summary with Grok AI: {e}")
           return f"Audit of {audit_data.name} focusing on {audit_data.financial_audit_type} within the scope of {audit_data.scope}."
@@ -407,12 +405,12 @@ class AIEnhancementService:
           }
       ]
       try:
-          chat_completion = grok_client.chat.completions.create(
+          response_content = await llm_client.chat(
+              "groq",
               messages=messages,
               model="llama-3.3-70b-versatile", # Using llama-3.3-70b-versatile
-              response_format={"type": "json_object"} # Request JSON output
+              json_mode=True # Request JSON output
           )
-          response_content = chat_completion.choices[0].message.content
           
           try:
               parsed_content = json.loads(response_content)
@@ -508,12 +506,12 @@ class AIEnhancementService:
           }
       ]
       try:
-          chat_completion = grok_client.chat.completions.create(
+          response_content = await llm_client.chat(
+              "groq",
               messages=messages,
               model="llama-3.3-70b-versatile", # Using llama-3.3-70b-versatile
-              response_format={"type": "json_object"} # Request JSON output
+              json_mode=True # Request JSON output
           )
-          response_content = chat_completion.choices[0].message.content
 
           try:
               parsed_content = json.loads(response_content)
@@ -645,13 +643,16 @@ async def generate_ai_risk_assessment(
           }
       ]
       
-      response = grok_client.chat.completions.create(
+      response = await llm_client.chat(
+          "groq",
           messages=messages,
           model="llama-3.3-70b-versatile",
-          response_format={"type": "json_object"}
+          json_mode=True,
+          cache_ttl=LLM_CACHE_DEFAULT_TTL,
+          cache_key=("risk_assessment", financial_audit_type, scope, materiality_bucket(materiality_threshold), historical_context)
       )
       
-      ai_assessment = json.loads(response.choices[0].message.content)
+      ai_assessment = json.loads(response)
       return ai_assessment
   except Exception as e:
       print(f"Error generating AI risk assessment with Groq: {str(e)}")
@@ -8,6 +8,8 @@ from app.models import (
     WorkflowExecutionHistory, User, Activity,WorkflowStep
 )
 from app.routers.auth import get_current_user
+from app.utils.domain_events import DOCUMENT_UPDATED, WORKFLOW_UPDATED
+from app.utils.response_cache import cached_endpoint
 from sqlalchemy import func, and_, or_
 import logging
 
@@ -15,6 +17,7 @@ router = APIRouter()
 logger = logging.getLogger(__name__)
 
 @router.get("/dashboard/stats", response_model=Dict[str, Any])
+@cached_endpoint("dashboard.stats", invalidate_on=(DOCUMENT_UPDATED, WORKFLOW_UPDATED))
 async def get_dashboard_stats(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
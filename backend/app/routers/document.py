@@ -1,6 +1,6 @@
 # app/routers/document_routes.py
 
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, BackgroundTasks, Query
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Query, Request
 from fastapi.responses import StreamingResponse, JSONResponse
 from sqlalchemy.orm import Session
 from typing import List, Optional, Dict, Any
@@ -10,12 +10,18 @@ from app.models import User, Document as DocumentModel, DocumentMetadata, Annota
 from app.models import RelatedDocument, DocumentAIAnalysis, Activity, WorkflowExecutionHistory
 from app.cruds.document import (
     create_document, list_documents, batch_operation, get_document, get_document_content,
-    update_document_metadata, delete_document, cleanup_deleted_documents, download_document
+    update_document_metadata, delete_document, cleanup_deleted_documents, download_document,
+    save_upload_file
 )
 from app.routers.auth import get_current_user
 from app.schemas.document import Document
 from app.schemas.error import ErrorResponse
-from app.tasks import process_pdf, process_excel, process_csv, process_image
+from app.tasks import enqueue_document_pipeline, queue_semantic_indexing, queue_version_delta
+from app.utils.file_serving import is_follow_up_request, serve_file
+from app.utils.pagination import PaginationMode
+from app.utils.document_search import refresh_search_vector, search_documents
+from app.utils.semantic_index import semantic_search, attach_documents
+from app.utils.version_deltas import version_file
 import json
 import os
 import shutil
@@ -24,7 +30,6 @@ router = APIRouter()
 
 @router.post("/documents")
 async def create_document_route(
-    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
     file: UploadFile = File(...),
@@ -32,15 +37,8 @@ async def create_document_route(
 ):
     document = create_document(db, file, metadata, current_user)
     
-    # Add the appropriate background task based on file type
-    if document.file_type == "application/pdf":
-        background_tasks.add_task(process_pdf, document.file_path, document.id)
-    elif document.file_type in ["application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", "application/vnd.ms-excel"]:
-        background_tasks.add_task(process_excel, document.file_path, document.id)
-    elif document.file_type == "text/csv":
-        background_tasks.add_task(process_csv, document.file_path, document.id)
-    elif document.file_type in ["image/jpeg", "image/png"]:
-        background_tasks.add_task(process_image, document.file_path, document.id)
+    # Hand extraction off to the worker pool
+    enqueue_document_pipeline(document.id, document.file_path, document.file_type)
     
     # Log the document creation activity
     activity = Activity(
@@ -53,7 +51,7 @@ async def create_document_route(
     db.add(activity)
     db.commit()
     
-    print('Background task added', document.file_type)
+    print('Document processing queued', document.file_type)
     return {"message": "Document created successfully"}
 
 
@@ -68,7 +66,10 @@ async def list_documents_route(
     status: Optional[str] = None,
     date_from: Optional[str] = None,
     date_to: Optional[str] = None,
-    sort_by: str = "uploadDate"
+    sort_by: str = "uploadDate",
+    pagination: PaginationMode = Query("offset"),
+    cursor: Optional[str] = None,
+    include_total: bool = True
 ):
     # Log the document listing activity
     activity = Activity(
@@ -81,7 +82,40 @@ async def list_documents_route(
     db.add(activity)
     db.commit()
     
-    return list_documents(db, current_user, page, limit, search, type, status, date_from, date_to, sort_by)
+    return list_documents(
+        db, current_user, page, limit, search, type, status, date_from, date_to, sort_by,
+        cursor=cursor, use_cursor=pagination == "cursor", include_total=include_total
+    )
+
+@router.get("/documents/search", response_model=Dict[str, Any])
+async def search_documents_route(
+    q: str = Query(..., min_length=1),
+    type: Optional[str] = None,
+    page: int = Query(1, ge=1),
+    limit: int = Query(20, ge=1, le=100),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Ranked full-text search with highlighted snippets"""
+    result = search_documents(
+        db, current_user.company_id, q, limit=limit, offset=(page - 1) * limit, file_type=type
+    )
+    result["page"] = page
+    return result
+
+@router.get("/documents/semantic-search", response_model=Dict[str, Any])
+async def semantic_search_route(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(10, ge=1, le=50),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Documents whose extracted text is closest in meaning to the query"""
+    try:
+        hits = semantic_search(current_user.company_id, q, limit=limit)
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Semantic search is unavailable: {str(e)}")
+    return {"results": attach_documents(db, hits), "limit": limit}
 
 @router.post("/documents/batch", responses={400: {"model": ErrorResponse}, 404: {"model": ErrorResponse}, 500: {"model": ErrorResponse}})
 async def batch_operation_route(
@@ -147,6 +181,7 @@ async def get_document_basic_route(
 @router.get("/documents/{document_id}", response_model=Dict[str, Any])
 async def get_document_route(
     document_id: int,
+    include: Optional[str] = Query(None, description="Comma-separated sections to return, e.g. metadata,annotations,content. Defaults to all."),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
@@ -161,7 +196,7 @@ async def get_document_route(
     db.add(activity)
     db.commit()
     
-    return get_document(db, document_id, current_user)
+    return get_document(db, document_id, current_user, include=include)
 
 # New endpoint for document content data
 @router.get("/documents/{document_id}/content-data", response_model=Dict[str, Any])
@@ -528,17 +563,8 @@ async def create_document_version_with_file(
         # Save the previous version's file path before updating
         previous_file_path = document.file_path
         
-        # Save the new file
-        upload_dir = os.path.dirname(document.file_path)
-        file_extension = os.path.splitext(document.file_path)[1]
-        new_filename = f"{os.path.splitext(os.path.basename(document.file_path))[0]}_v{new_version_number}{file_extension}"
-        new_file_path = os.path.join(upload_dir, new_filename)
-        
-        try:
-            with open(new_file_path, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
-        finally:
-            file.file.close()
+        # Store the new file; content identical to any stored file is not copied again
+        new_file_path, file_hash = save_upload_file(file)
         
         # Create new version record with the previous file path
         new_version = DocumentVersion(
@@ -551,12 +577,18 @@ async def create_document_version_with_file(
         
         # Update the document with the new file path
         document.file_path = new_file_path
+        document.hash_sha256 = file_hash
         document.updated_at = datetime.utcnow()
         
         db.add(new_version)
         db.commit()
         db.refresh(new_version)
         
+        # Re-extract the new file; identical content is served from the extraction cache
+        enqueue_document_pipeline(document.id, document.file_path, document.file_type)
+        # The replaced file may be re-stored as a delta against the new one
+        queue_version_delta(new_version.id, document.file_type)
+        
         return {
             "message": "Document version created successfully",
             "version": {
@@ -579,6 +611,7 @@ async def create_document_version_with_file(
 async def view_version_content_route(
     document_id: int,
     version_id: int,
+    request: Request,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
@@ -600,26 +633,30 @@ async def view_version_content_route(
         raise HTTPException(status_code=404, detail="Version not found")
     
     # Log the activity
-    activity = Activity(
-        action="view_version",
-        user_id=current_user.id,
-        document_id=document_id,
-        details={"type": "version_viewed", "version_id": version_id},
-        created_at=datetime.utcnow()
-    )
-    db.add(activity)
-    db.commit()
+    # (range and revalidation requests belong to a view already logged)
+    if not is_follow_up_request(request):
+        activity = Activity(
+            action="view_version",
+            user_id=current_user.id,
+            document_id=document_id,
+            details={"type": "version_viewed", "version_id": version_id},
+            created_at=datetime.utcnow()
+        )
+        db.add(activity)
+        db.commit()
     
-    # If the version has a file path, return the file
-    if version.file_path:
-        try:
-            return StreamingResponse(
-                open(version.file_path, "rb"),
-                media_type="application/octet-stream",
-                headers={"Content-Disposition": f"inline; filename={version.file_path.split('/')[-1]}"}
-            )
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Failed to retrieve version file: {str(e)}")
+    # If the version has a file (delta-stored ones are rebuilt), return it
+    file_path, content_hash = version_file(db, document, version)
+    if file_path:
+        # ETag, conditional GET and Range support, read in fixed-size chunks
+        return serve_file(
+            request,
+            file_path,
+            media_type=document.file_type,
+            filename=os.path.basename(file_path),
+            disposition="inline",
+            content_hash=content_hash
+        )
     
     # Otherwise, return the content as JSON
     return {"content": version.content}
@@ -629,6 +666,7 @@ async def view_version_content_route(
 async def download_version_route(
     document_id: int,
     version_id: int,
+    request: Request,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
@@ -650,26 +688,30 @@ async def download_version_route(
         raise HTTPException(status_code=404, detail="Version not found")
     
     # Log the activity
-    activity = Activity(
-        action="download_version",
-        user_id=current_user.id,
-        document_id=document_id,
-        details={"type": "version_downloaded", "version_id": version_id},
-        created_at=datetime.utcnow()
-    )
-    db.add(activity)
-    db.commit()
+    # (range and revalidation requests belong to a view already logged)
+    if not is_follow_up_request(request):
+        activity = Activity(
+            action="download_version",
+            user_id=current_user.id,
+            document_id=document_id,
+            details={"type": "version_downloaded", "version_id": version_id},
+            created_at=datetime.utcnow()
+        )
+        db.add(activity)
+        db.commit()
     
-    # If the version has a file path, return the file
-    if version.file_path:
-        try:
-            return StreamingResponse(
-                open(version.file_path, "rb"),
-                media_type="application/octet-stream",
-                headers={"Content-Disposition": f"attachment; filename={version.file_path.split('/')[-1]}"}
-            )
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Failed to download version file: {str(e)}")
+    # If the version has a file (delta-stored ones are rebuilt), return it
+    file_path, content_hash = version_file(db, document, version)
+    if file_path:
+        # ETag, conditional GET and Range support, read in fixed-size chunks
+        return serve_file(
+            request,
+            file_path,
+            media_type=document.file_type,
+            filename=os.path.basename(file_path),
+            disposition="attachment",
+            content_hash=content_hash
+        )
     
     # Otherwise, return the content as a text file
     content = version.content or ""
@@ -986,59 +1028,68 @@ async def get_document_related_route(
 @router.get("/documents/{document_id}/content", responses={404: {"model": ErrorResponse}})
 async def get_document_content_route(
     document_id: int,
+    request: Request,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     # Log the document content download activity
-    activity = Activity(
-        action="view_document_content",
-        user_id=current_user.id,
-        document_id=document_id,
-        details={"type": "document_content_accessed"},
-        created_at=datetime.utcnow()
-    )
-    db.add(activity)
-    db.commit()
+    # (range and revalidation requests belong to a view already logged)
+    if not is_follow_up_request(request):
+        activity = Activity(
+            action="view_document_content",
+            user_id=current_user.id,
+            document_id=document_id,
+            details={"type": "document_content_accessed"},
+            created_at=datetime.utcnow()
+        )
+        db.add(activity)
+        db.commit()
     
-    return get_document_content(db, document_id, current_user)
+    return get_document_content(db, document_id, current_user, request)
 
 @router.get("/documents/{document_id}/preview", responses={404: {"model": ErrorResponse}})
 async def get_document_preview_route(
     document_id: int,
+    request: Request,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     # Log the document preview activity
-    activity = Activity(
-        action="preview_document",
-        user_id=current_user.id,
-        document_id=document_id,
-        details={"type": "document_previewed"},
-        created_at=datetime.utcnow()
-    )
-    db.add(activity)
-    db.commit()
+    # (range and revalidation requests belong to a view already logged)
+    if not is_follow_up_request(request):
+        activity = Activity(
+            action="preview_document",
+            user_id=current_user.id,
+            document_id=document_id,
+            details={"type": "document_previewed"},
+            created_at=datetime.utcnow()
+        )
+        db.add(activity)
+        db.commit()
     
-    return get_document_content(db, document_id, current_user)
+    return get_document_content(db, document_id, current_user, request)
 
 @router.get("/documents/{document_id}/download", responses={404: {"model": ErrorResponse}})
 async def download_document_route(
     document_id: int,
+    request: Request,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     # Log the document download activity
-    activity = Activity(
-        action="download_document",
-        user_id=current_user.id,
-        document_id=document_id,
-        details={"type": "document_downloaded"},
-        created_at=datetime.utcnow()
-    )
-    db.add(activity)
-    db.commit()
+    # (range and revalidation requests belong to a view already logged)
+    if not is_follow_up_request(request):
+        activity = Activity(
+            action="download_document",
+            user_id=current_user.id,
+            document_id=document_id,
+            details={"type": "document_downloaded"},
+            created_at=datetime.utcnow()
+        )
+        db.add(activity)
+        db.commit()
     
-    return download_document(db, document_id, current_user)
+    return download_document(db, document_id, current_user, request)
 
 @router.post("/documents/{document_id}/metadata", response_model=Dict[str, Any])
 async def update_document_metadata_route(
@@ -1082,6 +1133,7 @@ async def update_document_content_route(
         # Update the document content
         document.content = json.dumps(content_data.get("content", {}))
         db.commit()
+        refresh_search_vector(db, document_id)
         
         # Log the activity
         activity = Activity(
@@ -1106,6 +1158,7 @@ async def delete_document_route(
     current_user: User = Depends(get_current_user)
 ):
     result = delete_document(db, document_id, current_user)
+    queue_semantic_indexing(document_id)  # drops the document's chunks
     
     # Log the document deletion activity
     activity = Activity(
@@ -1122,10 +1175,11 @@ async def delete_document_route(
 
 @router.post("/documents/cleanup", response_model=Dict[str, str])
 async def cleanup_deleted_documents_route(
+    migrate_legacy_files: bool = False,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    result = cleanup_deleted_documents(db, current_user)
+    result = cleanup_deleted_documents(db, current_user, migrate_legacy_files)
     
     # Log the cleanup activity
     activity = Activity(
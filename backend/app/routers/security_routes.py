@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException, Body
+from fastapi import APIRouter, Depends, HTTPException, Body, Request
 from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from typing import Dict, Any, List, Optional
@@ -6,14 +6,17 @@ from datetime import datetime
 import json
 import hashlib
 import os
-import io
-import zipfile
 from app.database import get_db
 from app.models import (
     User, Audit, AuditStatus, DocumentSubmission, 
-    DocumentVerification, UserRole, DocumentRequirement, AuditMeeting, MeetingAttendee, MeetingAgendaItem
+    DocumentVerification, UserRole, DocumentRequirement, AuditMeeting, MeetingAttendee, MeetingAgendaItem,
+    AuditExportJob, AuditSeal
 )
 from app.routers.auth import get_current_user
+from app.tasks import export_audit_archive_task
+from app.utils.audit_archive import audit_fingerprint, find_reusable_job, issue_download_token, iter_audit_archive
+from app.utils.audit_seal import inclusion_proofs, seal_audit, verify_seal
+from app.utils.file_serving import serve_file
 from sqlalchemy import and_, or_, func
 
 router = APIRouter()
@@ -64,6 +67,9 @@ async def freeze_audit(
     archive_note = f"\n\nARCHIVED ON {datetime.utcnow().isoformat()} BY {current_user.username}. REASON: {reason}"
     audit.description = (audit.description or "") + archive_note
     
+    # Seal the frozen state: one Merkle root over evidence, verifications and findings
+    seal, _ = seal_audit(db, audit.id, current_user.id)
+    
     db.commit()
     
     return {
@@ -73,9 +79,95 @@ async def freeze_audit(
             "name": audit.name,
             "status": audit.status.value,
             "archived_at": audit.end_date.isoformat()
-        }
+        },
+        "seal": _seal_status(seal)
     }
 
+def _seal_status(seal) -> Dict[str, Any]:
+    return {
+        "root_hash": seal.root_hash,
+        "leaf_count": seal.leaf_count,
+        "sealed_at": seal.sealed_at.isoformat() if seal.sealed_at else None,
+        "updated_at": seal.updated_at.isoformat() if seal.updated_at else None
+    }
+
+def _get_company_audit(db: Session, audit_id: int, current_user: User) -> Audit:
+    audit = db.query(Audit).filter(
+        Audit.id == audit_id,
+        Audit.company_id == current_user.company_id
+    ).first()
+    if not audit:
+        raise HTTPException(status_code=404, detail="Audit not found")
+    return audit
+
+@router.post("/audits/{audit_id}/seal")
+async def extend_audit_seal(
+    audit_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Append records added since an audit was sealed to its Merkle tree
+    """
+    check_auditor_role(current_user)
+    audit = _get_company_audit(db, audit_id, current_user)
+    if audit.status != AuditStatus.archived:
+        raise HTTPException(status_code=400, detail="Only frozen audits are sealed")
+    
+    seal, appended = seal_audit(db, audit.id, current_user.id)
+    db.commit()
+    return {**_seal_status(seal), "appended": appended}
+
+@router.get("/audits/{audit_id}/seal")
+async def get_audit_seal(
+    audit_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Root hash of an audit's seal
+    """
+    _get_company_audit(db, audit_id, current_user)
+    seal = db.query(AuditSeal).filter(AuditSeal.audit_id == audit_id).first()
+    if not seal:
+        raise HTTPException(status_code=404, detail="Audit is not sealed")
+    return _seal_status(seal)
+
+@router.get("/audits/{audit_id}/seal/verify")
+async def verify_audit_seal(
+    audit_id: int,
+    check_files: bool = False,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Compare an audit's records (and optionally evidence files) with its seal
+    """
+    check_auditor_role(current_user)
+    _get_company_audit(db, audit_id, current_user)
+    result = verify_seal(db, audit_id, check_files=check_files)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Audit is not sealed")
+    return result
+
+@router.get("/audits/{audit_id}/seal/documents/{document_id}/proof")
+async def get_document_inclusion_proof(
+    audit_id: int,
+    document_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Merkle inclusion proofs of a document's sealed records
+    """
+    _get_company_audit(db, audit_id, current_user)
+    result = inclusion_proofs(db, audit_id, document_id)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Audit is not sealed")
+    if not result["proofs"]:
+        raise HTTPException(status_code=404, detail="Document is not part of the seal")
+    return result
+
 @router.get("/submissions/{sub_id}/custody")
 async def get_submission_custody_chain(
     sub_id: int,
@@ -173,188 +265,134 @@ async def export_audit_archive(
     if not audit:
         raise HTTPException(status_code=404, detail="Audit not found")
     
-    # Create a ZIP file in memory
-    zip_buffer = io.BytesIO()
-    with zipfile.ZipFile(zip_buffer, 'a', zipfile.ZIP_DEFLATED, False) as zip_file:
-        # Add audit metadata
-        audit_metadata = {
-            "id": audit.id,
-            "name": audit.name,
-            "description": audit.description,
-            "scope": audit.scope,
-            "status": audit.status.value,
-            "start_date": audit.start_date.isoformat() if audit.start_date else None,
-            "end_date": audit.end_date.isoformat() if audit.end_date else None,
-            "deadline": audit.deadline.isoformat() if audit.deadline else None,
-            "is_locked": audit.is_locked,
-            "created_at": audit.created_at.isoformat(),
-            "created_by": {
-                "id": audit.creator.id,
-                "name": f"{audit.creator.f_name} {audit.creator.l_name}",
-                "role": audit.creator.role.value
-            }
-        }
-        
-        zip_file.writestr("audit_metadata.json", json.dumps(audit_metadata, indent=2))
-        
-        # Add requirements
-        requirements_data = [
-            {
-                "id": req.id,
-                "document_type": req.document_type,
-                "required_fields": req.required_fields,
-                "validation_rules": req.validation_rules,
-                "deadline": req.deadline.isoformat() if req.deadline else None,
-                "is_mandatory": req.is_mandatory
-            }
-            for req in audit.requirements
-        ]
-        
-        zip_file.writestr("requirements.json", json.dumps(requirements_data, indent=2))
-        
-        # Add submissions
-        submissions = []
-        for req in audit.requirements:
-            for sub in req.submissions:
-                submission_data = {
-                    "id": sub.id,
-                    "requirement_id": sub.requirement_id,
-                    "document_id": sub.document_id,
-                    "document_title": sub.document.title if sub.document else None,
-                    "status": sub.verification_status.value,
-                    "submitted_by": {
-                        "id": sub.submitter.id,
-                        "name": f"{sub.submitter.f_name} {sub.submitter.l_name}"
-                    },
-                    "submitted_at": sub.submitted_at.isoformat(),
-                    "revision_round": sub.revision_round,
-                    "hash_sha256": sub.hash_sha256,
-                    "verifications": [
-                        {
-                            "id": v.id,
-                            "status": v.status.value,
-                            "notes": v.notes,
-                            "verified_at": v.verified_at.isoformat(),
-                            "verified_by": {
-                                "id": v.verifier.id,
-                                "name": f"{v.verifier.f_name} {v.verifier.l_name}"
-                            }
-                        }
-                        for v in sub.verifications
-                    ]
-                }
-                submissions.append(submission_data)
-                
-                # Add document content if available
-                if sub.document and sub.document.file_path and os.path.exists(sub.document.file_path):
-                    try:
-                        with open(sub.document.file_path, "rb") as doc_file:
-                            doc_content = doc_file.read()
-                            zip_file.writestr(f"documents/{sub.document_id}_{os.path.basename(sub.document.file_path)}", doc_content)
-                    except Exception as e:
-                        # Log error but continue
-                        print(f"Error adding document {sub.document_id} to archive: {str(e)}")
-        
-        zip_file.writestr("submissions.json", json.dumps(submissions, indent=2))
-        
-        # Add findings
-        findings_data = [
-            {
-                "id": finding.id,
-                "title": finding.title,
-                "description": finding.description,
-                "severity": finding.severity.value,
-                "recommendation": finding.recommendation,
-                "status": finding.status,
-                "due_date": finding.due_date.isoformat() if finding.due_date else None,
-                "created_at": finding.created_at.isoformat(),
-                "created_by": {
-                    "id": finding.creator.id,
-                    "name": f"{finding.creator.f_name} {finding.creator.l_name}"
-                },
-                "resolved_at": finding.resolved_at.isoformat() if finding.resolved_at else None,
-                "action_items": [
-                    {
-                        "id": action.id,
-                        "description": action.description,
-                        "due_date": action.due_date.isoformat() if action.due_date else None,
-                        "status": action.status,
-                        "assigned_to": {
-                            "id": action.assignee.id,
-                            "name": f"{action.assignee.f_name} {action.assignee.l_name}"
-                        }
-                    }
-                    for action in finding.action_items
-                ]
-            }
-            for finding in audit.findings
-        ]
-        
-        zip_file.writestr("findings.json", json.dumps(findings_data, indent=2))
-        
-        # Add meetings
-        meetings_data = [
-            {
-                "id": meeting.id,
-                "meeting_type": meeting.meeting_type,
-                "title": meeting.title,
-                "scheduled_time": meeting.scheduled_time.isoformat() if meeting.scheduled_time else None,
-                "end_time": meeting.end_time.isoformat() if meeting.end_time else None,
-                "duration_minutes": meeting.duration_minutes,
-                "location": meeting.location,
-                "notes": meeting.notes,
-                "status": meeting.status,
-                "attendees": [
-                    {
-                        "user_id": attendee.user_id,
-                        "name": f"{attendee.user.f_name} {attendee.user.l_name}",
-                        "is_required": attendee.is_required,
-                        "has_confirmed": attendee.has_confirmed
-                    }
-                    for attendee in meeting.attendees
-                ],
-                "agenda_items": [
-                    {
-                        "position": item.position,
-                        "title": item.title,
-                        "description": item.description,
-                        "time_allocation": item.time_allocation,
-                        "is_completed": item.is_completed
-                    }
-                    for item in meeting.agenda_items
-                ]
-            }
-            for meeting in audit.meetings
-        ]
-        
-        zip_file.writestr("meetings.json", json.dumps(meetings_data, indent=2))
-        
-        # Add a manifest with hash verification
-        manifest = {
-            "audit_id": audit.id,
-            "audit_name": audit.name,
-            "export_timestamp": datetime.utcnow().isoformat(),
-            "exported_by": {
-                "id": current_user.id,
-                "name": f"{current_user.f_name} {current_user.l_name}",
-                "role": current_user.role.value
-            },
-            "file_count": len(zip_file.namelist()),
-            "files": zip_file.namelist()
-        }
-        
-        zip_file.writestr("manifest.json", json.dumps(manifest, indent=2))
-    
-    # Reset buffer position
-    zip_buffer.seek(0)
+    exported_by = {
+        "id": current_user.id,
+        "name": f"{current_user.f_name} {current_user.l_name}",
+        "role": current_user.role.value
+    }
     
     # Create a filename with timestamp
     timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
     filename = f"audit_{audit_id}_{timestamp}_archive.zip"
     
-    # Return the ZIP file as a streaming response
+    # Stream the ZIP as it is built; manifest.json carries a SHA-256 per file
     return StreamingResponse(
-        zip_buffer,
+        iter_audit_archive(audit.id, exported_by),
         media_type="application/zip",
         headers={"Content-Disposition": f"attachment; filename={filename}"}
     )
+
+def _export_job_status(db: Session, job: AuditExportJob) -> Dict[str, Any]:
+    if job.status == "completed" and (not job.token_expires_at or job.token_expires_at < datetime.utcnow()):
+        issue_download_token(job)
+        db.commit()
+    
+    return {
+        "job_id": job.id,
+        "audit_id": job.audit_id,
+        "status": job.status,
+        "files_done": job.files_done or 0,
+        "files_total": job.files_total or 0,
+        "progress": round(100 * (job.files_done or 0) / job.files_total, 1) if job.files_total else (100.0 if job.status == "completed" else 0.0),
+        "file_size": job.file_size,
+        "sha256": job.sha256,
+        "error": job.error,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "completed_at": job.completed_at.isoformat() if job.completed_at else None,
+        "download_url": f"/api/audit-exports/{job.download_token}" if job.status == "completed" else None,
+        "download_expires_at": job.token_expires_at.isoformat() if job.status == "completed" else None
+    }
+
+@router.post("/audits/{audit_id}/export-jobs")
+async def create_export_job(
+    audit_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Queues a background archive export. An archive already built (or being
+    built) from the current state of the audit is reused.
+    """
+    check_auditor_role(current_user)
+    
+    audit = db.query(Audit).filter(
+        Audit.id == audit_id,
+        Audit.company_id == current_user.company_id
+    ).first()
+    
+    if not audit:
+        raise HTTPException(status_code=404, detail="Audit not found")
+    
+    fingerprint = audit_fingerprint(db, audit_id)
+    job = find_reusable_job(db, audit_id, fingerprint)
+    if job:
+        return {**_export_job_status(db, job), "reused": True}
+    
+    job = AuditExportJob(
+        audit_id=audit_id,
+        company_id=audit.company_id,
+        requested_by=current_user.id,
+        status="queued",
+        fingerprint=fingerprint
+    )
+    db.add(job)
+    db.commit()
+    
+    try:
+        export_audit_archive_task.apply_async(args=[job.id])
+    except Exception as e:
+        job.status = "failed"
+        job.error = f"Could not queue export: {e}"
+        db.commit()
+        raise HTTPException(status_code=503, detail="Export queue unavailable")
+    
+    return {**_export_job_status(db, job), "reused": False}
+
+@router.get("/audits/{audit_id}/export-jobs/{job_id}")
+async def get_export_job(
+    audit_id: int,
+    job_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Progress of an export job, with a download URL once it has completed
+    """
+    check_auditor_role(current_user)
+    
+    job = db.query(AuditExportJob).filter(
+        AuditExportJob.id == job_id,
+        AuditExportJob.audit_id == audit_id,
+        AuditExportJob.company_id == current_user.company_id
+    ).first()
+    
+    if not job:
+        raise HTTPException(status_code=404, detail="Export job not found")
+    
+    return _export_job_status(db, job)
+
+@router.get("/audit-exports/{token}")
+async def download_export(token: str, request: Request, db: Session = Depends(get_db)):
+    """
+    Downloads a completed archive. The token is the credential, so download
+    managers can resume with HTTP Range requests without an auth header.
+    """
+    job = db.query(AuditExportJob).filter(
+        AuditExportJob.download_token == token,
+        AuditExportJob.status == "completed"
+    ).first()
+    
+    if not job or not job.token_expires_at or job.token_expires_at < datetime.utcnow():
+        raise HTTPException(status_code=404, detail="Download link is invalid or has expired")
+    if not os.path.exists(job.file_path):
+        raise HTTPException(status_code=410, detail="Archive is no longer available")
+    
+    # Range/If-Range requests are answered with 206 partial content
+    return serve_file(
+        request,
+        job.file_path,
+        media_type="application/zip",
+        filename=f"audit_{job.audit_id}_archive.zip",
+        disposition="attachment",
+        content_hash=job.sha256
+    )
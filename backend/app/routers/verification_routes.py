@@ -1,6 +1,6 @@
-from fastapi import APIRouter, Depends, HTTPException, Body
+from fastapi import APIRouter, Depends, HTTPException, Body, Header
 from sqlalchemy.orm import Session
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 from datetime import datetime
 import json
 from app.database import get_db
@@ -9,6 +9,7 @@ from app.models import (
     EvidenceStatus, UserRole, DocumentRequirement, Audit
 )
 from app.routers.auth import get_current_user
+from app.utils.bulk_verification import bulk_verify
 from sqlalchemy import and_, or_, func
 
 router = APIRouter()
@@ -171,6 +172,7 @@ async def get_submission_versions(
 @router.post("/submissions/bulk-verify")
 async def bulk_verify_submissions(
     verification_data: Dict[str, Any] = Body(...),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
@@ -190,52 +192,18 @@ async def bulk_verify_submissions(
     if status not in ["approved", "rejected"]:
         raise HTTPException(status_code=400, detail="Status must be 'approved' or 'rejected'")
     
-    submission_ids = verification_data["submission_ids"]
-    notes = verification_data.get("notes", "")
-    
-    # Get the submissions
-    submissions = db.query(DocumentSubmission).join(
-        DocumentRequirement
-    ).join(
-        Audit
-    ).filter(
-        DocumentSubmission.id.in_(submission_ids),
-        Audit.company_id == current_user.company_id,
-        DocumentSubmission.verification_status == EvidenceStatus.pending
-    ).all()
-    
-    if not submissions:
-        raise HTTPException(status_code=404, detail="No valid pending submissions found")
-    
-    # Process each submission
-    results = []
-    for submission in submissions:
-        # Create verification record
-        verification = DocumentVerification(
-            submission_id=submission.id,
-            verified_by=current_user.id,
-            status=EvidenceStatus.approved if status == "approved" else EvidenceStatus.rejected,
-            notes=notes,
-            verified_at=datetime.utcnow()
-        )
-        
-        db.add(verification)
-        
-        # Update submission status
-        submission.verification_status = EvidenceStatus.approved if status == "approved" else EvidenceStatus.rejected
-        
-        if status == "rejected":
-            submission.rejection_reason = notes or "No reason provided"
-        
-        results.append({
-            "id": submission.id,
-            "status": submission.verification_status.value
-        })
-    
-    db.commit()
-    
-    return {
-        "message": f"Bulk {status} completed",
-        "processed_count": len(results),
-        "results": results
-    }
+    try:
+        submission_ids = [int(submission_id) for submission_id in verification_data["submission_ids"]]
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="submission_ids must be integers")
+    
+    # Set-based: one UPDATE and one INSERT per table for the whole batch,
+    # with chain entries; unverifiable ids are reported in "failed"
+    return bulk_verify(
+        db,
+        current_user,
+        submission_ids,
+        status,
+        notes=verification_data.get("notes", ""),
+        idempotency_key=idempotency_key or verification_data.get("idempotency_key")
+    )
@@ -1,16 +1,18 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Body
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Body, Request
+from sqlalchemy.orm import Session, selectinload
 from typing import Dict, Any
 from datetime import datetime
 import traceback
 from app.database import get_db
 from app.models import User, Document, DocumentVersion
 from app.routers.auth import get_current_user
+from app.cruds.document import save_upload_file
+from app.tasks import enqueue_document_pipeline, queue_version_delta
 import os
 import shutil
 import logging
-from fastapi.responses import StreamingResponse
-from fastapi.responses import FileResponse
+from app.utils.file_serving import serve_file
+from app.utils.version_deltas import version_file
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -109,17 +111,8 @@ async def create_document_version_with_file(
         # Save the previous version's file path before updating
         previous_file_path = document.file_path
         
-        # Save the new file
-        upload_dir = os.path.dirname(document.file_path)
-        file_extension = os.path.splitext(document.file_path)[1]
-        new_filename = f"{os.path.splitext(os.path.basename(document.file_path))[0]}_v{new_version_number}{file_extension}"
-        new_file_path = os.path.join(upload_dir, new_filename)
-        
-        try:
-            with open(new_file_path, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
-        finally:
-            file.file.close()
+        # Store the new file; content identical to any stored file is not copied again
+        new_file_path, file_hash = save_upload_file(file)
         
         # Create new version record with the previous file path
         new_version = DocumentVersion(
@@ -132,12 +125,18 @@ async def create_document_version_with_file(
         
         # Update the document with the new file path
         document.file_path = new_file_path
+        document.hash_sha256 = file_hash
         document.updated_at = datetime.utcnow()
         
         db.add(new_version)
         db.commit()
         db.refresh(new_version)
         
+        # Re-extract the new file; identical content is served from the extraction cache
+        enqueue_document_pipeline(document.id, document.file_path, document.file_type)
+        # The replaced file may be re-stored as a delta against the new one
+        queue_version_delta(new_version.id, document.file_type)
+        
         return {
             "message": "Document version created successfully",
             "version": {
@@ -174,7 +173,9 @@ async def get_document_versions(
         if not document:
             raise HTTPException(status_code=404, detail="Document not found")
         
-        versions = db.query(DocumentVersion).filter(
+        versions = db.query(DocumentVersion).options(
+            selectinload(DocumentVersion.delta_record)
+        ).filter(
             DocumentVersion.document_id == document_id
         ).order_by(DocumentVersion.version_number.desc()).all()
         
@@ -184,6 +185,7 @@ async def get_document_versions(
                 "version_number": version.version_number,
                 "content": version.content,
                 "file_path": version.file_path,
+                "delta_encoded": version.delta_record is not None,
                 "created_at": version.created_at.isoformat() if version.created_at else None
             }
             for version in versions
@@ -201,6 +203,7 @@ async def get_document_versions(
 async def get_version_content(
     document_id: int,
     version_id: int,
+    request: Request,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
@@ -227,28 +230,21 @@ async def get_version_content(
         if not version:
             raise HTTPException(status_code=404, detail="Version not found")
         
-        if not version.file_path or not os.path.exists(version.file_path):
+        # Delta-stored versions are rebuilt once, then served from the cache
+        file_path, content_hash = version_file(db, document, version)
+        if not file_path or not os.path.exists(file_path):
             raise HTTPException(status_code=404, detail="Version file not found")
         
-        def iterfile():
-            with open(version.file_path, "rb") as file:
-                yield from file
-        
-        # Get the file type from the document
-        file_type = document.file_type
-        
-        # Create a filename without path components for security
-        filename = os.path.basename(version.file_path)
-        
-        headers = {
-            "Content-Disposition": f'inline; filename="{filename}"'
-        }
-        
-        return StreamingResponse(
-            iterfile(), 
-            media_type=file_type,
-            headers=headers
+        # Inline, with ETag/Range support so viewers can fetch pages lazily
+        return serve_file(
+            request,
+            file_path,
+            media_type=document.file_type,
+            filename=os.path.basename(file_path),
+            content_hash=content_hash
         )
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error getting version content: {str(e)}")
         logger.error(traceback.format_exc())
@@ -258,6 +254,7 @@ async def get_version_content(
 async def download_version(
     document_id: int,
     version_id: int,
+    request: Request,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
@@ -284,11 +281,12 @@ async def download_version(
         if not version:
             raise HTTPException(status_code=404, detail="Version not found")
         
-        if not version.file_path or not os.path.exists(version.file_path):
+        file_path, content_hash = version_file(db, document, version)
+        if not file_path or not os.path.exists(file_path):
             raise HTTPException(status_code=404, detail="Version file not found")
         
         # Create a filename without path components for security
-        filename = os.path.basename(version.file_path)
+        filename = os.path.basename(file_path)
         
         # Ensure filename has extension
         if '.' not in filename:
@@ -297,15 +295,16 @@ async def download_version(
                 ext = document.file_type.split('/')[-1]
                 filename = f"{filename}.{ext}"
         
-        headers = {
-            "Content-Disposition": f'attachment; filename="{filename}"'
-        }
-        
-        return FileResponse(
-            path=version.file_path,
-            media_type=document.file_type if document.file_type else "application/octet-stream",
-            headers=headers
+        return serve_file(
+            request,
+            file_path,
+            media_type=document.file_type,
+            filename=filename,
+            disposition="attachment",
+            content_hash=content_hash
         )
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error downloading version content: {str(e)}")
         logger.error(traceback.format_exc())
@@ -0,0 +1,52 @@
+# schema_updates.py
+#
+# Base.metadata.create_all only creates missing tables; it never adds
+# columns or indexes to a table that already exists. apply_schema_updates
+# brings an existing database up to the models with idempotent DDL and runs
+# at API startup, right after create_all:
+#   - the columns added to existing tables (ADD COLUMN IF NOT EXISTS);
+#   - every index declared on the models (CREATE INDEX IF NOT EXISTS), which
+#     covers the indexes added to existing tables.
+#
+# Documents stored before full-text search existed have no search vector
+# until they are backfilled; until then list_documents matches them by
+# title. Run the backfill once after upgrading (it is resumable) with:
+#   python -m app.schema_updates
+import logging
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+from app import models  # registers every table on Base.metadata
+from app.database import Base, SessionLocal, engine
+
+logger = logging.getLogger(__name__)
+
+ADDED_COLUMNS = (
+    "ALTER TABLE documents ADD COLUMN IF NOT EXISTS page_offsets JSON",
+    "ALTER TABLE documents ADD COLUMN IF NOT EXISTS search_vector TSVECTOR",
+)
+
+def apply_schema_updates(bind: Engine = engine):
+    """Adds missing columns and indexes; safe to run on every start."""
+    with bind.begin() as connection:
+        for statement in ADDED_COLUMNS:
+            connection.execute(text(statement))
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(connection, checkfirst=True)
+
+def backfill():
+    """Applies the schema updates, then indexes documents that have no search vector."""
+    from app.utils.document_search import rebuild_search_index
+
+    apply_schema_updates()
+    db = SessionLocal()
+    try:
+        rebuild_search_index(db, only_missing=True)
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    backfill()
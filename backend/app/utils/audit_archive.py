@@ -0,0 +1,460 @@
+# app/utils/audit_archive.py
+#
+# Streaming WORM archive of an audit. The ZIP is produced as a sequence of
+# byte chunks: zipfile writes to a non-seekable sink (entries then carry data
+# descriptors), evidence files are copied in fixed-size chunks, and audit
+# records are loaded page by page with their relationships batch-loaded, so
+# memory stays bounded whatever the audit size. Every entry's SHA-256 is
+# computed while it is written and listed in manifest.json, the last entry.
+#
+# Large audits are exported through AuditExportJob: a worker writes the same
+# stream to EXPORT_STORAGE_DIR and records progress, and the finished archive
+# is served with Range support and reused until the audit's fingerprint changes.
+import hashlib
+import json
+import os
+import zipfile
+import logging
+import secrets
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session, selectinload
+
+from app.database import SessionLocal
+from app.models import (
+    ActionItem, Audit, AuditExportJob, AuditFinding, AuditMeeting, Document, DocumentRequirement, DocumentSubmission,
+    DocumentVerification, MeetingAttendee
+)
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_CHUNK_SIZE = int(os.getenv("ARCHIVE_CHUNK_SIZE", 1024 * 1024))  # bytes
+ARCHIVE_PAGE_SIZE = int(os.getenv("ARCHIVE_PAGE_SIZE", 200))  # rows per batch
+EXPORT_STORAGE_DIR = Path(os.getenv("EXPORT_STORAGE_DIR", Path(__file__).resolve().parents[2] / "exports"))
+EXPORT_TOKEN_TTL_HOURS = int(os.getenv("EXPORT_TOKEN_TTL_HOURS", 24))
+EXPORT_PROGRESS_EVERY = 25  # evidence files between progress writes
+# A job queued or running for longer than this is assumed lost (message dropped, worker killed)
+EXPORT_JOB_STALE_MINUTES = int(os.getenv("EXPORT_JOB_STALE_MINUTES", 120))
+
+def _value(value: Any) -> Any:
+    return value.value if hasattr(value, "value") else value
+
+def _iso(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value else None
+
+def _user_ref(user) -> Optional[Dict[str, Any]]:
+    if user is None:
+        return None
+    return {"id": user.id, "name": f"{user.f_name} {user.l_name}"}
+
+class _ChunkSink:
+    """
+    Write-only, non-seekable file object that buffers what zipfile writes
+    until the generator drains it.
+    """
+    def __init__(self):
+        self._parts = []
+
+    def write(self, data: bytes) -> int:
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts = []
+        return data
+
+class _ArchiveWriter:
+    """
+    Wraps the ZipFile and records name, size and SHA-256 of every entry.
+    """
+    def __init__(self, sink: _ChunkSink):
+        self.sink = sink
+        self.zip = zipfile.ZipFile(sink, "w", zipfile.ZIP_DEFLATED)
+        self.files: List[Dict[str, Any]] = []
+
+    def open(self, name: str):
+        return _HashingEntry(self, name)
+
+    def write_json(self, name: str, data: Any):
+        with self.open(name) as entry:
+            entry.write(json.dumps(data, indent=2).encode("utf-8"))
+
+    def close(self):
+        self.zip.close()
+
+class _HashingEntry:
+    def __init__(self, writer: _ArchiveWriter, name: str, extra: Optional[Dict[str, Any]] = None):
+        self.writer = writer
+        self.name = name
+        self.extra = extra or {}
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+        self._dest = None
+
+    def __enter__(self):
+        self._dest = self.writer.zip.open(self.name, "w", force_zip64=True)
+        return self
+
+    def write(self, data: bytes):
+        self.sha256.update(data)
+        self.size += len(data)
+        self._dest.write(data)
+
+    def __exit__(self, exc_type, exc, tb):
+        self._dest.close()
+        if exc_type is None:
+            self.writer.files.append({"name": self.name, "size": self.size, "sha256": self.sha256.hexdigest(), **self.extra})
+        return False
+
+def _pages(db: Session, query, id_column, page_size: int = ARCHIVE_PAGE_SIZE):
+    # Keyset pages; the session is cleared between pages so loaded rows do
+    # not accumulate in the identity map
+    last_id = 0
+    while True:
+        rows = query.filter(id_column > last_id).order_by(id_column).limit(page_size).all()
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1].id
+        db.expunge_all()
+
+def _json_array(writer: _ArchiveWriter, name: str, pages, serialize: Callable[[Any], Dict[str, Any]]) -> Iterator[bytes]:
+    # Streams a JSON array entry page by page
+    with writer.open(name) as entry:
+        entry.write(b"[")
+        first = True
+        for rows in pages:
+            for row in rows:
+                entry.write((b"\n" if first else b",\n") + json.dumps(serialize(row), indent=2).encode("utf-8"))
+                first = False
+            yield writer.sink.drain()
+        entry.write(b"\n]" if not first else b"]")
+    yield writer.sink.drain()
+
+def _serialize_submission(sub: DocumentSubmission) -> Dict[str, Any]:
+    return {
+        "id": sub.id,
+        "requirement_id": sub.requirement_id,
+        "document_id": sub.document_id,
+        "document_title": sub.document.title if sub.document else None,
+        "status": _value(sub.verification_status),
+        "submitted_by": _user_ref(sub.submitter),
+        "submitted_at": _iso(sub.submitted_at),
+        "revision_round": sub.revision_round,
+        "hash_sha256": sub.document.hash_sha256 if sub.document else None,
+        "verifications": [
+            {
+                "id": v.id,
+                "status": _value(v.status),
+                "notes": v.notes,
+                "verified_at": _iso(v.verified_at),
+                "verified_by": _user_ref(v.verifier)
+            }
+            for v in sub.verifications
+        ]
+    }
+
+def _serialize_finding(finding: AuditFinding) -> Dict[str, Any]:
+    return {
+        "id": finding.id,
+        "title": finding.title,
+        "description": finding.description,
+        "severity": _value(finding.severity),
+        "recommendation": finding.recommendation,
+        "status": _value(finding.status),
+        "due_date": _iso(finding.due_date),
+        "created_at": _iso(finding.created_at),
+        "created_by": _user_ref(finding.creator),
+        "resolved_at": _iso(finding.resolved_at),
+        "action_items": [
+            {
+                "id": action.id,
+                "description": action.description,
+                "due_date": _iso(action.due_date),
+                "status": _value(action.status),
+                "assigned_to": _user_ref(action.assignee)
+            }
+            for action in finding.action_items
+        ]
+    }
+
+def _serialize_meeting(meeting: AuditMeeting) -> Dict[str, Any]:
+    return {
+        "id": meeting.id,
+        "meeting_type": _value(meeting.meeting_type),
+        "title": meeting.title,
+        "scheduled_time": _iso(meeting.scheduled_time),
+        "end_time": _iso(meeting.end_time),
+        "duration_minutes": meeting.duration_minutes,
+        "location": meeting.location,
+        "notes": meeting.notes,
+        "status": _value(meeting.status),
+        "attendees": [
+            {
+                "user_id": attendee.user_id,
+                "name": _user_ref(attendee.user)["name"] if attendee.user else None,
+                "is_required": attendee.is_required,
+                "has_confirmed": attendee.has_confirmed
+            }
+            for attendee in meeting.attendees
+        ],
+        "agenda_items": [
+            {
+                "position": item.order_index,
+                "title": item.title,
+                "description": item.description,
+                "time_allocation": item.time_allocation,
+                "is_completed": item.is_completed
+            }
+            for item in meeting.agenda_items
+        ]
+    }
+
+def _write_evidence(writer: _ArchiveWriter, document) -> Iterator[bytes]:
+    name = f"documents/{document.id}_{os.path.basename(document.file_path)}"
+    extra = {"document_id": document.id, "expected_sha256": document.hash_sha256}
+    try:
+        with open(document.file_path, "rb") as source, _HashingEntry(writer, name, extra) as entry:
+            while True:
+                chunk = source.read(ARCHIVE_CHUNK_SIZE)
+                if not chunk:
+                    break
+                entry.write(chunk)
+                yield writer.sink.drain()
+        if document.hash_sha256 and entry.sha256.hexdigest() != document.hash_sha256:
+            logger.warning(f"Evidence {document.id} does not match its recorded SHA-256")
+    except OSError as e:
+        # Log error but continue
+        logger.error(f"Error adding document {document.id} to archive: {str(e)}")
+
+def iter_audit_archive(
+    audit_id: int,
+    exported_by: Dict[str, Any],
+    session_factory: Callable[[], Session] = SessionLocal,
+    progress: Optional[Callable[[int, int], None]] = None
+) -> Iterator[bytes]:
+    """
+    Yields the ZIP archive of an audit chunk by chunk. Uses its own session,
+    since a streaming response outlives the request's one. `progress`, if
+    given, is called with (evidence files written, evidence files total).
+    """
+    db = session_factory()
+    sink = _ChunkSink()
+    writer = _ArchiveWriter(sink)
+    try:
+        audit = db.query(Audit).options(selectinload(Audit.creator)).filter(Audit.id == audit_id).first()
+        if audit is None:
+            raise ValueError(f"Audit {audit_id} not found")
+        audit_name = audit.name
+
+        writer.write_json("audit_metadata.json", {
+            "id": audit.id,
+            "name": audit.name,
+            "description": audit.description,
+            "scope": audit.scope,
+            "status": _value(audit.status),
+            "start_date": _iso(audit.start_date),
+            "end_date": _iso(audit.end_date),
+            "deadline": _iso(audit.deadline),
+            "is_locked": audit.is_locked,
+            "created_at": _iso(audit.created_at),
+            "created_by": {**_user_ref(audit.creator), "role": _value(audit.creator.role)} if audit.creator else None
+        })
+        yield sink.drain()
+
+        requirements = db.query(DocumentRequirement).filter(DocumentRequirement.audit_id == audit_id)
+        yield from _json_array(writer, "requirements.json", _pages(db, requirements, DocumentRequirement.id), lambda req: {
+            "id": req.id,
+            "document_type": req.document_type,
+            "required_fields": req.required_fields,
+            "validation_rules": req.validation_rules,
+            "deadline": _iso(req.deadline),
+            "is_mandatory": req.is_mandatory
+        })
+
+        submissions = db.query(DocumentSubmission).join(
+            DocumentRequirement, DocumentSubmission.requirement_id == DocumentRequirement.id
+        ).options(
+            selectinload(DocumentSubmission.document),
+            selectinload(DocumentSubmission.submitter),
+            selectinload(DocumentSubmission.verifications).selectinload(DocumentVerification.verifier)
+        ).filter(DocumentRequirement.audit_id == audit_id)
+        yield from _json_array(writer, "submissions.json", _pages(db, submissions, DocumentSubmission.id), _serialize_submission)
+
+        findings = db.query(AuditFinding).options(
+            selectinload(AuditFinding.creator),
+            selectinload(AuditFinding.action_items).selectinload(ActionItem.assignee)
+        ).filter(AuditFinding.audit_id == audit_id)
+        yield from _json_array(writer, "findings.json", _pages(db, findings, AuditFinding.id), _serialize_finding)
+
+        meetings = db.query(AuditMeeting).options(
+            selectinload(AuditMeeting.attendees).selectinload(MeetingAttendee.user),
+            selectinload(AuditMeeting.agenda_items)
+        ).filter(AuditMeeting.audit_id == audit_id)
+        yield from _json_array(writer, "meetings.json", _pages(db, meetings, AuditMeeting.id), _serialize_meeting)
+
+        # Evidence files, copied in chunks; a document submitted twice is stored once
+        evidence = db.query(Document.id, Document.file_path, Document.hash_sha256).filter(
+            Document.id.in_(
+                db.query(DocumentSubmission.document_id).join(
+                    DocumentRequirement, DocumentSubmission.requirement_id == DocumentRequirement.id
+                ).filter(DocumentRequirement.audit_id == audit_id)
+            )
+        )
+        total = evidence.count()
+        written = 0
+        if progress:
+            progress(written, total)
+        for rows in _pages(db, evidence, Document.id):
+            for document in rows:
+                if document.file_path and os.path.exists(document.file_path):
+                    yield from _write_evidence(writer, document)
+                written += 1
+                if progress:
+                    progress(written, total)
+            yield sink.drain()
+
+        # Manifest with a hash per entry, for verification without re-reading
+        writer.write_json("manifest.json", {
+            "audit_id": audit_id,
+            "audit_name": audit_name,
+            "export_timestamp": datetime.utcnow().isoformat(),
+            "exported_by": exported_by,
+            "hash_algorithm": "sha256",
+            "file_count": len(writer.files),
+            "files": writer.files
+        })
+        writer.close()
+        yield sink.drain()
+    finally:
+        db.close()
+
+# ==================== EXPORT JOBS ====================
+
+# Every row that ends up in the archive, hashed in the database so the
+# fingerprint costs one round trip and transfers no row data
+_FINGERPRINT_SQL = text("""
+    WITH reqs AS (SELECT * FROM document_requirements WHERE audit_id = :audit_id),
+         subs AS (SELECT s.* FROM document_submissions s JOIN reqs r ON r.id = s.requirement_id),
+         finds AS (SELECT * FROM audit_findings WHERE audit_id = :audit_id),
+         meets AS (SELECT * FROM audit_meetings WHERE audit_id = :audit_id)
+    SELECT md5(concat_ws('|',
+        (SELECT md5(a::text) FROM audits a WHERE a.id = :audit_id),
+        (SELECT md5(string_agg(r::text, ',' ORDER BY r.id)) FROM reqs r),
+        (SELECT md5(string_agg(s::text, ',' ORDER BY s.id)) FROM subs s),
+        (SELECT md5(string_agg(v::text, ',' ORDER BY v.id)) FROM document_verifications v JOIN subs s ON s.id = v.submission_id),
+        (SELECT md5(string_agg(d.id || ':' || coalesce(d.file_path, '') || ':' || coalesce(d.hash_sha256, ''), ',' ORDER BY d.id))
+           FROM documents d WHERE d.id IN (SELECT document_id FROM subs)),
+        (SELECT md5(string_agg(f::text, ',' ORDER BY f.id)) FROM finds f),
+        (SELECT md5(string_agg(ai::text, ',' ORDER BY ai.id)) FROM action_items ai JOIN finds f ON f.id = ai.finding_id),
+        (SELECT md5(string_agg(m::text, ',' ORDER BY m.id)) FROM meets m),
+        (SELECT md5(string_agg(ma::text, ',' ORDER BY ma.id)) FROM meeting_attendees ma JOIN meets m ON m.id = ma.meeting_id),
+        (SELECT md5(string_agg(mi::text, ',' ORDER BY mi.id)) FROM meeting_agenda_items mi JOIN meets m ON m.id = mi.meeting_id)
+    ))
+""")
+
+def audit_fingerprint(db: Session, audit_id: int) -> str:
+    """
+    Digest of the audit's archived content; it changes whenever an export of
+    the audit would differ (apart from export time and exporter).
+    """
+    return db.execute(_FINGERPRINT_SQL, {"audit_id": audit_id}).scalar()
+
+def find_reusable_job(db: Session, audit_id: int, fingerprint: str) -> Optional[AuditExportJob]:
+    """
+    Latest job of the audit built (or being built) from the same state. A
+    completed job whose archive is gone is not reused, and a queued or running
+    job older than EXPORT_JOB_STALE_MINUTES is marked failed instead.
+    """
+    jobs = db.query(AuditExportJob).filter(
+        AuditExportJob.audit_id == audit_id,
+        AuditExportJob.fingerprint == fingerprint,
+        AuditExportJob.status.in_(["queued", "running", "completed"])
+    ).order_by(AuditExportJob.id.desc()).limit(5).all()
+    stale_before = datetime.utcnow() - timedelta(minutes=EXPORT_JOB_STALE_MINUTES)
+    for job in jobs:
+        if job.status == "completed":
+            if job.file_path and os.path.exists(job.file_path):
+                return job
+        elif (job.started_at or job.created_at) < stale_before:
+            job.status = "failed"
+            job.error = f"Not finished within {EXPORT_JOB_STALE_MINUTES} minutes"
+            db.commit()
+        else:
+            return job
+    return None
+
+def issue_download_token(job: AuditExportJob):
+    job.download_token = secrets.token_urlsafe(32)
+    job.token_expires_at = datetime.utcnow() + timedelta(hours=EXPORT_TOKEN_TTL_HOURS)
+
+def build_export_job(job_id: int, session_factory: Callable[[], Session] = SessionLocal) -> Optional[str]:
+    """
+    Writes the archive of an export job to EXPORT_STORAGE_DIR, updating its
+    progress as evidence files are added. The file is written under a
+    temporary name and renamed once complete, so a crash never leaves a
+    truncated archive behind a completed job. Returns the job status.
+    """
+    db = session_factory()
+    try:
+        job = db.query(AuditExportJob).filter(AuditExportJob.id == job_id).first()
+        if job is None or job.status == "completed":
+            return job.status if job else None
+        job.status = "running"
+        job.started_at = datetime.utcnow()
+        job.files_done = 0
+        job.error = None
+        db.commit()
+
+        requester = job.requester
+        exported_by = {
+            "id": requester.id,
+            "name": f"{requester.f_name} {requester.l_name}",
+            "role": _value(requester.role)
+        } if requester else None
+
+        def progress(done: int, total: int):
+            if done in (0, total) or done % EXPORT_PROGRESS_EVERY == 0:
+                job.files_done = done
+                job.files_total = total
+                db.commit()
+
+        EXPORT_STORAGE_DIR.mkdir(parents=True, exist_ok=True)
+        path = EXPORT_STORAGE_DIR / f"audit_{job.audit_id}_{job.fingerprint}.zip"
+        partial = path.with_name(f"{path.name}.{job.id}.part")
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            with open(partial, "wb") as out:
+                for chunk in iter_audit_archive(job.audit_id, exported_by, session_factory, progress):
+                    digest.update(chunk)
+                    size += len(chunk)
+                    out.write(chunk)
+                out.flush()
+                os.fsync(out.fileno())
+            os.replace(partial, path)
+        except Exception as e:
+            if partial.exists():
+                partial.unlink()
+            job.status = "failed"
+            job.error = str(e)
+            db.commit()
+            raise
+
+        job.status = "completed"
+        job.file_path = str(path)
+        job.file_size = size
+        job.sha256 = digest.hexdigest()
+        job.completed_at = datetime.utcnow()
+        issue_download_token(job)
+        db.commit()
+        return job.status
+    finally:
+        db.close()
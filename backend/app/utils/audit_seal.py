@@ -0,0 +1,265 @@
+# app/utils/audit_seal.py
+#
+# Audit-level Merkle seal. When an audit is frozen, every evidence file hash,
+# verification chain block and finding record of the audit becomes a leaf of
+# an append-only Merkle tree (app.utils.merkle) whose root is stored in
+# audit_seals. One root then stands for the whole audit:
+#
+# - inclusion_proofs returns the O(log n) audit path of a document's
+#   evidence leaves, which anyone can check against the root without the
+#   rest of the audit;
+# - resealing appends only records that are not in the tree yet, updating
+#   the stored frontier in O(log n) per leaf instead of rebuilding it;
+# - verify_seal recomputes the leaves from the current rows, and optionally
+#   the evidence files, to report what changed since the seal.
+#
+# Interior nodes of complete subtrees are stored as they are created
+# (audit_seal_nodes), so a proof reads O(log n) rows.
+import os
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import tuple_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from app.models import (
+    AuditFinding, AuditSeal, AuditSealLeaf, AuditSealNode, Document, DocumentRequirement,
+    DocumentSubmission, DocumentVerificationChain
+)
+from app.utils.extraction_cache import compute_file_hash
+from app.utils.hash_chain import canonical_json
+from app.utils.merkle import (
+    EMPTY_ROOT, append_leaf, frontier_root, inclusion_ranges, leaf_hash, merkle_root, perfect_subtrees, range_hash
+)
+
+EVIDENCE = "evidence"
+VERIFICATION = "verification"
+FINDING = "finding"
+INSERT_BATCH_SIZE = 1000
+
+_FINDING_FIELDS = (
+    "id", "finding_id", "title", "description", "severity", "recommendation", "status", "risk_score",
+    "estimated_impact", "likelihood", "document_id", "created_by", "created_at", "resolved_at", "resolved_by"
+)
+
+def _value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return getattr(value, "value", value)
+
+# ==================== LEAVES ====================
+
+def _audit_records(db: Session, audit_id: int) -> Iterator[Tuple[str, int, Optional[int], Dict[str, Any]]]:
+    """(kind, ref_id, document_id, payload) for every sealable record, in seal order."""
+    submissions = db.query(
+        DocumentSubmission.id,
+        DocumentSubmission.requirement_id,
+        DocumentSubmission.document_id,
+        DocumentSubmission.submitted_by,
+        DocumentSubmission.submitted_at,
+        DocumentSubmission.verification_status,
+        Document.hash_sha256,
+        Document.file_path
+    ).join(
+        DocumentRequirement, DocumentSubmission.requirement_id == DocumentRequirement.id
+    ).outerjoin(
+        Document, DocumentSubmission.document_id == Document.id
+    ).filter(DocumentRequirement.audit_id == audit_id).order_by(DocumentSubmission.id)
+    for row in submissions:
+        sha256 = row.hash_sha256
+        if not sha256 and row.file_path and os.path.exists(row.file_path):
+            sha256 = compute_file_hash(row.file_path)
+        yield EVIDENCE, row.id, row.document_id, {
+            "kind": EVIDENCE,
+            "submission_id": row.id,
+            "requirement_id": row.requirement_id,
+            "document_id": row.document_id,
+            "sha256": sha256,
+            "submitted_by": row.submitted_by,
+            "submitted_at": _value(row.submitted_at),
+            "verification_status": _value(row.verification_status),
+        }
+
+    blocks = db.query(
+        DocumentVerificationChain.id,
+        DocumentVerificationChain.submission_id,
+        DocumentVerificationChain.block_number,
+        DocumentVerificationChain.current_hash,
+        DocumentSubmission.document_id
+    ).join(
+        DocumentSubmission, DocumentVerificationChain.submission_id == DocumentSubmission.id
+    ).join(
+        DocumentRequirement, DocumentSubmission.requirement_id == DocumentRequirement.id
+    ).filter(DocumentRequirement.audit_id == audit_id).order_by(DocumentVerificationChain.id)
+    for row in blocks:
+        yield VERIFICATION, row.id, row.document_id, {
+            "kind": VERIFICATION,
+            "submission_id": row.submission_id,
+            "block_number": row.block_number,
+            "hash": row.current_hash,
+        }
+
+    findings = db.query(AuditFinding).filter(AuditFinding.audit_id == audit_id).order_by(AuditFinding.id)
+    for finding in findings:
+        payload = {field: _value(getattr(finding, field)) for field in _FINDING_FIELDS}
+        payload["kind"] = FINDING
+        yield FINDING, finding.id, finding.document_id, payload
+
+def _leaf(payload: Dict[str, Any]) -> bytes:
+    return leaf_hash(canonical_json(payload).encode("utf-8"))
+
+# ==================== SEALING ====================
+
+def seal_audit(db: Session, audit_id: int, sealed_by: Optional[int] = None) -> Tuple[AuditSeal, int]:
+    """
+    Creates the audit's seal, or extends it with the records added since,
+    and returns it with the number of leaves appended. The caller commits.
+    """
+    db.execute(
+        insert(AuditSeal.__table__).values(
+            audit_id=audit_id, root_hash=EMPTY_ROOT, leaf_count=0, frontier=[],
+            sealed_by=sealed_by, sealed_at=datetime.utcnow(), updated_at=datetime.utcnow()
+        ).on_conflict_do_nothing(index_elements=["audit_id"])
+    )
+    seal = db.query(AuditSeal).filter(AuditSeal.audit_id == audit_id).with_for_update().one()
+    sealed = set(db.query(AuditSealLeaf.kind, AuditSealLeaf.ref_id).filter(AuditSealLeaf.audit_id == audit_id).all())
+
+    frontier = [bytes.fromhex(node) for node in seal.frontier]
+    size = seal.leaf_count
+    leaves, nodes = [], []
+    now = datetime.utcnow()
+    for kind, ref_id, document_id, payload in _audit_records(db, audit_id):
+        if (kind, ref_id) in sealed:
+            continue
+        completed = append_leaf(frontier, size, _leaf(payload))
+        leaves.append({
+            "audit_id": audit_id, "position": size, "kind": kind, "ref_id": ref_id,
+            "document_id": document_id, "leaf_hash": completed[0][2].hex(), "created_at": now,
+        })
+        nodes.extend(
+            {"audit_id": audit_id, "level": level, "position": position, "hash": node.hex()}
+            for level, position, node in completed[1:]
+        )
+        size += 1
+
+    for table, rows in ((AuditSealLeaf.__table__, leaves), (AuditSealNode.__table__, nodes)):
+        for start in range(0, len(rows), INSERT_BATCH_SIZE):
+            db.execute(insert(table), rows[start:start + INSERT_BATCH_SIZE])
+
+    if leaves:
+        seal.leaf_count = size
+        seal.frontier = [node.hex() for node in frontier]
+        seal.root_hash = frontier_root(frontier)
+        seal.updated_at = now
+    return seal, len(leaves)
+
+# ==================== PROOFS ====================
+
+def _load_nodes(db: Session, audit_id: int, keys: List[Tuple[int, int]]) -> Dict[Tuple[int, int], bytes]:
+    nodes = {}
+    leaf_positions = [position for level, position in keys if level == 0]
+    interior = [key for key in keys if key[0] > 0]
+    if leaf_positions:
+        for position, value in db.query(AuditSealLeaf.position, AuditSealLeaf.leaf_hash).filter(
+            AuditSealLeaf.audit_id == audit_id,
+            AuditSealLeaf.position.in_(leaf_positions)
+        ):
+            nodes[(0, position)] = bytes.fromhex(value)
+    if interior:
+        for level, position, value in db.query(AuditSealNode.level, AuditSealNode.position, AuditSealNode.hash).filter(
+            AuditSealNode.audit_id == audit_id,
+            tuple_(AuditSealNode.level, AuditSealNode.position).in_(interior)
+        ):
+            nodes[(level, position)] = bytes.fromhex(value)
+    return nodes
+
+def inclusion_proofs(db: Session, audit_id: int, document_id: int) -> Optional[Dict[str, Any]]:
+    """
+    Audit paths from each leaf of a document (its evidence, verification
+    blocks and findings) to the seal root, or None if the audit is not sealed.
+    """
+    seal = db.query(AuditSeal).filter(AuditSeal.audit_id == audit_id).first()
+    if seal is None:
+        return None
+    leaves = db.query(AuditSealLeaf).filter(
+        AuditSealLeaf.audit_id == audit_id,
+        AuditSealLeaf.document_id == document_id
+    ).order_by(AuditSealLeaf.position).all()
+
+    paths = {leaf.position: inclusion_ranges(leaf.position, seal.leaf_count) for leaf in leaves}
+    keys = {key for ranges in paths.values() for start, size in ranges for key in perfect_subtrees(start, size)}
+    nodes = _load_nodes(db, audit_id, sorted(keys))
+    return {
+        "audit_id": audit_id,
+        "document_id": document_id,
+        "root_hash": seal.root_hash,
+        "leaf_count": seal.leaf_count,
+        "proofs": [
+            {
+                "position": leaf.position,
+                "kind": leaf.kind,
+                "ref_id": leaf.ref_id,
+                "leaf_hash": leaf.leaf_hash,
+                "path": [range_hash(start, size, nodes).hex() for start, size in paths[leaf.position]],
+            }
+            for leaf in leaves
+        ],
+    }
+
+# ==================== VERIFICATION ====================
+
+def verify_seal(db: Session, audit_id: int, check_files: bool = False) -> Optional[Dict[str, Any]]:
+    """
+    Compares the sealed leaves with the audit's current records (and with
+    the evidence files themselves when `check_files` is set). Returns None
+    if the audit is not sealed.
+    """
+    seal = db.query(AuditSeal).filter(AuditSeal.audit_id == audit_id).first()
+    if seal is None:
+        return None
+    current = {}
+    for kind, ref_id, document_id, payload in _audit_records(db, audit_id):
+        current[(kind, ref_id)] = (_leaf(payload).hex(), payload)
+
+    sealed = db.query(
+        AuditSealLeaf.position, AuditSealLeaf.kind, AuditSealLeaf.ref_id, AuditSealLeaf.leaf_hash
+    ).filter(AuditSealLeaf.audit_id == audit_id).order_by(AuditSealLeaf.position).all()
+    modified, missing, file_mismatches = [], [], []
+    for leaf in sealed:
+        record = current.pop((leaf.kind, leaf.ref_id), None)
+        if record is None:
+            missing.append({"kind": leaf.kind, "ref_id": leaf.ref_id})
+        elif record[0] != leaf.leaf_hash:
+            modified.append({"kind": leaf.kind, "ref_id": leaf.ref_id})
+    if check_files:
+        file_mismatches = _check_evidence_files(db, audit_id)
+
+    root = merkle_root([bytes.fromhex(leaf.leaf_hash) for leaf in sealed])
+    root_matches = root == seal.root_hash and len(sealed) == seal.leaf_count
+    return {
+        "audit_id": audit_id,
+        "valid": root_matches and not modified and not missing and not file_mismatches,
+        "root_hash": seal.root_hash,
+        "root_matches": root_matches,
+        "leaf_count": seal.leaf_count,
+        "modified": modified,
+        "missing": missing,
+        "file_mismatches": file_mismatches,
+        "unsealed_records": len(current),
+    }
+
+def _check_evidence_files(db: Session, audit_id: int) -> List[Dict[str, Any]]:
+    mismatches = []
+    rows = db.query(AuditSealLeaf.ref_id, Document.id, Document.hash_sha256, Document.file_path).join(
+        Document, AuditSealLeaf.document_id == Document.id
+    ).filter(
+        AuditSealLeaf.audit_id == audit_id,
+        AuditSealLeaf.kind == EVIDENCE
+    )
+    for submission_id, document_id, sha256, file_path in rows:
+        if not file_path or not os.path.exists(file_path):
+            mismatches.append({"submission_id": submission_id, "document_id": document_id, "reason": "missing file"})
+        elif sha256 and compute_file_hash(file_path) != sha256:
+            mismatches.append({"submission_id": submission_id, "document_id": document_id, "reason": "content changed"})
+    return mismatches
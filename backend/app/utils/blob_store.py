@@ -0,0 +1,328 @@
+# app/utils/blob_store.py
+#
+# Content-addressed storage for uploaded files. A file is stored once under
+# uploads/blobs/<sha[:2]>/<sha[2:4]>/<sha><ext>, however many documents,
+# versions or audits it is uploaded to; Document.file_path and
+# DocumentVersion.file_path point at the shared blob.
+#
+# file_blobs.ref_count counts the Document and DocumentVersion rows that
+# reference each blob. A session after_flush hook keeps it current from the
+# file_path changes of every flush, in the same transaction, so any code path
+# that assigns, replaces or deletes a file path is counted. Blobs are only
+# removed by collect_garbage, for files that are unreferenced and have not
+# been (re)used for BLOB_GC_GRACE_SECONDS. adopt() and the collector both
+# hold the blob's row lock while they look at or touch its file, so a blob
+# that is being reused is never deleted underneath the upload.
+#
+# Files stored before the blob store existed keep their paths; they can be
+# moved in with import_legacy_files, which hard-links (or reflinks) them.
+import fcntl
+import hashlib
+import os
+import shutil
+import time
+import uuid
+import logging
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import event, inspect
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal
+from app.models import Document, DocumentVersion, FileBlob
+
+logger = logging.getLogger(__name__)
+
+BLOB_ROOT = os.getenv("BLOB_STORE_DIR", os.path.join("uploads", "blobs"))
+STAGING_DIR = os.path.join(BLOB_ROOT, "staging")
+BLOB_GC_GRACE_SECONDS = int(os.getenv("BLOB_GC_GRACE_SECONDS", 3600))
+GC_BATCH_SIZE = 500
+HASH_CHUNK_SIZE = 1024 * 1024
+FICLONE = 0x40049409  # Linux ioctl: share extents copy-on-write (btrfs, XFS)
+
+def _blob_dir(sha256: str) -> str:
+    return os.path.join(BLOB_ROOT, sha256[:2], sha256[2:4])
+
+def sha_for_path(path: Optional[str]) -> Optional[str]:
+    """
+    The content hash a stored path refers to, or None for paths outside the
+    blob store (files stored before it existed).
+    """
+    if not path:
+        return None
+    root = os.path.normpath(BLOB_ROOT) + os.sep
+    normalized = os.path.normpath(path)
+    if not normalized.startswith(root) or normalized.startswith(os.path.normpath(STAGING_DIR) + os.sep):
+        return None
+    stem = os.path.basename(normalized).split(".", 1)[0]
+    if len(stem) == 64 and all(c in "0123456789abcdef" for c in stem):
+        return stem
+    return None
+
+def _existing_blob(sha256: str) -> Optional[str]:
+    directory = _blob_dir(sha256)
+    try:
+        for name in os.listdir(directory):
+            if name.split(".", 1)[0] == sha256:
+                return os.path.join(directory, name)
+    except FileNotFoundError:
+        pass
+    return None
+
+def staging_path(filename: str) -> str:
+    """
+    Temporary path for an upload that is being written and hashed; hand the
+    result to adopt().
+    """
+    os.makedirs(STAGING_DIR, exist_ok=True)
+    return os.path.join(STAGING_DIR, f"{uuid.uuid4().hex}{os.path.splitext(filename)[1].lower()}")
+
+def _lock_blob_rows(db: Session, blobs: Dict[str, Tuple[str, Optional[int]]]):
+    """
+    Creates any missing file_blobs rows from {sha256: (path, size)}, with no
+    references, and locks all of them in key order.
+    """
+    now = datetime.utcnow()
+    statement = insert(FileBlob.__table__)
+    db.execute(
+        statement.on_conflict_do_update(
+            index_elements=["sha256"],
+            set_={"updated_at": statement.excluded.updated_at}
+        ),
+        [
+            {"sha256": sha256, "path": path, "size": size, "ref_count": 0, "created_at": now, "updated_at": now}
+            for sha256, (path, size) in sorted(blobs.items())
+        ]
+    )
+
+def adopt(staged: str, sha256: str, filename: str = "") -> str:
+    """
+    Moves a staged file into the store and returns its blob path. If the
+    content is already stored the staged copy is dropped instead.
+    """
+    extension = os.path.splitext(filename or staged)[1].lower()
+    destination = os.path.join(_blob_dir(sha256), f"{sha256}{extension}")
+    db = SessionLocal()
+    try:
+        # Held until commit: collect_garbage takes the same lock before it
+        # re-checks the mtime and deletes
+        _lock_blob_rows(db, {sha256: (destination, os.path.getsize(staged))})
+        existing = _existing_blob(sha256)
+        if existing:
+            os.utime(existing)
+            os.remove(staged)
+            db.commit()
+            return existing
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        os.replace(staged, destination)
+        os.chmod(destination, 0o444)  # shared content is never modified in place
+        db.commit()
+        return destination
+    finally:
+        db.close()
+
+def _clone(source: str, destination: str):
+    # Hard link, else a copy-on-write clone, else a plain copy
+    try:
+        os.link(source, destination)
+        return
+    except OSError:
+        pass
+    try:
+        with open(source, "rb") as src, open(destination, "wb") as dst:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        return
+    except OSError:
+        pass
+    shutil.copyfile(source, destination)
+
+def import_file(path: str, sha256: Optional[str] = None) -> str:
+    """
+    Brings an existing file into the store without copying its data where
+    the filesystem allows it. The original file is left in place.
+    """
+    if sha256 is None:
+        digest = hashlib.sha256()
+        with open(path, "rb") as source:
+            for chunk in iter(lambda: source.read(HASH_CHUNK_SIZE), b""):
+                digest.update(chunk)
+        sha256 = digest.hexdigest()
+    staged = staging_path(path)
+    _clone(path, staged)
+    return adopt(staged, sha256, path)
+
+# ==================== REFERENCE COUNTS ====================
+
+def apply_ref_deltas(connection, deltas: Dict[str, int], paths: Dict[str, str]):
+    """
+    Adds {sha256: delta} to the stored reference counts, creating rows for
+    new blobs. Rows are written in key order so writers never deadlock.
+    """
+    now = datetime.utcnow()
+    rows = []
+    for sha256, delta in sorted(deltas.items()):
+        if not delta:
+            continue
+        path = paths[sha256]
+        rows.append({
+            "sha256": sha256,
+            "path": path,
+            "size": os.path.getsize(path) if os.path.exists(path) else None,
+            "ref_count": delta,
+            "created_at": now,
+            "updated_at": now,
+        })
+    if not rows:
+        return
+    statement = insert(FileBlob.__table__)
+    connection.execute(
+        statement.on_conflict_do_update(
+            index_elements=["sha256"],
+            set_={
+                "ref_count": FileBlob.__table__.c.ref_count + statement.excluded.ref_count,
+                "updated_at": statement.excluded.updated_at,
+            }
+        ),
+        rows
+    )
+
+@event.listens_for(Session, "after_flush")
+def _count_blob_references(session: Session, flush_context):
+    deltas = defaultdict(int)
+    paths = {}
+
+    def count(path: Optional[str], sign: int):
+        sha256 = sha_for_path(path)
+        if sha256:
+            deltas[sha256] += sign
+            paths.setdefault(sha256, path)
+
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if not isinstance(obj, (Document, DocumentVersion)):
+            continue
+        history = inspect(obj).attrs.file_path.history
+        if obj in session.new:
+            count(obj.file_path, 1)
+        elif obj in session.deleted:
+            count((history.deleted or history.unchanged or [obj.file_path])[0], -1)
+        elif history.has_changes():
+            for path in history.deleted:
+                count(path, -1)
+            for path in history.added:
+                count(path, 1)
+
+    if deltas:
+        apply_ref_deltas(session.connection(), deltas, paths)
+
+# ==================== GARBAGE COLLECTION ====================
+
+def _collect_batch(db: Session, candidates: Dict[str, list], cutoff: float) -> int:
+    # Blobs left by failed uploads have no row yet; create one so that
+    # adopt() reusing such a blob waits for this batch too
+    _lock_blob_rows(db, {sha256: (files[0], None) for sha256, files in candidates.items()})
+    rows = {
+        row.sha256: row for row in db.query(FileBlob).filter(
+            FileBlob.sha256.in_(list(candidates))
+        ).order_by(FileBlob.sha256).with_for_update().all()
+    }
+    removed = 0
+    for sha256, files in candidates.items():
+        row = rows.get(sha256)
+        if row is not None and row.ref_count > 0:
+            continue
+        for path in files:
+            try:
+                # Re-checked under the row lock, which adopt() holds while it reuses a blob
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    removed += 1
+            except OSError as e:
+                logger.error(f"Error deleting blob {path}: {e}")
+        if row is not None and not _existing_blob(sha256):
+            db.delete(row)
+    db.commit()
+    return removed
+
+def collect_garbage(db: Session, grace_seconds: int = BLOB_GC_GRACE_SECONDS) -> Dict[str, int]:
+    """
+    Deletes blobs that no document or version references (including files
+    left by failed uploads) once they are older than the grace period, plus
+    stale staging files.
+    """
+    cutoff = time.time() - grace_seconds
+    candidates = defaultdict(list)
+    removed = staged = 0
+    for directory, subdirectories, names in os.walk(BLOB_ROOT):
+        for name in names:
+            path = os.path.join(directory, name)
+            try:
+                if os.path.getmtime(path) >= cutoff:
+                    continue
+                if os.path.normpath(directory) == os.path.normpath(STAGING_DIR):
+                    os.remove(path)
+                    staged += 1
+                    continue
+            except OSError:
+                continue
+            sha256 = sha_for_path(path)
+            if sha256:
+                candidates[sha256].append(path)
+            if len(candidates) >= GC_BATCH_SIZE:
+                removed += _collect_batch(db, candidates, cutoff)
+                candidates = defaultdict(list)
+    if candidates:
+        removed += _collect_batch(db, candidates, cutoff)
+    return {"blobs_removed": removed, "staging_files_removed": staged}
+
+def import_legacy_files(db: Session, company_id: int, batch_size: int = 200) -> int:
+    """
+    Moves a company's documents and versions stored outside the blob store
+    into it (duplicates collapse into one blob) and deletes the old files
+    once no row points at them. Returns the number of rows moved.
+    """
+    moved = 0
+    for model in (Document, DocumentVersion):
+        owner = Document.company_id == company_id
+        query = db.query(model).filter(
+            model.file_path.isnot(None),
+            ~model.file_path.like(os.path.join(BLOB_ROOT, "%"))
+        )
+        query = query.filter(owner) if model is Document else query.join(Document, DocumentVersion.document_id == Document.id).filter(owner)
+        last_id = 0
+        while True:
+            rows = query.filter(model.id > last_id).order_by(model.id).limit(batch_size).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+            old_paths = set()
+            for row in rows:
+                if not os.path.exists(row.file_path):
+                    continue
+                old_paths.add(row.file_path)
+                row.file_path = import_file(row.file_path)
+                moved += 1
+            db.commit()
+            remove_unreferenced_files(db, old_paths)
+    return moved
+
+def remove_unreferenced_files(db: Session, paths: Iterable[str]):
+    """
+    Deletes files stored outside the blob store once no document or version
+    points at them.
+    """
+    paths = list(paths)
+    if not paths:
+        return
+    referenced = {
+        path for (path,) in db.query(Document.file_path).filter(Document.file_path.in_(paths)).all()
+    } | {
+        path for (path,) in db.query(DocumentVersion.file_path).filter(DocumentVersion.file_path.in_(paths)).all()
+    }
+    for path in set(paths) - referenced:
+        try:
+            os.remove(path)
+        except OSError as e:
+            logger.error(f"Error deleting legacy file {path}: {e}")
@@ -0,0 +1,241 @@
+# app/utils/bulk_verification.py
+#
+# Set-based verification of many submissions in one transaction. Instead of
+# loading and saving each submission through the ORM, a call:
+#
+# 1. locks the caller's submissions with one SELECT ... FOR UPDATE and sorts
+#    out the ones it cannot verify (unknown, other company, not pending);
+# 2. moves the rest to the new status with one UPDATE;
+# 3. records their verifications with one INSERT ... SELECT ... RETURNING;
+# 4. appends their verification chain blocks, audit trail entries and
+#    workflow entries with multi-row INSERTs, hashing the links in one pass
+#    over the chain tips (app.utils.hash_chain);
+# 5. applies the dashboard counter deltas and, after commit, the domain
+#    events that the ORM hooks would have produced for these writes.
+#
+# With an idempotency key the outcome is stored with the request's hash:
+# retrying the same request returns the stored outcome instead of verifying
+# again, and reusing the key for a different request is rejected.
+import hashlib
+import os
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+from fastapi import HTTPException
+from sqlalchemy import insert as core_insert, literal, select, true, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from app.models import (
+    ActorType, Audit, BulkVerificationRequest, DocumentRequirement, DocumentSubmission,
+    DocumentSubmissionWorkflow, DocumentVerification, EvidenceStatus, WorkflowStage
+)
+from app.utils import domain_events, hash_chain, kpi_store
+
+BULK_VERIFY_MAX_SUBMISSIONS = int(os.getenv("BULK_VERIFY_MAX_SUBMISSIONS", 5000))
+
+STATUSES = {"approved": EvidenceStatus.approved, "rejected": EvidenceStatus.rejected}
+STAGES = {EvidenceStatus.approved: WorkflowStage.approved, EvidenceStatus.rejected: WorkflowStage.rejected}
+
+def _request_hash(submission_ids: List[int], status: str, notes: str) -> str:
+    body = {"submission_ids": submission_ids, "status": status, "notes": notes}
+    return hashlib.sha256(hash_chain.canonical_json(body).encode("utf-8")).hexdigest()
+
+def _claim_key(db: Session, current_user, idempotency_key: str, request_hash: str) -> Optional[Dict[str, Any]]:
+    """
+    Claims an idempotency key for this call, or returns the stored outcome
+    of the earlier call that used it. A concurrent call with the same key
+    waits here until the first one commits or rolls back.
+    """
+    claimed = db.execute(
+        insert(BulkVerificationRequest.__table__).values(
+            company_id=current_user.company_id,
+            requested_by=current_user.id,
+            idempotency_key=idempotency_key,
+            request_hash=request_hash,
+            created_at=datetime.utcnow()
+        ).on_conflict_do_nothing(
+            index_elements=["company_id", "idempotency_key"]
+        ).returning(BulkVerificationRequest.__table__.c.id)
+    ).scalar()
+    if claimed is not None:
+        return None
+    previous = db.query(BulkVerificationRequest).filter(
+        BulkVerificationRequest.company_id == current_user.company_id,
+        BulkVerificationRequest.idempotency_key == idempotency_key
+    ).one()
+    if previous.request_hash != request_hash:
+        raise HTTPException(status_code=409, detail="Idempotency key was already used for a different request")
+    return {**previous.response, "replayed": True}
+
+def _kpi_deltas(rows, new_status: EvidenceStatus, new_stage: WorkflowStage) -> Dict:
+    # What the after_flush hook would have computed for these updates
+    deltas = defaultdict(float)
+    for row in rows:
+        old = {attribute: getattr(row, attribute) for attribute in kpi_store.SUBMISSION_ATTRIBUTES}
+        new = {**old, "verification_status": new_status, "workflow_stage": new_stage}
+        for key, value in kpi_store.submission_counters(old, row.deadline).items():
+            deltas[(row.company_id,) + key] -= value
+        for key, value in kpi_store.submission_counters(new, row.deadline).items():
+            deltas[(row.company_id,) + key] += value
+    return deltas
+
+def bulk_verify(
+    db: Session,
+    current_user,
+    submission_ids: Iterable[int],
+    status: str,
+    notes: str = "",
+    idempotency_key: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Approves or rejects the pending submissions among `submission_ids` and
+    commits. Submissions that cannot be verified are reported per id in
+    "failed" and do not stop the others.
+    """
+    new_status = STATUSES.get(status)
+    if new_status is None:
+        raise HTTPException(status_code=400, detail="Status must be 'approved' or 'rejected'")
+    submission_ids = sorted({int(submission_id) for submission_id in submission_ids})
+    if len(submission_ids) > BULK_VERIFY_MAX_SUBMISSIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many submissions: {len(submission_ids)} (limit {BULK_VERIFY_MAX_SUBMISSIONS})"
+        )
+
+    if idempotency_key:
+        replay = _claim_key(db, current_user, idempotency_key, _request_hash(submission_ids, status, notes))
+        if replay is not None:
+            db.rollback()
+            return replay
+
+    rows = db.query(
+        DocumentSubmission.id,
+        DocumentSubmission.requirement_id,
+        DocumentSubmission.verification_status,
+        DocumentSubmission.workflow_stage,
+        DocumentSubmission.revision_round,
+        DocumentSubmission.submitted_at,
+        DocumentSubmission.ai_validation_score,
+        DocumentRequirement.deadline,
+        Audit.company_id
+    ).join(
+        DocumentRequirement, DocumentSubmission.requirement_id == DocumentRequirement.id
+    ).join(
+        Audit, DocumentRequirement.audit_id == Audit.id
+    ).filter(
+        DocumentSubmission.id.in_(submission_ids),
+        Audit.company_id == current_user.company_id
+    ).order_by(DocumentSubmission.id).with_for_update(of=DocumentSubmission).all()
+
+    found = {row.id for row in rows}
+    failed = [{"id": submission_id, "reason": "not_found"} for submission_id in submission_ids if submission_id not in found]
+    failed.extend(
+        {"id": row.id, "reason": "not_pending", "status": row.verification_status.value if row.verification_status else None}
+        for row in rows if row.verification_status != EvidenceStatus.pending
+    )
+    eligible = [row for row in rows if row.verification_status == EvidenceStatus.pending]
+    if not eligible:
+        raise HTTPException(status_code=404, detail="No valid pending submissions found")
+
+    eligible_ids = [row.id for row in eligible]
+    new_stage = STAGES[new_status]
+    now = datetime.utcnow()
+
+    values = {
+        "verification_status": new_status,
+        "workflow_stage": new_stage,
+        "reviewed_at": now,
+        "reviewed_by": current_user.id,
+    }
+    if new_status == EvidenceStatus.rejected:
+        values["rejection_reason"] = notes or "No reason provided"
+    db.execute(
+        update(DocumentSubmission.__table__).where(DocumentSubmission.__table__.c.id.in_(eligible_ids)).values(**values)
+    )
+
+    verifications = DocumentVerification.__table__
+    verification_ids = {
+        submission_id: verification_id for verification_id, submission_id in db.execute(
+            core_insert(verifications).from_select(
+                ["submission_id", "verified_by", "status", "notes", "verified_at", "is_immutable"],
+                select(
+                    DocumentSubmission.id,
+                    literal(current_user.id),
+                    literal(new_status, verifications.c.status.type),
+                    literal(notes, verifications.c.notes.type),
+                    literal(now, verifications.c.verified_at.type),
+                    true()
+                ).where(DocumentSubmission.id.in_(eligible_ids)).order_by(DocumentSubmission.id)
+            ).returning(verifications.c.id, verifications.c.submission_id)
+        )
+    }
+
+    blocks = hash_chain.append_verification_blocks(db, [
+        (row.id, verification_ids[row.id], {
+            "submission_id": row.id,
+            "verified_by": current_user.id,
+            "status": new_status.value,
+            "notes": notes,
+            "quality_score": None,
+            "timestamp": now.isoformat(),
+            "ai_validation_score": row.ai_validation_score
+        })
+        for row in eligible
+    ])
+    hash_chain.append_trail_entries(db, [
+        {
+            "submission_id": row.id,
+            "action": f"document_{new_status.value}",
+            "actor_id": current_user.id,
+            "actor_type": ActorType.user,
+            "details": {"status": new_status.value, "notes": notes, "verification_hash": current_hash, "bulk": True},
+            "timestamp": now,
+        }
+        for row, (_, current_hash) in zip(eligible, blocks)
+    ])
+    db.execute(core_insert(DocumentSubmissionWorkflow.__table__), [
+        {
+            "submission_id": row.id,
+            "stage": new_stage,
+            "status": new_status.value,
+            "performer_id": current_user.id,
+            "performer_type": ActorType.user,
+            "notes": notes,
+            "automated": False,
+            "created_at": now,
+        }
+        for row in eligible
+    ])
+    kpi_store.apply_deltas(db.connection(), _kpi_deltas(eligible, new_status, new_stage))
+
+    results = [
+        {
+            "id": row.id,
+            "status": new_status.value,
+            "verification_id": verification_ids[row.id],
+            "block_number": block_number,
+            "hash": current_hash,
+        }
+        for row, (block_number, current_hash) in zip(eligible, blocks)
+    ]
+    response = {
+        "message": f"Bulk {status} completed",
+        "processed_count": len(results),
+        "failed_count": len(failed),
+        "results": results,
+        "failed": sorted(failed, key=lambda failure: failure["id"]),
+    }
+    if idempotency_key:
+        db.execute(
+            update(BulkVerificationRequest.__table__).where(
+                BulkVerificationRequest.__table__.c.company_id == current_user.company_id,
+                BulkVerificationRequest.__table__.c.idempotency_key == idempotency_key
+            ).values(response=response)
+        )
+    db.commit()
+
+    # The Core writes above bypass the ORM hooks that would queue this event
+    domain_events.emit(domain_events.VERIFICATION_RECORDED, current_user.company_id)
+    return response
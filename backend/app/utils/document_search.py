@@ -0,0 +1,157 @@
+# app/utils/document_search.py
+#
+# Full-text search over documents backed by a PostgreSQL tsvector column
+# (documents.search_vector, GIN-indexed). The vector is weighted
+# title (A) > metadata (B) > extracted JSON (C) > raw text (D) and is
+# refreshed whenever one of those sources changes.
+import os
+import logging
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import Text, and_, cast, func, or_, text
+from sqlalchemy.dialects.postgresql import REGCONFIG
+from sqlalchemy.orm import Session
+
+from app.models import Document
+
+logger = logging.getLogger(__name__)
+
+SEARCH_CONFIG = os.getenv("DOCUMENT_SEARCH_CONFIG", "english")
+# tsvector values are capped at 1 MB, so very long texts are indexed by prefix
+MAX_INDEXED_CHARS = int(os.getenv("DOCUMENT_SEARCH_MAX_CHARS", 500000))
+SNIPPET_SOURCE_CHARS = int(os.getenv("DOCUMENT_SEARCH_SNIPPET_CHARS", 100000))
+HEADLINE_OPTIONS = "StartSel=<mark>, StopSel=</mark>, MaxFragments=2, MaxWords=30, MinWords=10, FragmentDelimiter=\" ... \""
+TITLE_HEADLINE_OPTIONS = "StartSel=<mark>, StopSel=</mark>, HighlightAll=true"
+
+_SEARCH_VECTOR_EXPRESSION = """
+    setweight(to_tsvector(CAST(:config AS regconfig), coalesce(documents.title, '')), 'A') ||
+    setweight(to_tsvector(CAST(:config AS regconfig), coalesce((
+        SELECT string_agg(dm.key || ' ' || dm.value, ' ')
+        FROM document_metadata dm
+        WHERE dm.document_id = documents.id
+    ), '')), 'B') ||
+    setweight(to_tsvector(CAST(:config AS regconfig), left(coalesce(CAST(documents.content AS text), ''), :max_chars)), 'C') ||
+    setweight(to_tsvector(CAST(:config AS regconfig), left(coalesce(documents.raw_content, ''), :max_chars)), 'D')
+"""
+
+def refresh_search_vector(db: Session, document_id: int, commit: bool = True):
+    """
+    Recomputes the search vector of one document from its current title,
+    metadata, extracted content and raw text.
+    """
+    db.execute(
+        text(f"UPDATE documents SET search_vector = {_SEARCH_VECTOR_EXPRESSION} WHERE documents.id = :document_id"),
+        {"config": SEARCH_CONFIG, "max_chars": MAX_INDEXED_CHARS, "document_id": document_id}
+    )
+    if commit:
+        db.commit()
+
+def refresh_search_vectors(db: Session, document_ids: List[int], commit: bool = True):
+    """
+    refresh_search_vector for many documents in one statement.
+    """
+    if document_ids:
+        db.execute(
+            text(f"UPDATE documents SET search_vector = {_SEARCH_VECTOR_EXPRESSION} WHERE documents.id = ANY(:document_ids)"),
+            {"config": SEARCH_CONFIG, "max_chars": MAX_INDEXED_CHARS, "document_ids": list(document_ids)}
+        )
+    if commit:
+        db.commit()
+
+def rebuild_search_index(db: Session, only_missing: bool = True, batch_size: int = 500) -> int:
+    """
+    Backfills search vectors in batches (all documents, or only those that
+    were never indexed). Returns the number of documents updated.
+    """
+    condition = "documents.search_vector IS NULL" if only_missing else "TRUE"
+    updated = 0
+    last_id = 0
+    while True:
+        ids = [row[0] for row in db.execute(
+            text(f"SELECT id FROM documents WHERE {condition} AND id > :last_id ORDER BY id LIMIT :batch_size"),
+            {"last_id": last_id, "batch_size": batch_size}
+        )]
+        if not ids:
+            break
+        db.execute(
+            text(f"UPDATE documents SET search_vector = {_SEARCH_VECTOR_EXPRESSION} WHERE documents.id >= :first_id AND documents.id <= :last_id AND {condition}"),
+            {"config": SEARCH_CONFIG, "max_chars": MAX_INDEXED_CHARS, "first_id": ids[0], "last_id": ids[-1]}
+        )
+        db.commit()
+        updated += len(ids)
+        last_id = ids[-1]
+    logger.info(f"Rebuilt search vectors for {updated} documents")
+    return updated
+
+def _config():
+    return cast(SEARCH_CONFIG, REGCONFIG)
+
+def search_query(search: str):
+    """
+    tsquery for user input; websearch syntax supports quotes, OR and -term.
+    """
+    return func.websearch_to_tsquery(_config(), search)
+
+def search_filter(search: str):
+    """
+    WHERE clause matching documents against `search` via the GIN index.
+    Documents not indexed yet (stored before search vectors existed and not
+    backfilled) are matched on their title, as the old search did.
+    """
+    return or_(
+        Document.search_vector.op("@@")(search_query(search)),
+        and_(Document.search_vector.is_(None), Document.title.ilike(f"%{search}%"))
+    )
+
+def search_documents(
+    db: Session,
+    company_id: int,
+    search: str,
+    limit: int = 20,
+    offset: int = 0,
+    file_type: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Ranked full-text search within a company. Highlighted snippets are built
+    in a second query for the returned page only, since ts_headline re-parses
+    the source text.
+    """
+    tsquery = search_query(search)
+    rank = func.ts_rank_cd(Document.search_vector, tsquery, 32).label("rank")
+
+    query = db.query(Document.id, Document.title, Document.file_type, Document.created_at, rank).filter(
+        Document.company_id == company_id,
+        Document.is_deleted == False,
+        Document.search_vector.op("@@")(tsquery)
+    )
+    if file_type:
+        query = query.filter(Document.file_type == file_type)
+
+    rows = query.order_by(rank.desc(), Document.id.desc()).offset(offset).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    highlights = {}
+    if rows:
+        source = func.left(func.coalesce(Document.raw_content, cast(Document.content, Text), ""), SNIPPET_SOURCE_CHARS)
+        highlights = {
+            row.id: row for row in db.query(
+                Document.id,
+                func.ts_headline(_config(), source, tsquery, HEADLINE_OPTIONS).label("snippet"),
+                func.ts_headline(_config(), Document.title, tsquery, TITLE_HEADLINE_OPTIONS).label("title")
+            ).filter(Document.id.in_([row.id for row in rows])).all()
+        }
+
+    results: List[Dict[str, Any]] = [
+        {
+            "id": row.id,
+            "title": row.title,
+            "title_highlighted": highlights[row.id].title if row.id in highlights else row.title,
+            "file_type": row.file_type,
+            "created_at": row.created_at.isoformat() if row.created_at else None,
+            "rank": round(float(row.rank or 0), 6),
+            "snippet": highlights[row.id].snippet if row.id in highlights else ""
+        }
+        for row in rows
+    ]
+    return {"results": results, "limit": limit, "offset": offset, "has_more": has_more}
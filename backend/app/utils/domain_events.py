@@ -0,0 +1,134 @@
+# app/utils/domain_events.py
+#
+# Lightweight domain events ("submission.created", "verification.recorded",
+# "finding.updated", ...) scoped to a company. Events are derived from the
+# rows written in each ORM flush and dispatched only after the transaction
+# commits, so subscribers never act on data that is later rolled back.
+# Writes that bypass the ORM call emit() directly after committing.
+import logging
+from collections import defaultdict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from sqlalchemy import event, inspect, text
+from sqlalchemy.orm import Session
+
+from app.models import (
+    Audit, AuditFinding, Document, DocumentRequirement, DocumentSubmission, DocumentVerification,
+    DocumentVersion, DocumentWorkflow, WorkflowExecutionHistory
+)
+
+logger = logging.getLogger(__name__)
+
+SUBMISSION_CREATED = "submission.created"
+SUBMISSION_UPDATED = "submission.updated"
+VERIFICATION_RECORDED = "verification.recorded"
+FINDING_UPDATED = "finding.updated"
+AUDIT_UPDATED = "audit.updated"
+REQUIREMENT_UPDATED = "requirement.updated"
+DOCUMENT_UPDATED = "document.updated"
+WORKFLOW_UPDATED = "workflow.updated"
+
+ALL_EVENTS = (
+    SUBMISSION_CREATED, SUBMISSION_UPDATED, VERIFICATION_RECORDED, FINDING_UPDATED,
+    AUDIT_UPDATED, REQUIREMENT_UPDATED, DOCUMENT_UPDATED, WORKFLOW_UPDATED
+)
+
+_handlers = defaultdict(list)
+
+def subscribe(event_name: str, handler: Callable[[int, str], Any]):
+    """
+    Registers handler(company_id, event_name) for an event.
+    """
+    if handler not in _handlers[event_name]:
+        _handlers[event_name].append(handler)
+
+def emit(event_name: str, company_id: Optional[int]):
+    """
+    Dispatches an event to its subscribers. Handler failures are logged and
+    never propagate to the writer.
+    """
+    if company_id is None:
+        return
+    for handler in list(_handlers.get(event_name, ())):
+        try:
+            handler(company_id, event_name)
+        except Exception as e:
+            logger.warning(f"Handler for {event_name} (company {company_id}) failed: {e}")
+
+# ==================== ORM-DERIVED EVENTS ====================
+
+_OWNER_COMPANY_SQL = {
+    "audit": "SELECT company_id FROM audits WHERE id = :id",
+    "requirement": (
+        "SELECT a.company_id FROM document_requirements r "
+        "JOIN audits a ON a.id = r.audit_id WHERE r.id = :id"
+    ),
+    "submission": (
+        "SELECT a.company_id FROM document_submissions s "
+        "JOIN document_requirements r ON r.id = s.requirement_id "
+        "JOIN audits a ON a.id = r.audit_id WHERE s.id = :id"
+    ),
+    "document": "SELECT company_id FROM documents WHERE id = :id",
+    "document_workflow": (
+        "SELECT d.company_id FROM document_workflows w "
+        "JOIN documents d ON d.id = w.document_id WHERE w.id = :id"
+    ),
+}
+
+def _submission_event(obj, is_new: bool) -> str:
+    if is_new:
+        return SUBMISSION_CREATED
+    if inspect(obj).attrs.verification_status.history.has_changes():
+        return VERIFICATION_RECORDED
+    return SUBMISSION_UPDATED
+
+# model -> (event for a written row, owner kind, owner key attribute)
+TRACKED_MODELS: Dict[type, Tuple[Callable[[Any, bool], str], str, str]] = {
+    DocumentSubmission: (_submission_event, "requirement", "requirement_id"),
+    DocumentVerification: (lambda obj, is_new: VERIFICATION_RECORDED, "submission", "submission_id"),
+    AuditFinding: (lambda obj, is_new: FINDING_UPDATED, "audit", "audit_id"),
+    DocumentRequirement: (lambda obj, is_new: REQUIREMENT_UPDATED, "audit", "audit_id"),
+    Audit: (lambda obj, is_new: AUDIT_UPDATED, "self", "company_id"),
+    Document: (lambda obj, is_new: DOCUMENT_UPDATED, "self", "company_id"),
+    DocumentVersion: (lambda obj, is_new: DOCUMENT_UPDATED, "document", "document_id"),
+    DocumentWorkflow: (lambda obj, is_new: WORKFLOW_UPDATED, "document", "document_id"),
+    WorkflowExecutionHistory: (lambda obj, is_new: WORKFLOW_UPDATED, "document_workflow", "document_workflow_id"),
+}
+
+def _owner_company(connection, cache: Dict, kind: str, key: Any) -> Optional[int]:
+    if key is None:
+        return None
+    if kind == "self":
+        return key
+    if (kind, key) not in cache:
+        cache[(kind, key)] = connection.execute(text(_OWNER_COMPANY_SQL[kind]), {"id": key}).scalar()
+    return cache[(kind, key)]
+
+@event.listens_for(Session, "after_flush")
+def _collect_domain_events(session: Session, flush_context):
+    pending = session.info.setdefault("pending_domain_events", set())
+    cache = {}
+    connection = None
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        spec = TRACKED_MODELS.get(type(obj))
+        if spec is None:
+            continue
+        event_for, kind, attribute = spec
+        is_new = obj in session.new
+        if not is_new and obj not in session.deleted and not session.is_modified(obj):
+            continue
+        if kind != "self" and connection is None:
+            connection = session.connection()
+        company_id = _owner_company(connection, cache, kind, getattr(obj, attribute, None))
+        if company_id is not None:
+            pending.add((event_for(obj, is_new), company_id))
+
+@event.listens_for(Session, "after_commit")
+def _dispatch_domain_events(session: Session):
+    pending = session.info.pop("pending_domain_events", None)
+    for event_name, company_id in sorted(pending or ()):
+        emit(event_name, company_id)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_domain_events(session: Session):
+    session.info.pop("pending_domain_events", None)
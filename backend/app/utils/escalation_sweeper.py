@@ -0,0 +1,176 @@
+# app/utils/escalation_sweeper.py
+#
+# Periodic escalation of overdue and stalled requirements, run by the worker
+# (tasks.sweep_escalations_task on the beat schedule). Rather than loading
+# every overdue requirement and escalating them one commit at a time, a sweep:
+#
+# 1. walks the due requirements in deadline order through the partial
+#    ix_document_requirements_escalation_due index, ESCALATION_BATCH_SIZE at
+#    a time, locking each batch with FOR UPDATE SKIP LOCKED so concurrent
+#    sweeps split the work instead of escalating twice;
+# 2. loads the admins and managers of each company once per sweep;
+# 3. writes the batch's escalations and notifications with multi-row INSERTs
+#    and raises the escalation levels with one UPDATE, then commits.
+#
+# A requirement is escalated again at most every ESCALATION_REPEAT_HOURS,
+# up to ESCALATION_MAX_LEVEL, so a sweep every few minutes does not run a
+# requirement up to the top level in one afternoon.
+import os
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set
+
+from sqlalchemy import and_, insert, or_, tuple_, update
+from sqlalchemy.orm import Session
+
+from app.models import (
+    Audit, AuditNotification, DocumentRequirement, DocumentSubmission, EscalationType, NotificationPriority,
+    RequirementEscalation, User, UserRole, WorkflowStage
+)
+from app.utils import domain_events
+
+ESCALATION_BATCH_SIZE = int(os.getenv("ESCALATION_BATCH_SIZE", 500))
+ESCALATION_REPEAT_HOURS = int(os.getenv("ESCALATION_REPEAT_HOURS", 24))
+ESCALATION_MAX_LEVEL = 3
+HIGH_PRIORITY_SCORE = 8
+HIGH_PRIORITY_REVIEW_HOURS = 24
+ESCALATION_TARGET_ROLES = (UserRole.admin, UserRole.manager)
+
+def _due_condition(now: datetime):
+    return and_(
+        DocumentRequirement.escalation_level < ESCALATION_MAX_LEVEL,
+        or_(
+            DocumentRequirement.last_escalated_at.is_(None),
+            DocumentRequirement.last_escalated_at < now - timedelta(hours=ESCALATION_REPEAT_HOURS)
+        )
+    )
+
+def _overdue_condition(now: datetime):
+    return and_(
+        DocumentRequirement.auto_escalate == True,
+        DocumentRequirement.deadline < now
+    )
+
+def _high_priority_condition(now: datetime):
+    return and_(
+        DocumentRequirement.ai_priority_score >= HIGH_PRIORITY_SCORE,
+        DocumentRequirement.submissions.any(and_(
+            DocumentSubmission.workflow_stage == WorkflowStage.under_review,
+            DocumentSubmission.submitted_at < now - timedelta(hours=HIGH_PRIORITY_REVIEW_HOURS)
+        ))
+    )
+
+def escalation_targets(db: Session, cache: Dict[int, List[int]], company_ids: Set[int]) -> Dict[int, List[int]]:
+    """Admin and manager user ids per company, loaded into `cache` once per company."""
+    missing = [company_id for company_id in company_ids if company_id not in cache]
+    if missing:
+        for company_id in missing:
+            cache[company_id] = []
+        for user_id, company_id in db.query(User.id, User.company_id).filter(
+            User.company_id.in_(missing),
+            User.role.in_(ESCALATION_TARGET_ROLES)
+        ).order_by(User.id):
+            cache[company_id].append(user_id)
+    return cache
+
+def _escalate_batch(db: Session, rows, escalation_type: EscalationType, targets: Dict[int, List[int]], now: datetime):
+    escalations, notifications = [], []
+    for row in rows:
+        level = row.escalation_level + 1
+        for user_id in targets[row.company_id]:
+            escalations.append({
+                "requirement_id": row.id,
+                "escalation_level": level,
+                "escalated_to_id": user_id,
+                "escalated_by_id": None,  # System escalation
+                "escalation_reason": f"Automatic escalation: {escalation_type.value}",
+                "escalation_type": escalation_type,
+                "resolved": False,
+                "created_at": now,
+            })
+            notifications.append({
+                "user_id": user_id,
+                "audit_id": row.audit_id,
+                "notification_type": "escalation",
+                "title": f"Requirement Escalated: {row.document_type}",
+                "message": f"Document requirement has been escalated due to: {escalation_type.value}",
+                "priority": NotificationPriority.high,
+                "data": {
+                    "requirement_id": row.id,
+                    "escalation_type": escalation_type.value,
+                    "escalation_level": level
+                },
+                "read": False,
+                "created_at": now,
+            })
+    if escalations:
+        db.execute(insert(RequirementEscalation.__table__), escalations)
+        db.execute(insert(AuditNotification.__table__), notifications)
+
+    requirements = DocumentRequirement.__table__
+    db.execute(
+        update(requirements).where(requirements.c.id.in_([row.id for row in rows])).values(
+            escalation_level=requirements.c.escalation_level + 1,
+            last_escalated_at=now
+        )
+    )
+    return len(escalations)
+
+def _sweep(db: Session, escalation_type: EscalationType, condition, order_by, now: datetime,
+           targets: Dict[int, List[int]], companies: Set[int], batch_size: int) -> Dict[str, int]:
+    requirements = escalations = 0
+    last: Optional[tuple] = None
+    while True:
+        query = db.query(
+            DocumentRequirement.id,
+            DocumentRequirement.audit_id,
+            DocumentRequirement.document_type,
+            DocumentRequirement.escalation_level,
+            DocumentRequirement.deadline,
+            Audit.company_id
+        ).join(
+            Audit, DocumentRequirement.audit_id == Audit.id
+        ).filter(condition, _due_condition(now))
+        if last is not None:
+            query = query.filter(tuple_(*order_by) > tuple_(*last))
+        rows = query.order_by(*order_by).limit(batch_size).with_for_update(
+            of=DocumentRequirement, skip_locked=True
+        ).all()
+        if not rows:
+            return {"requirements": requirements, "escalations": escalations}
+
+        batch_companies = {row.company_id for row in rows}
+        escalation_targets(db, targets, batch_companies)
+        escalations += _escalate_batch(db, rows, escalation_type, targets, now)
+        db.commit()
+        requirements += len(rows)
+        companies.update(batch_companies)
+        last = tuple(getattr(rows[-1], column.key) for column in order_by)
+
+def sweep_escalations(db: Session, now: Optional[datetime] = None, batch_size: int = ESCALATION_BATCH_SIZE) -> Dict[str, int]:
+    """
+    Escalates every due requirement: overdue ones with auto_escalate, then
+    high-priority ones with a submission waiting in review for over a day.
+    Commits per batch and returns counts of what was escalated.
+    """
+    now = now or datetime.utcnow()
+    targets: Dict[int, List[int]] = {}
+    companies: Set[int] = set()
+
+    overdue = _sweep(
+        db, EscalationType.overdue, _overdue_condition(now),
+        (DocumentRequirement.deadline, DocumentRequirement.id), now, targets, companies, batch_size
+    )
+    # Requirements escalated as overdue above are no longer due
+    high_priority = _sweep(
+        db, EscalationType.high_priority, _high_priority_condition(now),
+        (DocumentRequirement.id,), now, targets, companies, batch_size
+    )
+
+    # The Core writes above bypass the ORM hooks that would queue this event
+    for company_id in companies:
+        domain_events.emit(domain_events.REQUIREMENT_UPDATED, company_id)
+    return {
+        "overdue": overdue["requirements"],
+        "high_priority": high_priority["requirements"],
+        "escalations": overdue["escalations"] + high_priority["escalations"],
+    }
@@ -0,0 +1,83 @@
+# app/utils/extraction_cache.py
+import hashlib
+import os
+import logging
+from datetime import datetime
+from typing import Any, Dict, Optional
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app.models import ExtractionCache
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever extraction, prompts or the model change so stale entries are ignored
+PIPELINE_VERSION = os.getenv("EXTRACTION_PIPELINE_VERSION", "gemini-2.0-flash.v1")
+HASH_CHUNK_SIZE = 1024 * 1024  # 1 MB
+
+def compute_file_hash(file_path: str) -> str:
+    """
+    Returns the SHA-256 hex digest of a file, read in chunks.
+    """
+    sha256 = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+def get_cached_extraction(db: Session, hash_sha256: str, pipeline_version: str = PIPELINE_VERSION) -> Optional[ExtractionCache]:
+    """
+    Looks up a completed extraction for a file hash and records the hit.
+    """
+    if not hash_sha256:
+        return None
+    entry = db.query(ExtractionCache).filter(
+        ExtractionCache.hash_sha256 == hash_sha256,
+        ExtractionCache.pipeline_version == pipeline_version
+    ).first()
+    if entry:
+        entry.hit_count = (entry.hit_count or 0) + 1
+        entry.last_hit_at = datetime.utcnow()
+        db.commit()
+        logger.info(f"Extraction cache hit for {hash_sha256[:12]} ({pipeline_version})")
+    return entry
+
+def store_extraction(
+    db: Session,
+    hash_sha256: str,
+    file_type: str,
+    raw_content: Optional[str],
+    parsed_content: Any,
+    ai_analysis: Optional[Dict[str, Any]],
+    page_offsets: Optional[list] = None,
+    pipeline_version: str = PIPELINE_VERSION
+) -> Optional[ExtractionCache]:
+    """
+    Stores the outputs of a successful extraction. Concurrent workers racing on
+    the same hash are resolved by the unique constraint: the first insert wins.
+    """
+    if not hash_sha256:
+        return None
+    entry = ExtractionCache(
+        hash_sha256=hash_sha256,
+        pipeline_version=pipeline_version,
+        file_type=file_type,
+        raw_content=raw_content,
+        page_offsets=page_offsets,
+        parsed_content=parsed_content,
+        ai_analysis=ai_analysis,
+        hit_count=0,
+        created_at=datetime.utcnow()
+    )
+    db.add(entry)
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        return None
+    return entry
+
+def is_cacheable(result: Any) -> bool:
+    """
+    Failed LLM calls come back as {"error": ...}; those must not be cached.
+    """
+    return not (isinstance(result, dict) and "error" in result)
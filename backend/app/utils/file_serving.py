@@ -0,0 +1,105 @@
+# app/utils/file_serving.py
+#
+# Serves stored files with the headers browsers and PDF viewers rely on:
+# Content-Length, a validator (ETag/Last-Modified) for conditional GETs, and
+# byte ranges. Responses are Starlette FileResponses, which answer Range
+# requests themselves (206, multipart for several ranges) and read the file in
+# fixed 64 KiB chunks off the event loop, instead of iterating it by lines.
+import os
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Dict, Optional
+
+from fastapi import HTTPException, Request
+from fastapi.responses import FileResponse, Response
+
+# Files are tenant data: caches may keep them but must revalidate each time
+CACHE_CONTROL = "private, no-cache"
+
+class _FileResponse(FileResponse):
+    """
+    FileResponse whose If-Range check accepts the ETag we actually sent
+    (Starlette only compares against its own mtime-based one).
+    """
+    def __init__(self, *args, etag: str, **kwargs):
+        self._etag = etag
+        super().__init__(*args, **kwargs)
+
+    def _should_use_range(self, http_if_range: str, stat_result: os.stat_result) -> bool:
+        return http_if_range == self._etag or http_if_range == formatdate(stat_result.st_mtime, usegmt=True)
+
+def file_etag(stat_result: os.stat_result, content_hash: Optional[str] = None) -> str:
+    """
+    ETag from the content hash when the caller knows it, otherwise from
+    mtime and size (stored files are replaced, never rewritten in place).
+    """
+    if content_hash:
+        return f'"{content_hash}"'
+    return f'"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"'
+
+def _etag_matches(header: str, etag: str) -> bool:
+    if header.strip() == "*":
+        return True
+    # If-None-Match uses the weak comparison
+    candidates = [tag.strip().removeprefix("W/") for tag in header.split(",")]
+    return etag.removeprefix("W/") in candidates
+
+def _not_modified_since(header: str, stat_result: os.stat_result) -> bool:
+    try:
+        since = parsedate_to_datetime(header)
+    except (TypeError, ValueError):
+        return False
+    return since is not None and int(stat_result.st_mtime) <= int(since.timestamp())
+
+def is_follow_up_request(request: Request) -> bool:
+    """
+    True for a conditional or partial request past the first byte, i.e. a
+    viewer fetching more of (or revalidating) a file it already opened.
+    """
+    if request.headers.get("if-none-match") or request.headers.get("if-modified-since"):
+        return True
+    http_range = request.headers.get("range", "").replace(" ", "")
+    return bool(http_range) and not http_range.startswith("bytes=0-")
+
+def serve_file(
+    request: Request,
+    path: Optional[str],
+    media_type: Optional[str] = None,
+    filename: Optional[str] = None,
+    disposition: str = "inline",
+    content_hash: Optional[str] = None,
+    headers: Optional[Dict[str, str]] = None
+) -> Response:
+    """
+    Response for a file on disk honouring If-None-Match/If-Modified-Since
+    (304) and Range/If-Range (206). Raises 404 if the file is missing.
+    """
+    if not path:
+        raise HTTPException(status_code=404, detail="File not found")
+    try:
+        stat_result = os.stat(path)
+    except OSError:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    etag = file_etag(stat_result, content_hash)
+    validators = {
+        "ETag": etag,
+        "Last-Modified": formatdate(stat_result.st_mtime, usegmt=True),
+        "Cache-Control": CACHE_CONTROL,
+    }
+
+    if_none_match = request.headers.get("if-none-match")
+    if_modified_since = request.headers.get("if-modified-since")
+    if (if_none_match and _etag_matches(if_none_match, etag)) or (
+        not if_none_match and if_modified_since and _not_modified_since(if_modified_since, stat_result)
+    ):
+        return Response(status_code=304, headers=validators)
+
+    return _FileResponse(
+        path,
+        media_type=media_type or "application/octet-stream",
+        filename=os.path.basename(filename) if filename else None,
+        content_disposition_type=disposition,
+        stat_result=stat_result,
+        headers={**validators, **(headers or {})},
+        etag=etag
+    )
@@ -0,0 +1,384 @@
+# app/utils/hash_chain.py
+#
+# Append and verification of the per-submission hash chains: the
+# verification chain (DocumentVerificationChain blocks) and the audit trail
+# (DocumentAuditTrail rows). Each link hashes the previous link's hash with a
+# canonical JSON payload built only from values stored on the row, so every
+# link can be recomputed later.
+#
+# The tip of every chain is kept in submission_chain_tips. An append locks
+# that row (SELECT ... FOR UPDATE), so concurrent appends to one chain are
+# serialized until commit without scanning the chain for its last link, and
+# the tip doubles as a commitment that detects truncated chains.
+#
+# Links written before canonical hashing existed stay readable: verification
+# blocks are checked against the old payload encoding, while old trail rows
+# hashed a timestamp that was never stored and are reported as unverifiable.
+import hashlib
+import json
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from app.models import (
+    DocumentAuditTrail, DocumentRequirement, DocumentSubmission, DocumentVerificationChain, SubmissionChainTip
+)
+from app.utils.merkle import leaf_hash, merkle_root
+
+GENESIS = "genesis"
+VERIFICATION = "verification"
+TRAIL = "trail"
+CHAINS = (VERIFICATION, TRAIL)
+VERIFY_BATCH_SIZE = 5000
+
+def canonical_json(payload: Any) -> str:
+    return json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+
+def link_hash(previous_hash: str, payload: Any) -> str:
+    return hashlib.sha256(f"{previous_hash}\n{canonical_json(payload)}".encode("utf-8")).hexdigest()
+
+def _legacy_link_hash(previous_hash: str, payload: Any) -> str:
+    return hashlib.sha256(f"{previous_hash}{json.dumps(payload, sort_keys=True)}".encode()).hexdigest()
+
+def trail_payload(entry) -> Dict[str, Any]:
+    """Hashed fields of an audit trail row (an entity or a selected row)."""
+    return {
+        "submission_id": entry.submission_id,
+        "action": entry.action,
+        "actor_id": entry.actor_id,
+        "actor_type": getattr(entry.actor_type, "value", entry.actor_type),
+        "details": entry.details,
+        "ip_address": str(entry.ip_address) if entry.ip_address else None,
+        "user_agent": entry.user_agent,
+        "session_id": entry.session_id,
+        "timestamp": entry.timestamp.isoformat(),
+    }
+
+# ==================== APPEND ====================
+
+def _last_links(db: Session, submission_ids: List[int], chain: str) -> Dict[int, Tuple[int, str]]:
+    """(length, last hash) of the stored chains of several submissions."""
+    if chain == VERIFICATION:
+        return {
+            row.submission_id: (row.block_number, row.current_hash)
+            for row in db.query(
+                DocumentVerificationChain.submission_id,
+                DocumentVerificationChain.block_number,
+                DocumentVerificationChain.current_hash
+            ).filter(
+                DocumentVerificationChain.submission_id.in_(submission_ids)
+            ).distinct(DocumentVerificationChain.submission_id).order_by(
+                DocumentVerificationChain.submission_id, DocumentVerificationChain.block_number.desc()
+            )
+        }
+    lengths = dict(db.query(
+        DocumentAuditTrail.submission_id, func.count(DocumentAuditTrail.id)
+    ).filter(
+        DocumentAuditTrail.submission_id.in_(submission_ids)
+    ).group_by(DocumentAuditTrail.submission_id).all())
+    return {
+        row.submission_id: (lengths[row.submission_id], row.hash_chain)
+        for row in db.query(DocumentAuditTrail.submission_id, DocumentAuditTrail.hash_chain).filter(
+            DocumentAuditTrail.submission_id.in_(submission_ids)
+        ).distinct(DocumentAuditTrail.submission_id).order_by(
+            DocumentAuditTrail.submission_id, DocumentAuditTrail.id.desc()
+        )
+    }
+
+def _lock_tips(db: Session, submission_ids: Iterable[int], chain: str) -> Dict[int, SubmissionChainTip]:
+    """
+    Locks the tips of several chains of one type, creating missing ones.
+    Rows are locked in submission order so concurrent writers never deadlock.
+    """
+    submission_ids = sorted(set(submission_ids))
+    if not submission_ids:
+        return {}
+    now = datetime.utcnow()
+    db.execute(
+        insert(SubmissionChainTip.__table__).values([
+            {"submission_id": submission_id, "chain": chain, "tip_hash": GENESIS, "length": 0, "updated_at": now}
+            for submission_id in submission_ids
+        ]).on_conflict_do_nothing(index_elements=["submission_id", "chain"])
+    )
+    tips = {
+        tip.submission_id: tip for tip in db.query(SubmissionChainTip).filter(
+            SubmissionChainTip.submission_id.in_(submission_ids),
+            SubmissionChainTip.chain == chain
+        ).order_by(SubmissionChainTip.submission_id).with_for_update()
+    }
+    unseeded = [submission_id for submission_id, tip in tips.items() if tip.legacy_length is None]
+    if unseeded:
+        # First append since tips existed: continue from the stored chain once
+        last = _last_links(db, unseeded, chain)
+        for submission_id in unseeded:
+            tip = tips[submission_id]
+            tip.length, tip.tip_hash = last.get(submission_id, (0, GENESIS))
+            tip.legacy_length = tip.length
+    return tips
+
+def _lock_tip(db: Session, submission_id: int, chain: str) -> SubmissionChainTip:
+    return _lock_tips(db, [submission_id], chain)[submission_id]
+
+def _advance(tip: SubmissionChainTip, current_hash: str):
+    tip.tip_hash = current_hash
+    tip.length += 1
+    tip.updated_at = datetime.utcnow()
+
+def append_verification_block(
+    db: Session, submission_id: int, verification_id: int, verification_data: Dict[str, Any]
+) -> DocumentVerificationChain:
+    """
+    Adds the next block to a submission's verification chain. The chain stays
+    locked until the caller's transaction ends.
+    """
+    tip = _lock_tip(db, submission_id, VERIFICATION)
+    entry = DocumentVerificationChain(
+        submission_id=submission_id,
+        verification_id=verification_id,
+        previous_hash=tip.tip_hash,
+        current_hash=link_hash(tip.tip_hash, verification_data),
+        verification_data=verification_data,
+        block_number=tip.length + 1,
+        is_immutable=True
+    )
+    db.add(entry)
+    _advance(tip, entry.current_hash)
+    return entry
+
+def append_trail_entry(db: Session, entry: DocumentAuditTrail) -> DocumentAuditTrail:
+    """
+    Hashes an unsaved trail row onto its submission's audit trail and adds
+    it. The chain stays locked until the caller's transaction ends.
+    """
+    tip = _lock_tip(db, entry.submission_id, TRAIL)
+    if entry.timestamp is None:
+        entry.timestamp = datetime.utcnow()  # part of the hash, so stored explicitly
+    entry.hash_chain = link_hash(tip.tip_hash, trail_payload(entry))
+    db.add(entry)
+    _advance(tip, entry.hash_chain)
+    return entry
+
+def append_verification_blocks(
+    db: Session, blocks: List[Tuple[int, int, Dict[str, Any]]]
+) -> List[Tuple[int, str]]:
+    """
+    Appends (submission_id, verification_id, verification_data) blocks with
+    one locking query and one multi-row INSERT. Returns the (block_number,
+    hash) of each block, in order.
+    """
+    tips = _lock_tips(db, [submission_id for submission_id, _, _ in blocks], VERIFICATION)
+    rows, appended = [], []
+    now = datetime.utcnow()
+    for submission_id, verification_id, verification_data in blocks:
+        tip = tips[submission_id]
+        current_hash = link_hash(tip.tip_hash, verification_data)
+        rows.append({
+            "submission_id": submission_id,
+            "verification_id": verification_id,
+            "previous_hash": tip.tip_hash,
+            "current_hash": current_hash,
+            "verification_data": verification_data,
+            "block_number": tip.length + 1,
+            "timestamp": now,
+            "is_immutable": True,
+        })
+        _advance(tip, current_hash)
+        appended.append((tip.length, current_hash))
+    if rows:
+        db.execute(insert(DocumentVerificationChain.__table__), rows)
+    return appended
+
+def append_trail_entries(db: Session, entries: List[Dict[str, Any]]) -> List[str]:
+    """
+    Appends audit trail rows given as column dicts (submission_id, action,
+    actor_id, actor_type, details, ...) with one locking query and one
+    multi-row INSERT. Returns their hashes, in order.
+    """
+    tips = _lock_tips(db, [entry["submission_id"] for entry in entries], TRAIL)
+    rows, hashes = [], []
+    now = datetime.utcnow()
+    for entry in entries:
+        row = {"ip_address": None, "user_agent": None, "session_id": None, "timestamp": now, **entry}
+        tip = tips[row["submission_id"]]
+        row["hash_chain"] = link_hash(tip.tip_hash, trail_payload(SimpleNamespace(**row)))
+        rows.append(row)
+        _advance(tip, row["hash_chain"])
+        hashes.append(row["hash_chain"])
+    if rows:
+        db.execute(insert(DocumentAuditTrail.__table__), rows)
+    return hashes
+
+# ==================== VERIFICATION ====================
+
+class _ChainCheck:
+    def __init__(self, submission_id: int, chain: str, tip: Optional[SubmissionChainTip]):
+        self.submission_id = submission_id
+        self.chain = chain
+        self.tip = tip
+        # Without a tip nothing was appended canonically yet
+        self.legacy_length = tip.legacy_length if tip is not None and tip.legacy_length is not None else None
+        self.previous = GENESIS
+        self.links = 0
+        self.unverifiable = 0
+        self.broken_at: Optional[int] = None
+
+    def _is_legacy(self, position: int) -> bool:
+        return self.legacy_length is None or position <= self.legacy_length
+
+    def add_block(self, block):
+        position = self.links + 1
+        self.links = position
+        if self.broken_at is None:
+            encode = _legacy_link_hash if self._is_legacy(position) else link_hash
+            if (
+                block.block_number != position
+                or block.previous_hash != self.previous
+                or block.current_hash != encode(self.previous, block.verification_data)
+            ):
+                self.broken_at = position
+        self.previous = block.current_hash
+
+    def add_trail_row(self, row):
+        position = self.links + 1
+        self.links = position
+        if self.broken_at is None:
+            if self._is_legacy(position):
+                self.unverifiable += 1
+            elif row.hash_chain != link_hash(self.previous, trail_payload(row)):
+                self.broken_at = position
+        self.previous = row.hash_chain
+
+    def result(self) -> Dict[str, Any]:
+        if self.broken_at is None and self.tip is not None and self.tip.legacy_length is not None and (
+            self.tip.length != self.links or self.tip.tip_hash != self.previous
+        ):
+            # Links missing after the last stored one (or a forged tip)
+            self.broken_at = min(self.links, self.tip.length) + 1
+        return {
+            "submission_id": self.submission_id,
+            "chain": self.chain,
+            "links": self.links,
+            "unverifiable_links": self.unverifiable,
+            "valid": self.broken_at is None,
+            "broken_at": self.broken_at,
+            "tip_hash": self.previous,
+        }
+
+def verify_chains(db: Session, submission_ids: Iterable[int]) -> List[Dict[str, Any]]:
+    """
+    Recomputes every link of the given submissions' chains, reading each
+    chain type in one ordered pass. Returns one result per non-empty chain.
+    """
+    submission_ids = sorted(set(submission_ids))
+    if not submission_ids:
+        return []
+    tips = {
+        (tip.submission_id, tip.chain): tip
+        for tip in db.query(SubmissionChainTip).filter(SubmissionChainTip.submission_id.in_(submission_ids))
+    }
+    checks: Dict[Tuple[int, str], _ChainCheck] = {}
+
+    def check_for(submission_id: int, chain: str) -> _ChainCheck:
+        key = (submission_id, chain)
+        if key not in checks:
+            checks[key] = _ChainCheck(submission_id, chain, tips.get(key))
+        return checks[key]
+
+    blocks = db.query(
+        DocumentVerificationChain.submission_id,
+        DocumentVerificationChain.block_number,
+        DocumentVerificationChain.previous_hash,
+        DocumentVerificationChain.current_hash,
+        DocumentVerificationChain.verification_data
+    ).filter(
+        DocumentVerificationChain.submission_id.in_(submission_ids)
+    ).order_by(
+        DocumentVerificationChain.submission_id, DocumentVerificationChain.block_number, DocumentVerificationChain.id
+    ).yield_per(VERIFY_BATCH_SIZE)
+    for block in blocks:
+        check_for(block.submission_id, VERIFICATION).add_block(block)
+
+    rows = db.query(
+        DocumentAuditTrail.submission_id,
+        DocumentAuditTrail.action,
+        DocumentAuditTrail.actor_id,
+        DocumentAuditTrail.actor_type,
+        DocumentAuditTrail.details,
+        DocumentAuditTrail.ip_address,
+        DocumentAuditTrail.user_agent,
+        DocumentAuditTrail.session_id,
+        DocumentAuditTrail.timestamp,
+        DocumentAuditTrail.hash_chain
+    ).filter(
+        DocumentAuditTrail.submission_id.in_(submission_ids)
+    ).order_by(DocumentAuditTrail.submission_id, DocumentAuditTrail.id).yield_per(VERIFY_BATCH_SIZE)
+    for row in rows:
+        check_for(row.submission_id, TRAIL).add_trail_row(row)
+
+    # Chains whose rows are all gone still have a tip to compare against
+    for key, tip in tips.items():
+        if tip.length:
+            check_for(*key)
+    return [checks[key].result() for key in sorted(checks)]
+
+def _audit_submission_ids(db: Session, audit_id: int) -> List[int]:
+    return [
+        submission_id for (submission_id,) in db.query(DocumentSubmission.id).join(
+            DocumentRequirement, DocumentSubmission.requirement_id == DocumentRequirement.id
+        ).filter(DocumentRequirement.audit_id == audit_id)
+    ]
+
+def verify_audit(db: Session, audit_id: int) -> Dict[str, Any]:
+    """Verifies every chain of an audit and returns the results with its chain root."""
+    chains = verify_chains(db, _audit_submission_ids(db, audit_id))
+    broken = [chain for chain in chains if not chain["valid"]]
+    return {
+        "audit_id": audit_id,
+        "valid": not broken,
+        "chains_checked": len(chains),
+        "links_checked": sum(chain["links"] for chain in chains),
+        "unverifiable_links": sum(chain["unverifiable_links"] for chain in chains),
+        "broken_chains": broken,
+        "merkle_root": merkle_root([_head_leaf(chain["submission_id"], chain["chain"], chain["links"], chain["tip_hash"]) for chain in chains]),
+    }
+
+# ==================== AUDIT ROOT ====================
+
+def _head_leaf(submission_id: int, chain: str, length: int, tip_hash: str) -> bytes:
+    return leaf_hash(f"{submission_id}:{chain}:{length}:{tip_hash}".encode())
+
+def _chain_heads(db: Session, submission_ids: List[int]) -> Dict[Tuple[int, str], Tuple[int, str]]:
+    heads = {
+        (tip.submission_id, tip.chain): (tip.length, tip.tip_hash)
+        for tip in db.query(SubmissionChainTip).filter(
+            SubmissionChainTip.submission_id.in_(submission_ids),
+            SubmissionChainTip.legacy_length.isnot(None),
+            SubmissionChainTip.length > 0
+        )
+    }
+    # Chains never appended to since tips existed: read their last link
+    for chain in CHAINS:
+        missing = [submission_id for submission_id in submission_ids if (submission_id, chain) not in heads]
+        if missing:
+            for submission_id, head in _last_links(db, missing, chain).items():
+                heads[(submission_id, chain)] = head
+    return heads
+
+def audit_chain_root(db: Session, audit_id: int) -> Dict[str, Any]:
+    """
+    Merkle root over the heads (length and tip hash) of every chain of an
+    audit: one value that commits to all of its verification and trail
+    links, computed from the stored tips without reading the chains.
+    """
+    heads = _chain_heads(db, _audit_submission_ids(db, audit_id))
+    leaves = [_head_leaf(submission_id, chain, *heads[(submission_id, chain)]) for submission_id, chain in sorted(heads)]
+    return {
+        "audit_id": audit_id,
+        "merkle_root": merkle_root(leaves),
+        "chains": len(leaves),
+        "computed_at": datetime.utcnow().isoformat(),
+    }
@@ -0,0 +1,414 @@
+# app/utils/kpi_store.py
+#
+# Incrementally maintained per-company dashboard counters (company_kpis).
+# A session after_flush hook diffs the old and new state of every audit,
+# requirement, submission, finding and document written in the flush and
+# applies only the resulting counter deltas, in the same transaction, as
+# `value = value + delta` upserts. The dashboard then reads all counters of
+# a company with one keyed query.
+#
+# Writes that bypass the ORM unit of work (Query.update/delete, raw SQL)
+# must call apply_deltas themselves or leave the counters to the next
+# rebuild_company_kpis, which recomputes a company from scratch.
+#
+# Deltas are applied under a shared per-company advisory lock and rebuilds
+# take the same lock exclusively, so a rebuild never reads the source tables
+# while a delta for the same company is in flight, and never runs twice at
+# once for one company.
+import logging
+from collections import Counter, defaultdict
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import delete, event, inspect, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from app.models import (
+    Audit, AuditFinding, AuditStatus, CompanyKPI, Document, DocumentRequirement, DocumentSubmission, EvidenceStatus
+)
+
+logger = logging.getLogger(__name__)
+
+BUILT_MARKER = "_built"
+KPI_LOCK_CLASS = 0x4B5049  # first key of the (class, company_id) advisory locks
+
+AUDIT_ATTRIBUTES = (
+    "company_id", "status", "audit_type", "compliance_frameworks", "requires_approval", "approval_status",
+    "start_date", "end_date", "deadline", "peer_reviewed", "ai_risk_score"
+)
+REQUIREMENT_ATTRIBUTES = ("audit_id", "is_mandatory", "deadline")
+SUBMISSION_ATTRIBUTES = ("requirement_id", "verification_status", "workflow_stage", "revision_round", "submitted_at")
+FINDING_ATTRIBUTES = ("audit_id", "severity", "status", "finding_type", "ai_detected", "created_at", "resolved_at")
+DOCUMENT_ATTRIBUTES = ("company_id", "file_type")
+
+def _bucket(value: Any) -> str:
+    if value is None:
+        return ""
+    if hasattr(value, "value"):  # Enums
+        return str(value.value)
+    return str(value)
+
+def _month(value: Optional[datetime]) -> str:
+    return value.strftime("%Y-%m")
+
+# ==================== COUNTER CONTRIBUTIONS ====================
+# Each function returns what one row contributes to its company's counters.
+# A write is applied as contribution(new state) - contribution(old state).
+
+def audit_counters(audit: Dict[str, Any], context: Any = None) -> Counter:
+    counters = Counter()
+    status = _bucket(audit["status"])
+    counters[("audits_total", "")] += 1
+    counters[("audits_status", status)] += 1
+    counters[("audits_type", _bucket(audit["audit_type"]))] += 1
+    if isinstance(audit["compliance_frameworks"], list):
+        for framework in audit["compliance_frameworks"]:
+            counters[("audits_framework", _bucket(framework))] += 1
+    if audit["requires_approval"]:
+        counters[("audits_approval", _bucket(audit["approval_status"]))] += 1
+    if audit["peer_reviewed"]:
+        counters[("audits_peer_reviewed", "")] += 1
+    if audit["ai_risk_score"] is not None:
+        counters[("audits_risk_score_sum", "")] += audit["ai_risk_score"]
+        counters[("audits_risk_score_count", "")] += 1
+
+    if status == AuditStatus.completed.value:
+        if audit["peer_reviewed"] is not None:
+            counters[("audits_completed_peer_known", "")] += 1
+        if audit["end_date"]:
+            counters[("audits_completed_month", _month(audit["end_date"]))] += 1
+            if audit["deadline"] and audit["end_date"] <= audit["deadline"]:
+                counters[("audits_completed_on_time", "")] += 1
+            if audit["start_date"]:
+                counters[("audits_duration_days_sum", "")] += (audit["end_date"] - audit["start_date"]).days
+                counters[("audits_duration_count", "")] += 1
+    return counters
+
+def requirement_counters(requirement: Dict[str, Any], context: Any = None) -> Counter:
+    counters = Counter()
+    counters[("requirements_total", "")] += 1
+    if requirement["is_mandatory"]:
+        counters[("requirements_mandatory", "")] += 1
+    return counters
+
+def submission_counters(submission: Dict[str, Any], deadline: Optional[datetime] = None) -> Counter:
+    counters = Counter()
+    status = _bucket(submission["verification_status"])
+    counters[("submissions_total", "")] += 1
+    counters[("submissions_status", status)] += 1
+    counters[("submissions_stage", _bucket(submission["workflow_stage"]))] += 1
+    if submission["revision_round"] is not None:
+        counters[("submissions_revision_sum", "")] += submission["revision_round"]
+        counters[("submissions_revision_count", "")] += 1
+        if submission["revision_round"] == 1 and status == EvidenceStatus.approved.value:
+            counters[("submissions_first_pass_approved", "")] += 1
+    if submission["submitted_at"] and deadline:
+        counters[("submissions_on_time" if submission["submitted_at"] <= deadline else "submissions_late", "")] += 1
+    return counters
+
+def finding_counters(finding: Dict[str, Any], context: Any = None) -> Counter:
+    counters = Counter()
+    counters[("findings_severity", _bucket(finding["severity"]))] += 1
+    counters[("findings_status", _bucket(finding["status"]))] += 1
+    if finding["finding_type"] is not None:
+        counters[("findings_type", _bucket(finding["finding_type"]))] += 1
+    if finding["ai_detected"] is not None:
+        counters[("findings_ai_detected" if finding["ai_detected"] else "findings_manual", "")] += 1
+    if finding["created_at"]:
+        counters[("findings_new_month", _month(finding["created_at"]))] += 1
+    if finding["resolved_at"]:
+        counters[("findings_resolved_month", _month(finding["resolved_at"]))] += 1
+        if finding["created_at"]:
+            counters[("findings_resolve_days_sum", "")] += (finding["resolved_at"] - finding["created_at"]).days
+            counters[("findings_resolve_count", "")] += 1
+    return counters
+
+def document_counters(document: Dict[str, Any], context: Any = None) -> Counter:
+    return Counter({("documents_type", _bucket(document["file_type"])): 1})
+
+# ==================== OWNING COMPANY LOOKUPS ====================
+
+def _audit_company(connection, cache: Dict, audit_id: Optional[int]) -> Tuple[Optional[int], Any]:
+    if audit_id is None:
+        return None, None
+    key = ("audit", audit_id)
+    if key not in cache:
+        cache[key] = connection.execute(
+            text("SELECT company_id FROM audits WHERE id = :id"), {"id": audit_id}
+        ).scalar()
+    return cache[key], None
+
+def _requirement_company(connection, cache: Dict, requirement_id: Optional[int]) -> Tuple[Optional[int], Any]:
+    if requirement_id is None:
+        return None, None
+    key = ("requirement", requirement_id)
+    if key not in cache:
+        row = connection.execute(
+            text(
+                "SELECT a.company_id, r.deadline FROM document_requirements r "
+                "JOIN audits a ON a.id = r.audit_id WHERE r.id = :id"
+            ),
+            {"id": requirement_id}
+        ).first()
+        cache[key] = (row[0], row[1]) if row else (None, None)
+    return cache[key]
+
+# model -> (tracked attributes, (company_id, context) lookup, contribution)
+TRACKED_MODELS = {
+    Audit: (AUDIT_ATTRIBUTES, lambda conn, cache, s: (s["company_id"], None), audit_counters),
+    DocumentRequirement: (REQUIREMENT_ATTRIBUTES, lambda conn, cache, s: _audit_company(conn, cache, s["audit_id"]), requirement_counters),
+    DocumentSubmission: (SUBMISSION_ATTRIBUTES, lambda conn, cache, s: _requirement_company(conn, cache, s["requirement_id"]), submission_counters),
+    AuditFinding: (FINDING_ATTRIBUTES, lambda conn, cache, s: _audit_company(conn, cache, s["audit_id"]), finding_counters),
+    Document: (DOCUMENT_ATTRIBUTES, lambda conn, cache, s: (s["company_id"], None), document_counters),
+}
+
+# Attributes that re-bucket rows of another model: submissions are on time or
+# late against their requirement's deadline. A change rebuilds the company
+# instead of being diffed row by row.
+RESTATING_ATTRIBUTES = {
+    DocumentRequirement: ("deadline",),
+}
+
+# ==================== INCREMENTAL MAINTENANCE ====================
+
+def _keep_old_value(target, value, oldvalue, initiator):
+    return value
+
+# Load the committed value before a tracked attribute is overwritten, even
+# when a commit has expired it; otherwise the flush only sees the new value.
+for _model, (_attributes, _, _) in TRACKED_MODELS.items():
+    for _attr in _attributes:
+        event.listen(getattr(_model, _attr), "set", _keep_old_value, active_history=True)
+
+@event.listens_for(Session, "before_flush")
+def _load_tracked_state_before_flush(session: Session, flush_context, instances):
+    # Tracked attributes that are unchanged but expired still locate the
+    # company of the old state; load them while the database holds it
+    for obj in list(session.dirty) + list(session.deleted):
+        spec = TRACKED_MODELS.get(type(obj))
+        if spec is None:
+            continue
+        state = inspect(obj)
+        unloaded = state.unloaded.intersection(spec[0])
+        if unloaded and state.key is not None:
+            session.refresh(obj, attribute_names=list(unloaded))
+
+def _previous_state(obj, attributes: Iterable[str]) -> Tuple[Optional[Dict[str, Any]], bool]:
+    """
+    The committed values of `attributes` and whether any of them changed;
+    the values are None if one of them is unknown.
+    """
+    state = inspect(obj)
+    histories = {attr: state.attrs[attr].history for attr in attributes}
+    changed = any(history.has_changes() for history in histories.values())
+    previous = {}
+    for attr, history in histories.items():
+        if history.deleted:
+            previous[attr] = history.deleted[0]
+        elif history.unchanged:
+            previous[attr] = history.unchanged[0]
+        else:
+            return None, changed
+    return previous, changed
+
+def _restates(model, old: Optional[Dict[str, Any]], new: Optional[Dict[str, Any]]) -> bool:
+    """Whether a write changes an attribute that other rows are bucketed by."""
+    if old is None or new is None:
+        return False
+    return any(old[attr] != new[attr] for attr in RESTATING_ATTRIBUTES.get(model, ()))
+
+def _accumulate(deltas: Dict, company_id: Optional[int], counters: Counter, sign: int):
+    if company_id is None:
+        return
+    for key, value in counters.items():
+        deltas[(company_id,) + key] += sign * value
+
+def lock_company_kpis(connection, company_ids: Iterable[int], shared: bool = True):
+    """
+    Takes the transaction-scoped KPI lock of each company, in id order.
+    Writers applying deltas share it; a rebuild holds it exclusively.
+    """
+    function = "pg_advisory_xact_lock_shared" if shared else "pg_advisory_xact_lock"
+    for company_id in sorted(set(company_ids)):
+        connection.execute(
+            text(f"SELECT {function}(:lock_class, :company_id)"),
+            {"lock_class": KPI_LOCK_CLASS, "company_id": company_id}
+        )
+
+def apply_deltas(connection, deltas: Dict[Tuple[int, str, str], float]):
+    """
+    Adds {(company_id, metric, bucket): delta} to the stored counters. Rows
+    are written in key order so concurrent writers never deadlock.
+    """
+    rows = [
+        {"company_id": company_id, "metric": metric, "bucket": bucket, "value": delta, "updated_at": datetime.utcnow()}
+        for (company_id, metric, bucket), delta in sorted(deltas.items())
+        if delta
+    ]
+    if not rows:
+        return
+    lock_company_kpis(connection, (row["company_id"] for row in rows))
+    statement = insert(CompanyKPI.__table__)
+    connection.execute(
+        statement.on_conflict_do_update(
+            index_elements=["company_id", "metric", "bucket"],
+            set_={
+                "value": CompanyKPI.__table__.c.value + statement.excluded.value,
+                "updated_at": statement.excluded.updated_at,
+            }
+        ),
+        rows
+    )
+
+def invalidate_company_kpis(connection, company_ids: Iterable[int]):
+    """Drops the built marker so the next load rebuilds the companies' counters."""
+    company_ids = sorted(set(company_ids))
+    if not company_ids:
+        return
+    lock_company_kpis(connection, company_ids)
+    connection.execute(
+        delete(CompanyKPI.__table__).where(
+            CompanyKPI.__table__.c.company_id.in_(company_ids),
+            CompanyKPI.__table__.c.metric == BUILT_MARKER
+        )
+    )
+
+@event.listens_for(Session, "after_flush")
+def _update_kpis_after_flush(session: Session, flush_context):
+    deltas = defaultdict(float)
+    stale = set()
+    cache = {}
+    connection = session.connection()
+
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        spec = TRACKED_MODELS.get(type(obj))
+        if spec is None:
+            continue
+        attributes, locate, contribution = spec
+
+        known = True
+        if obj in session.new:
+            old = None
+            new = {attr: getattr(obj, attr) for attr in attributes}
+        elif obj in session.deleted:
+            old, _ = _previous_state(obj, attributes)
+            known = old is not None
+            new = None
+        else:
+            old, changed = _previous_state(obj, attributes)
+            if not changed:
+                continue
+            known = old is not None
+            new = {attr: getattr(obj, attr) for attr in attributes}
+
+        if not known:
+            # The old state cannot be subtracted; recompute the company instead
+            logger.warning(f"Unknown previous state of {type(obj).__name__} {inspect(obj).identity}, KPIs will be rebuilt")
+            company_id, _ = locate(connection, cache, new) if new is not None else (None, None)
+            if company_id is not None:
+                stale.add(company_id)
+            continue
+        if _restates(type(obj), old, new):
+            company_id, _ = locate(connection, cache, new)
+            if company_id is not None:
+                stale.add(company_id)
+        if old is not None:
+            company_id, context = locate(connection, cache, old)
+            _accumulate(deltas, company_id, contribution(old, context), -1)
+        if new is not None:
+            company_id, context = locate(connection, cache, new)
+            _accumulate(deltas, company_id, contribution(new, context), 1)
+
+    apply_deltas(connection, deltas)
+    invalidate_company_kpis(connection, stale)
+
+# ==================== READS AND REBUILDS ====================
+
+class CompanyKPIs:
+    """
+    Read-only view over the stored counters of one company.
+    """
+    def __init__(self, rows: Iterable[Tuple[str, str, float]]):
+        self._values = defaultdict(dict)
+        for metric, bucket, value in rows:
+            self._values[metric][bucket] = value
+
+    def value(self, metric: str, bucket: str = "") -> float:
+        return self._values.get(metric, {}).get(bucket, 0) or 0
+
+    def count(self, metric: str, bucket: str = "") -> int:
+        return int(round(self.value(metric, bucket)))
+
+    def buckets(self, metric: str) -> Dict[str, int]:
+        return {bucket: int(round(value)) for bucket, value in self._values.get(metric, {}).items() if round(value)}
+
+    def average(self, metric: str) -> float:
+        count = self.value(f"{metric}_count")
+        return self.value(f"{metric}_sum") / count if count else 0
+
+def _stored_kpis(db: Session, company_id: int) -> List[Tuple[str, str, float]]:
+    return db.query(CompanyKPI.metric, CompanyKPI.bucket, CompanyKPI.value).filter(
+        CompanyKPI.company_id == company_id
+    ).all()
+
+def _is_built(rows: Iterable[Tuple[str, str, float]]) -> bool:
+    return any(metric == BUILT_MARKER for metric, _, _ in rows)
+
+def rebuild_company_kpis(db: Session, company_id: int, force: bool = True) -> List[Tuple[str, str, float]]:
+    """
+    Recomputes every counter of a company from the source tables with the
+    same contribution rules as the incremental path. Used for the first
+    dashboard load of a company and to reconcile drift. Without `force`,
+    counters another request built while this one waited for the lock are
+    kept.
+    """
+    lock_company_kpis(db.connection(), [company_id], shared=False)
+    if not force:
+        rows = _stored_kpis(db, company_id)
+        if _is_built(rows):
+            db.commit()
+            return rows
+
+    counters = Counter()
+    for row in db.query(*[getattr(Audit, attr) for attr in AUDIT_ATTRIBUTES]).filter(Audit.company_id == company_id):
+        counters.update(audit_counters(row._asdict()))
+    for row in db.query(*[getattr(DocumentRequirement, attr) for attr in REQUIREMENT_ATTRIBUTES]).join(
+        Audit, DocumentRequirement.audit_id == Audit.id
+    ).filter(Audit.company_id == company_id):
+        counters.update(requirement_counters(row._asdict()))
+    for row in db.query(
+        *[getattr(DocumentSubmission, attr) for attr in SUBMISSION_ATTRIBUTES], DocumentRequirement.deadline
+    ).join(DocumentRequirement, DocumentSubmission.requirement_id == DocumentRequirement.id).join(
+        Audit, DocumentRequirement.audit_id == Audit.id
+    ).filter(Audit.company_id == company_id):
+        counters.update(submission_counters(row._asdict(), row.deadline))
+    for row in db.query(*[getattr(AuditFinding, attr) for attr in FINDING_ATTRIBUTES]).join(
+        Audit, AuditFinding.audit_id == Audit.id
+    ).filter(Audit.company_id == company_id):
+        counters.update(finding_counters(row._asdict()))
+    for row in db.query(*[getattr(Document, attr) for attr in DOCUMENT_ATTRIBUTES]).filter(Document.company_id == company_id):
+        counters.update(document_counters(row._asdict()))
+    counters[(BUILT_MARKER, "")] = 1
+
+    now = datetime.utcnow()
+    db.query(CompanyKPI).filter(CompanyKPI.company_id == company_id).delete(synchronize_session=False)
+    db.bulk_insert_mappings(CompanyKPI, [
+        {"company_id": company_id, "metric": metric, "bucket": bucket, "value": value, "updated_at": now}
+        for (metric, bucket), value in counters.items()
+    ])
+    db.commit()
+    logger.info(f"Rebuilt {len(counters)} KPI counters for company {company_id}")
+    return [(metric, bucket, value) for (metric, bucket), value in counters.items()]
+
+def load_company_kpis(db: Session, company_id: int, rebuild: bool = False) -> CompanyKPIs:
+    """
+    All counters of a company in one keyed read; the counters are built on
+    first use.
+    """
+    if rebuild:
+        return CompanyKPIs(rebuild_company_kpis(db, company_id))
+    rows = _stored_kpis(db, company_id)
+    if not _is_built(rows):
+        rows = rebuild_company_kpis(db, company_id, force=False)
+    return CompanyKPIs(rows)
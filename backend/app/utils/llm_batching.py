@@ -0,0 +1,117 @@
+# app/utils/llm_batching.py
+import inspect
+import json
+import os
+import logging
+from typing import Any, Callable, Dict, List
+
+logger = logging.getLogger(__name__)
+
+BATCH_TOKEN_BUDGET = int(os.getenv("LLM_BATCH_TOKEN_BUDGET", 24000))
+BATCH_MAX_DOCUMENTS = int(os.getenv("LLM_BATCH_MAX_DOCUMENTS", 8))
+CHARS_PER_TOKEN = 4
+
+def estimate_tokens(text: str) -> int:
+    """
+    Cheap token estimate (~4 characters per token) used for packing only.
+    """
+    return len(text or "") // CHARS_PER_TOKEN + 1
+
+def pack_batches(
+    items: List[Dict[str, Any]],
+    token_budget: int = BATCH_TOKEN_BUDGET,
+    max_items: int = BATCH_MAX_DOCUMENTS
+) -> List[List[Dict[str, Any]]]:
+    """
+    Greedily packs items ({"key", "content"}) into batches whose estimated
+    prompt size stays within `token_budget`. Items that are too large to share
+    a prompt end up in a batch of their own.
+    """
+    batches = []
+    current = []
+    current_tokens = 0
+    for item in sorted(items, key=lambda i: estimate_tokens(i["content"])):
+        tokens = estimate_tokens(item["content"])
+        if current and (current_tokens + tokens > token_budget or len(current) >= max_items):
+            batches.append(current)
+            current = []
+            current_tokens = 0
+        current.append(item)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+def build_batch_prompt(instruction: str, items: List[Dict[str, Any]]) -> str:
+    """
+    Builds one prompt covering several documents, each under a numbered header.
+    """
+    sections = [
+        instruction,
+        "",
+        "The input below contains several independent documents, each starting with a line "
+        "'=== DOCUMENT <id> ==='. Analyse each document on its own. Return ONE JSON object whose "
+        "keys are the document ids as strings and whose values are the complete result for that document. "
+        "Return ONLY that JSON object, no other text or formatting.",
+    ]
+    for item in items:
+        sections.append(f"\n=== DOCUMENT {item['key']} ===\n{item['content']}")
+    return "\n".join(sections)
+
+def demultiplex(response_text: str, items: List[Dict[str, Any]]) -> Dict[Any, Any]:
+    """
+    Splits a batched JSON response back into per-document results. Documents
+    missing from the response are left out so the caller can retry them alone.
+    Raises ValueError when the response is not a JSON object.
+    """
+    parsed = json.loads(response_text)
+    if isinstance(parsed, dict) and "documents" in parsed and isinstance(parsed["documents"], dict):
+        parsed = parsed["documents"]
+    if not isinstance(parsed, dict):
+        raise ValueError("Batched response is not a JSON object keyed by document id")
+
+    results = {}
+    for item in items:
+        value = parsed.get(str(item["key"]))
+        if isinstance(value, (dict, list)):
+            results[item["key"]] = value
+    return results
+
+async def _resolve(value):
+    return await value if inspect.isawaitable(value) else value
+
+async def run_batched(
+    items: List[Dict[str, Any]],
+    instruction: str,
+    call_llm: Callable[[str], Any],
+    single_call: Callable[[Dict[str, Any]], Any],
+    token_budget: int = BATCH_TOKEN_BUDGET,
+    max_items: int = BATCH_MAX_DOCUMENTS
+) -> Dict[Any, Any]:
+    """
+    Runs `instruction` over many documents with as few LLM round-trips as the
+    token budget allows. `call_llm` takes a prompt and returns the raw JSON
+    text; `single_call` handles one item and is used for single-item batches
+    and for any document the batched response failed to cover. Both may be
+    plain functions or coroutines; sync callers wrap this in asyncio.run().
+    """
+    results = {}
+    for batch in pack_batches(items, token_budget=token_budget, max_items=max_items):
+        if len(batch) == 1:
+            results[batch[0]["key"]] = await _resolve(single_call(batch[0]))
+            continue
+
+        try:
+            response_text = await _resolve(call_llm(build_batch_prompt(instruction, batch)))
+            batch_results = demultiplex(response_text, batch)
+        except Exception as e:
+            logger.warning(f"Batched LLM call for {len(batch)} documents failed, falling back to single calls: {e}")
+            batch_results = {}
+
+        for item in batch:
+            if item["key"] in batch_results:
+                results[item["key"]] = batch_results[item["key"]]
+            else:
+                results[item["key"]] = await _resolve(single_call(item))
+        logger.info(f"Batched {len(batch)} documents into one LLM call ({len(batch) - len(batch_results)} fallbacks)")
+    return results
@@ -0,0 +1,170 @@
+# app/utils/llm_cache.py
+#
+# Response cache for deterministic LLM prompts. Entries live in an in-memory
+# LRU with a per-entry TTL; set LLM_CACHE_SQLITE_PATH to also keep them in an
+# on-disk SQLite file so they survive restarts and are shared between worker
+# processes on the same host.
+import hashlib
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+import logging
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", 1024))
+LLM_CACHE_DEFAULT_TTL = int(os.getenv("LLM_CACHE_DEFAULT_TTL", 24 * 3600))  # seconds
+LLM_CACHE_SQLITE_PATH = os.getenv("LLM_CACHE_SQLITE_PATH")
+LLM_CACHE_SQLITE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_SQLITE_MAX_ENTRIES", 50000))
+
+def _normalize(value: Any) -> Any:
+    # Whitespace-only differences (prompt indentation) must not change the key
+    if isinstance(value, str):
+        return " ".join(value.split())
+    if isinstance(value, dict):
+        return {str(k): _normalize(v) for k, v in sorted(value.items(), key=lambda item: str(item[0]))}
+    if isinstance(value, (list, tuple, set, frozenset)):
+        items = [_normalize(v) for v in value]
+        return sorted(items, key=json.dumps) if isinstance(value, (set, frozenset)) else items
+    if hasattr(value, "value"):  # Enums
+        return _normalize(value.value)
+    return value
+
+def prompt_fingerprint(*parts: Any) -> str:
+    """
+    Stable SHA-256 over the normalised request parts (provider, model,
+    messages or an explicit cache key, and generation parameters).
+    """
+    payload = json.dumps([_normalize(part) for part in parts], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def materiality_bucket(amount: Optional[float]) -> float:
+    """
+    Rounds a materiality threshold down to the 1-2-5 series (…, 10k, 20k,
+    50k, 100k, …) so nearby thresholds share cached responses.
+    """
+    if not amount or amount <= 0:
+        return 0
+    magnitude = 10 ** int(math.floor(math.log10(amount)))
+    for step in (5, 2, 1):
+        if amount >= step * magnitude:
+            return step * magnitude
+    return magnitude
+
+class PromptCache:
+    def __init__(
+        self,
+        max_entries: int = LLM_CACHE_MAX_ENTRIES,
+        sqlite_path: Optional[str] = LLM_CACHE_SQLITE_PATH,
+        sqlite_max_entries: int = LLM_CACHE_SQLITE_MAX_ENTRIES
+    ):
+        self.max_entries = max_entries
+        self.sqlite_path = sqlite_path
+        self.sqlite_max_entries = sqlite_max_entries
+        self._entries = OrderedDict()  # fingerprint -> (expires_at, response)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if sqlite_path:
+            with self._connect() as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS prompt_cache ("
+                    "fingerprint TEXT PRIMARY KEY, response TEXT NOT NULL, "
+                    "expires_at REAL NOT NULL, last_access REAL NOT NULL)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS ix_prompt_cache_last_access ON prompt_cache (last_access)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.sqlite_path, timeout=5)
+        try:
+            with conn:  # commits on success, rolls back on error
+                yield conn
+        finally:
+            conn.close()
+
+    def _remember(self, fingerprint: str, expires_at: float, response: str):
+        self._entries[fingerprint] = (expires_at, response)
+        self._entries.move_to_end(fingerprint)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, fingerprint: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(fingerprint)
+            if entry and entry[0] > now:
+                self._entries.move_to_end(fingerprint)
+                self.hits += 1
+                return entry[1]
+            if entry:
+                del self._entries[fingerprint]
+
+        if self.sqlite_path:
+            try:
+                with self._connect() as conn:
+                    row = conn.execute(
+                        "SELECT response, expires_at FROM prompt_cache WHERE fingerprint = ? AND expires_at > ?",
+                        (fingerprint, now)
+                    ).fetchone()
+                    if row:
+                        conn.execute("UPDATE prompt_cache SET last_access = ? WHERE fingerprint = ?", (now, fingerprint))
+            except sqlite3.Error as e:
+                logger.warning(f"Prompt cache SQLite read failed: {e}")
+                row = None
+            if row:
+                with self._lock:
+                    self._remember(fingerprint, row[1], row[0])
+                    self.hits += 1
+                return row[0]
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, fingerprint: str, response: str, ttl: int = LLM_CACHE_DEFAULT_TTL):
+        now = time.time()
+        expires_at = now + ttl
+        with self._lock:
+            self._remember(fingerprint, expires_at, response)
+
+        if self.sqlite_path:
+            try:
+                with self._connect() as conn:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO prompt_cache (fingerprint, response, expires_at, last_access) VALUES (?, ?, ?, ?)",
+                        (fingerprint, response, expires_at, now)
+                    )
+                    conn.execute("DELETE FROM prompt_cache WHERE expires_at <= ?", (now,))
+                    conn.execute(
+                        "DELETE FROM prompt_cache WHERE fingerprint IN ("
+                        "SELECT fingerprint FROM prompt_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                        (self.sqlite_max_entries,)
+                    )
+            except sqlite3.Error as e:
+                logger.warning(f"Prompt cache SQLite write failed: {e}")
+
+    def invalidate(self, fingerprint: str):
+        with self._lock:
+            self._entries.pop(fingerprint, None)
+        if self.sqlite_path:
+            try:
+                with self._connect() as conn:
+                    conn.execute("DELETE FROM prompt_cache WHERE fingerprint = ?", (fingerprint,))
+            except sqlite3.Error as e:
+                logger.warning(f"Prompt cache SQLite delete failed: {e}")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self.sqlite_path:
+            with self._connect() as conn:
+                conn.execute("DELETE FROM prompt_cache")
+
+prompt_cache = PromptCache()
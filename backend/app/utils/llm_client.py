@@ -0,0 +1,387 @@
+# app/utils/llm_client.py
+#
+# Shared client for every LLM call in the backend.
+#
+#   text = await llm_client.complete("groq", prompt, system="...", json_mode=True)
+#   text = llm_client.complete_sync("gemini", prompt, model="gemini-2.0-flash")
+#
+# All requests run on one event loop owned by the client (started lazily in a
+# daemon thread), so FastAPI handlers, Celery tasks and plain sync code share
+# the same HTTP connection pool, concurrency limits and rate limiters.
+#
+# Set LLM_PROVIDER_OVERRIDE=stub to answer every call from the local stub
+# provider (latency from LLM_STUB_LATENCY_MS) when load-testing offline.
+#
+# Pass cache_ttl (and optionally cache_key) to reuse responses for
+# deterministic prompts; see app/utils/llm_cache.py.
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+import logging
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from app.utils.llm_cache import prompt_cache, prompt_fingerprint
+
+logger = logging.getLogger(__name__)
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 16))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 5))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", 1.0))  # seconds
+LLM_REQUEST_TIMEOUT = float(os.getenv("LLM_REQUEST_TIMEOUT", 120))  # seconds
+LLM_PROVIDER_OVERRIDE = os.getenv("LLM_PROVIDER_OVERRIDE")
+
+GEMINI_API_URL = "https://generativelanguage.googleapis.com/v1beta"
+GROQ_API_URL = "https://api.groq.com/openai/v1"
+
+class LLMError(Exception):
+    """Raised when an LLM call fails and should not be retried."""
+
+class LLMRetryableError(LLMError):
+    """Transient provider failure (server error, timeout); retried with backoff."""
+
+class LLMRateLimitError(LLMRetryableError):
+    """HTTP 429 from the provider, optionally with the server's Retry-After."""
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class TokenBucket:
+    """
+    Token-bucket limiter: allows `rate_per_minute` requests per minute on
+    average, with bursts of up to `burst` requests.
+    """
+    def __init__(self, rate_per_minute: float, burst: Optional[int] = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = burst or max(1, int(rate_per_minute // 6))
+        self.tokens = float(self.capacity)
+        self.updated_at = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+def _raise_for_status(provider: str, response: httpx.Response):
+    if response.status_code == 429:
+        retry_after = response.headers.get("retry-after")
+        try:
+            retry_after = float(retry_after) if retry_after else None
+        except ValueError:
+            retry_after = None
+        raise LLMRateLimitError(f"{provider} rate limit exceeded", retry_after=retry_after)
+    if response.status_code >= 500:
+        raise LLMRetryableError(f"{provider} returned {response.status_code}: {response.text[:200]}")
+    if response.status_code >= 400:
+        raise LLMError(f"{provider} returned {response.status_code}: {response.text[:500]}")
+
+class LLMProvider:
+    """
+    Base class for providers. Subclasses translate OpenAI-style messages into
+    the provider's wire format and return the response text.
+    """
+    name = "base"
+    default_model = None
+    concurrency = 4
+    requests_per_minute = 60
+
+    def is_configured(self) -> bool:
+        return True
+
+    async def chat(
+        self,
+        http: httpx.AsyncClient,
+        messages: List[Dict[str, str]],
+        model: str,
+        temperature: Optional[float],
+        max_tokens: Optional[int],
+        json_mode: bool
+    ) -> str:
+        raise NotImplementedError
+
+class GeminiProvider(LLMProvider):
+    name = "gemini"
+    default_model = "gemini-2.0-flash"
+    concurrency = int(os.getenv("LLM_GEMINI_CONCURRENCY", 8))
+    requests_per_minute = float(os.getenv("LLM_GEMINI_RPM", 60))
+
+    def __init__(self, api_key: Optional[str] = None):
+        self.api_key = api_key or os.getenv("GOOGLE_API_KEY") or os.getenv("GEMINI_API_KEY")
+
+    def is_configured(self) -> bool:
+        return bool(self.api_key)
+
+    async def chat(self, http, messages, model, temperature, max_tokens, json_mode):
+        system = [m["content"] for m in messages if m["role"] == "system"]
+        payload = {
+            "contents": [
+                {"role": "model" if m["role"] == "assistant" else "user", "parts": [{"text": m["content"]}]}
+                for m in messages if m["role"] != "system"
+            ],
+            "generationConfig": {}
+        }
+        if system:
+            payload["systemInstruction"] = {"parts": [{"text": "\n".join(system)}]}
+        if temperature is not None:
+            payload["generationConfig"]["temperature"] = temperature
+        if max_tokens:
+            payload["generationConfig"]["maxOutputTokens"] = max_tokens
+        if json_mode:
+            payload["generationConfig"]["responseMimeType"] = "application/json"
+
+        response = await http.post(
+            f"{GEMINI_API_URL}/models/{model}:generateContent",
+            headers={"x-goog-api-key": self.api_key},
+            json=payload
+        )
+        _raise_for_status(self.name, response)
+        result = response.json()
+        try:
+            parts = result["candidates"][0]["content"]["parts"]
+        except (KeyError, IndexError):
+            raise LLMError(f"Unexpected Gemini response: {json.dumps(result)[:500]}")
+        return "".join(part.get("text", "") for part in parts)
+
+class GroqProvider(LLMProvider):
+    name = "groq"
+    default_model = "llama-3.3-70b-versatile"
+    concurrency = int(os.getenv("LLM_GROQ_CONCURRENCY", 4))
+    requests_per_minute = float(os.getenv("LLM_GROQ_RPM", 30))
+
+    def __init__(self, api_key: Optional[str] = None):
+        self.api_key = api_key or os.getenv("GROQ_API_KEY")
+
+    def is_configured(self) -> bool:
+        return bool(self.api_key)
+
+    async def chat(self, http, messages, model, temperature, max_tokens, json_mode):
+        payload = {"model": model, "messages": messages}
+        if temperature is not None:
+            payload["temperature"] = temperature
+        if max_tokens:
+            payload["max_tokens"] = max_tokens
+        if json_mode:
+            payload["response_format"] = {"type": "json_object"}
+
+        response = await http.post(
+            f"{GROQ_API_URL}/chat/completions",
+            headers={"Authorization": f"Bearer {self.api_key}"},
+            json=payload
+        )
+        _raise_for_status(self.name, response)
+        return response.json()["choices"][0]["message"]["content"]
+
+class StubProvider(LLMProvider):
+    """
+    Offline provider for load tests: waits `latency` seconds and returns a
+    canned response without touching the network.
+    """
+    name = "stub"
+    default_model = "stub"
+    concurrency = int(os.getenv("LLM_STUB_CONCURRENCY", 64))
+    requests_per_minute = float(os.getenv("LLM_STUB_RPM", 60000))
+
+    def __init__(self, latency: Optional[float] = None, response: Optional[str] = None):
+        self.latency = latency if latency is not None else float(os.getenv("LLM_STUB_LATENCY_MS", 200)) / 1000
+        self.response = response
+
+    async def chat(self, http, messages, model, temperature, max_tokens, json_mode):
+        await asyncio.sleep(self.latency)
+        if self.response is not None:
+            return self.response
+        if json_mode:
+            return json.dumps({"stub": True, "prompt_chars": sum(len(m["content"]) for m in messages)})
+        return "stub response"
+
+class LLMClient:
+    def __init__(
+        self,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        max_retries: int = LLM_MAX_RETRIES,
+        retry_base_delay: float = LLM_RETRY_BASE_DELAY,
+        provider_override: Optional[str] = LLM_PROVIDER_OVERRIDE
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.provider_override = provider_override
+        self.providers = {}
+        self._limits = {}
+        self._lock = threading.Lock()
+        self._reset()
+        for provider in (GeminiProvider(), GroqProvider(), StubProvider()):
+            self.register_provider(provider)
+
+    def _reset(self):
+        # Loop-bound state is rebuilt after a fork (e.g. Celery prefork workers)
+        self._pid = os.getpid()
+        self._loop = None
+        self._http = None
+        self._global_semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._limiters = {
+            name: (asyncio.Semaphore(concurrency), TokenBucket(rpm))
+            for name, (concurrency, rpm) in self._limits.items()
+        }
+
+    def register_provider(
+        self,
+        provider: LLMProvider,
+        concurrency: Optional[int] = None,
+        requests_per_minute: Optional[float] = None
+    ):
+        """
+        Adds or replaces a provider together with its own concurrency and rate limits.
+        """
+        limits = (concurrency or provider.concurrency, requests_per_minute or provider.requests_per_minute)
+        self.providers[provider.name] = provider
+        self._limits[provider.name] = limits
+        self._limiters[provider.name] = (asyncio.Semaphore(limits[0]), TokenBucket(limits[1]))
+
+    def is_configured(self, provider: str) -> bool:
+        name = self.provider_override or provider
+        return name in self.providers and self.providers[name].is_configured()
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reset()
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="llm-client", daemon=True).start()
+                self._http = httpx.AsyncClient(
+                    timeout=LLM_REQUEST_TIMEOUT,
+                    limits=httpx.Limits(max_connections=self.max_concurrency, max_keepalive_connections=self.max_concurrency)
+                )
+                self._loop = loop
+            return self._loop
+
+    def _retry_delay(self, attempt: int, error: LLMRetryableError) -> float:
+        if isinstance(error, LLMRateLimitError) and error.retry_after:
+            return error.retry_after
+        return self.retry_base_delay * 2 ** attempt * (1 + random.random() * 0.25)
+
+    async def _chat(self, provider_name, messages, model, temperature, max_tokens, json_mode) -> str:
+        name = self.provider_override or provider_name
+        provider = self.providers.get(name)
+        if provider is None:
+            raise LLMError(f"Unknown LLM provider: {name}")
+        if not provider.is_configured():
+            raise LLMError(f"LLM provider {name} is not configured")
+        model = model if self.provider_override is None else provider.default_model
+        semaphore, bucket = self._limiters[name]
+
+        for attempt in range(self.max_retries + 1):
+            await bucket.acquire()
+            try:
+                async with self._global_semaphore, semaphore:
+                    return await provider.chat(
+                        self._http, messages, model or provider.default_model, temperature, max_tokens, json_mode
+                    )
+            except (LLMRetryableError, httpx.TransportError) as e:
+                error = e if isinstance(e, LLMRetryableError) else LLMRetryableError(str(e))
+                if attempt >= self.max_retries:
+                    raise error
+                delay = self._retry_delay(attempt, error)
+                logger.warning(f"{name} call failed ({error}), retrying in {delay:.1f}s (attempt {attempt + 1}/{self.max_retries})")
+                await asyncio.sleep(delay)
+
+    def _submit(self, provider, messages, model, temperature, max_tokens, json_mode):
+        loop = self._ensure_loop()
+        return asyncio.run_coroutine_threadsafe(
+            self._chat(provider, messages, model, temperature, max_tokens, json_mode), loop
+        )
+
+    def _fingerprint(self, provider, messages, model, temperature, max_tokens, json_mode, cache_key) -> str:
+        # An explicit cache_key stands in for the prompt, so callers can map
+        # near-identical prompts (e.g. nearby materiality thresholds) to one entry
+        return prompt_fingerprint(
+            self.provider_override or provider, model,
+            messages if cache_key is None else cache_key,
+            temperature, max_tokens, json_mode
+        )
+
+    def _store(self, fingerprint: str, response: str, json_mode: bool, cache_ttl: int):
+        if not response:
+            return
+        if json_mode:
+            try:
+                json.loads(response)
+            except ValueError:
+                return
+        prompt_cache.set(fingerprint, response, ttl=cache_ttl)
+
+    async def chat(
+        self,
+        provider: str,
+        messages: List[Dict[str, str]],
+        model: Optional[str] = None,
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        json_mode: bool = False,
+        cache_ttl: Optional[int] = None,
+        cache_key: Any = None
+    ) -> str:
+        """
+        Sends OpenAI-style messages to `provider` and returns the response text.
+        With `cache_ttl` set, responses are served from and stored in the prompt cache.
+        """
+        if cache_ttl:
+            fingerprint = self._fingerprint(provider, messages, model, temperature, max_tokens, json_mode, cache_key)
+            cached = prompt_cache.get(fingerprint)
+            if cached is not None:
+                return cached
+        response = await asyncio.wrap_future(self._submit(provider, messages, model, temperature, max_tokens, json_mode))
+        if cache_ttl:
+            self._store(fingerprint, response, json_mode, cache_ttl)
+        return response
+
+    def chat_sync(
+        self,
+        provider: str,
+        messages: List[Dict[str, str]],
+        model: Optional[str] = None,
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        json_mode: bool = False,
+        cache_ttl: Optional[int] = None,
+        cache_key: Any = None
+    ) -> str:
+        """
+        Blocking variant of chat() for sync callers such as Celery tasks.
+        """
+        if cache_ttl:
+            fingerprint = self._fingerprint(provider, messages, model, temperature, max_tokens, json_mode, cache_key)
+            cached = prompt_cache.get(fingerprint)
+            if cached is not None:
+                return cached
+        response = self._submit(provider, messages, model, temperature, max_tokens, json_mode).result()
+        if cache_ttl:
+            self._store(fingerprint, response, json_mode, cache_ttl)
+        return response
+
+    async def complete(self, provider: str, prompt: str, system: Optional[str] = None, **kwargs) -> str:
+        """
+        Single-prompt convenience wrapper around chat().
+        """
+        return await self.chat(provider, _messages(prompt, system), **kwargs)
+
+    def complete_sync(self, provider: str, prompt: str, system: Optional[str] = None, **kwargs) -> str:
+        return self.chat_sync(provider, _messages(prompt, system), **kwargs)
+
+def _messages(prompt: str, system: Optional[str]) -> List[Dict[str, str]]:
+    messages = [{"role": "system", "content": system}] if system else []
+    messages.append({"role": "user", "content": prompt})
+    return messages
+
+llm_client = LLMClient()
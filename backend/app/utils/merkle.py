@@ -0,0 +1,113 @@
+# app/utils/merkle.py
+#
+# Merkle tree hashing in the RFC 6962 (Certificate Transparency) layout:
+# leaves and interior nodes are hashed with distinct prefixes so a leaf can
+# never be passed off as a node, and a level with an odd number of nodes
+# carries its last node up unchanged.
+import hashlib
+from typing import Dict, List, Tuple
+
+EMPTY_ROOT = hashlib.sha256(b"").hexdigest()
+
+def leaf_hash(data: bytes) -> bytes:
+    return hashlib.sha256(b"\x00" + data).digest()
+
+def node_hash(left: bytes, right: bytes) -> bytes:
+    return hashlib.sha256(b"\x01" + left + right).digest()
+
+def merkle_root(leaves: List[bytes]) -> str:
+    """Hex root over already leaf-hashed values, in order."""
+    if not leaves:
+        return EMPTY_ROOT
+    level = list(leaves)
+    while len(level) > 1:
+        paired = [node_hash(level[i], level[i + 1]) for i in range(0, len(level) - 1, 2)]
+        if len(level) % 2:
+            paired.append(level[-1])
+        level = paired
+    return level[0].hex()
+
+# ==================== INCREMENTAL TREES ====================
+#
+# A growing tree is kept as its frontier: the roots of the perfect subtrees
+# that make up its leaves, largest first (one per set bit of the leaf
+# count). Appending a leaf merges equal-sized subtrees like a binary carry,
+# so it costs O(log n) and yields the interior nodes it completes.
+
+def append_leaf(frontier: List[bytes], size: int, leaf: bytes) -> List[Tuple[int, int, bytes]]:
+    """
+    Appends a leaf hash to the frontier of a tree of `size` leaves, in place.
+    Returns the (level, position, hash) nodes it completed, the leaf first.
+    """
+    nodes = [(0, size, leaf)]
+    node, level, position = leaf, 0, size
+    while (size >> level) & 1:
+        node = node_hash(frontier.pop(), node)
+        level += 1
+        position >>= 1
+        nodes.append((level, position, node))
+    frontier.append(node)
+    return nodes
+
+def frontier_root(frontier: List[bytes]) -> str:
+    if not frontier:
+        return EMPTY_ROOT
+    root = frontier[-1]
+    for node in reversed(frontier[:-1]):
+        root = node_hash(node, root)
+    return root.hex()
+
+def _split(size: int) -> int:
+    # Largest power of two below size
+    return 1 << ((size - 1).bit_length() - 1)
+
+def perfect_subtrees(start: int, size: int) -> List[Tuple[int, int]]:
+    """
+    (level, position) of the stored nodes whose hashes make up a range. The
+    range must be one of the tree's RFC 6962 splits, as inclusion_ranges
+    returns, so that each part is aligned to its size.
+    """
+    if size & (size - 1) == 0:
+        level = size.bit_length() - 1
+        return [(level, start >> level)]
+    k = _split(size)
+    return perfect_subtrees(start, k) + perfect_subtrees(start + k, size - k)
+
+def range_hash(start: int, size: int, nodes: Dict[Tuple[int, int], bytes]) -> bytes:
+    """Root of the leaf range [start, start + size), a split as in perfect_subtrees."""
+    if size & (size - 1) == 0:
+        level = size.bit_length() - 1
+        return nodes[(level, start >> level)]
+    k = _split(size)
+    return node_hash(range_hash(start, k, nodes), range_hash(start + k, size - k, nodes))
+
+def inclusion_ranges(index: int, size: int, start: int = 0) -> List[Tuple[int, int]]:
+    """
+    Leaf ranges whose hashes form the audit path of leaf `index` in a tree
+    of `size` leaves, from the leaf upwards (RFC 6962 PATH).
+    """
+    if size <= 1:
+        return []
+    k = _split(size)
+    if index < k:
+        return inclusion_ranges(index, k, start) + [(start + k, size - k)]
+    return inclusion_ranges(index - k, size - k, start + k) + [(start, k)]
+
+def verify_inclusion(leaf: bytes, index: int, size: int, path: List[bytes], root: str) -> bool:
+    """Checks an audit path against a root (RFC 9162, section 2.1.3.2)."""
+    if index >= size:
+        return False
+    fn, sn, node = index, size - 1, leaf
+    for sibling in path:
+        if sn == 0:
+            return False
+        if fn & 1 or fn == sn:
+            node = node_hash(sibling, node)
+            while not fn & 1 and fn:
+                fn >>= 1
+                sn >>= 1
+        else:
+            node = node_hash(node, sibling)
+        fn >>= 1
+        sn >>= 1
+    return sn == 0 and node.hex() == root
@@ -0,0 +1,131 @@
+# app/utils/pagination.py
+#
+# Keyset (cursor) pagination for list endpoints. Rows are ordered by
+# (sort column, id) and a page starts strictly after the last row of the
+# previous one, so deep pages cost the same as the first page.
+import base64
+import json
+import os
+import threading
+import time
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Callable, Dict, Hashable, Literal, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import and_, or_
+
+PAGINATION_TOTAL_TTL = int(os.getenv("PAGINATION_TOTAL_TTL", 60))  # seconds
+PAGINATION_TOTAL_CACHE_SIZE = 2048
+
+# Value of the `pagination` query parameter of list endpoints
+PaginationMode = Literal["offset", "cursor"]
+
+def _encode_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {"dt": value.isoformat()}
+    if isinstance(value, date):
+        return {"d": value.isoformat()}
+    if isinstance(value, Decimal):
+        return {"dec": str(value)}
+    if hasattr(value, "value"):  # Enums
+        return value.value
+    return value
+
+def _decode_value(value: Any) -> Any:
+    if isinstance(value, dict):
+        if "dt" in value:
+            return datetime.fromisoformat(value["dt"])
+        if "d" in value:
+            return date.fromisoformat(value["d"])
+        if "dec" in value:
+            return Decimal(value["dec"])
+    return value
+
+def encode_cursor(sort_value: Any, row_id: int) -> str:
+    """
+    Opaque cursor for the position after a row.
+    """
+    payload = json.dumps([_encode_value(sort_value), row_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[Any, int]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return _decode_value(sort_value), int(row_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def keyset_page(
+    query,
+    id_column,
+    cursor: Optional[str],
+    limit: int,
+    sort_column=None,
+    descending: bool = False,
+    entity: Callable[[Any], Any] = lambda row: row
+) -> Dict[str, Any]:
+    """
+    Fetches one page of `query` ordered by (sort_column, id_column) and returns
+    {"items", "next_cursor", "has_more"}. Any ordering already on the query is
+    replaced. NULL sort values come last in either direction. `entity` maps a
+    result row to the mapped object when the query returns tuples.
+    """
+    sort_column = sort_column if sort_column is not None else id_column
+    if descending:
+        order_by = [sort_column.desc().nulls_last(), id_column.desc()]
+    else:
+        order_by = [sort_column.asc().nulls_last(), id_column.asc()]
+    if sort_column is id_column:
+        order_by = order_by[1:]
+
+    if cursor:
+        last_value, last_id = decode_cursor(cursor)
+        after_id = id_column < last_id if descending else id_column > last_id
+        if sort_column is id_column:
+            query = query.filter(after_id)
+        elif last_value is None:
+            query = query.filter(and_(sort_column.is_(None), after_id))
+        else:
+            after_value = sort_column < last_value if descending else sort_column > last_value
+            query = query.filter(or_(
+                after_value,
+                and_(sort_column == last_value, after_id),
+                sort_column.is_(None)
+            ))
+
+    rows = query.order_by(None).order_by(*order_by).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    next_cursor = None
+    if has_more and rows:
+        last = entity(rows[-1])
+        next_cursor = encode_cursor(getattr(last, sort_column.key), getattr(last, id_column.key))
+    return {"items": rows, "next_cursor": next_cursor, "has_more": has_more}
+
+_total_cache = {}
+_total_cache_lock = threading.Lock()
+
+def cached_count(query, cache_key: Hashable, ttl: int = PAGINATION_TOTAL_TTL) -> int:
+    """
+    query.count() memoised for `ttl` seconds per cache key (endpoint, tenant
+    and filters), so cursor pages do not re-run the full COUNT every request.
+    The value may lag recent writes by up to `ttl`.
+    """
+    now = time.monotonic()
+    with _total_cache_lock:
+        entry = _total_cache.get(cache_key)
+        if entry and entry[0] > now:
+            return entry[1]
+
+    total = query.order_by(None).count()
+    with _total_cache_lock:
+        if len(_total_cache) >= PAGINATION_TOTAL_CACHE_SIZE:
+            for key in [key for key, (expires_at, _) in _total_cache.items() if expires_at <= now]:
+                del _total_cache[key]
+            if len(_total_cache) >= PAGINATION_TOTAL_CACHE_SIZE:
+                _total_cache.clear()
+        _total_cache[cache_key] = (now + ttl, total)
+    return total
@@ -0,0 +1,132 @@
+# app/utils/pdf_extraction.py
+import fitz  # PyMuPDF
+import os
+import logging
+import multiprocessing
+from bisect import bisect_right
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+PAGE_CHUNK_SIZE = int(os.getenv("PDF_PAGE_CHUNK_SIZE", 25))
+# Every Celery prefork child (DOCUMENT_WORKER_CONCURRENCY of them, see
+# celery_config) starts its own page pool for each large PDF, so a worker host
+# runs up to DOCUMENT_WORKER_CONCURRENCY * PDF_EXTRACTION_WORKERS extraction
+# processes. The default splits the cores between the children instead of
+# giving each of them all of them; raise it when PDFs are rare and large.
+DOCUMENT_WORKER_CONCURRENCY = int(os.getenv("DOCUMENT_WORKER_CONCURRENCY", 4))
+MAX_WORKERS = int(os.getenv("PDF_EXTRACTION_WORKERS", max(1, (os.cpu_count() or 1) // DOCUMENT_WORKER_CONCURRENCY)))
+
+def _extract_page_range(file_path: str, start: int, stop: int) -> List[str]:
+    """
+    Extracts the text of pages [start, stop) in a worker process.
+    Each worker opens its own handle because fitz documents cannot be pickled.
+    """
+    with fitz.open(file_path) as doc:
+        return [doc[index].get_text() for index in range(start, stop)]
+
+@contextmanager
+def _page_pool(max_workers: int) -> Iterator[Callable[..., Callable[[], List[str]]]]:
+    """
+    Yields submit(file_path, start, stop), which queues a page range and
+    returns a getter for its text.
+
+    Celery's prefork children are daemonic and multiprocessing refuses to
+    start children from a daemonic process, so there the pool comes from
+    billiard, Celery's fork of multiprocessing, which allows it.
+    """
+    if not multiprocessing.current_process().daemon:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            yield lambda *args: executor.submit(_extract_page_range, *args).result
+        return
+
+    from billiard.pool import Pool
+    pool = Pool(processes=max_workers)
+    try:
+        yield lambda *args: pool.apply_async(_extract_page_range, args).get
+    finally:
+        pool.terminate()
+        pool.join()
+
+def iter_pdf_pages(
+    file_path: str,
+    max_workers: Optional[int] = None,
+    chunk_size: int = PAGE_CHUNK_SIZE
+) -> Iterator[Tuple[int, str]]:
+    """
+    Yields (page_number, text) for every page in order, page numbers starting at 1.
+
+    Large documents are split into chunks of `chunk_size` pages that are
+    extracted across a process pool. At most 2 * max_workers chunks are in
+    flight, so memory stays bounded regardless of the page count.
+    """
+    max_workers = max_workers or MAX_WORKERS
+    with fitz.open(file_path) as doc:
+        page_count = doc.page_count
+
+    if page_count <= chunk_size or max_workers <= 1:
+        with fitz.open(file_path) as doc:
+            for index, page in enumerate(doc):
+                yield index + 1, page.get_text()
+        return
+
+    ranges = deque((start, min(start + chunk_size, page_count)) for start in range(0, page_count, chunk_size))
+    with _page_pool(max_workers) as submit:
+        pending = deque()
+        while ranges and len(pending) < max_workers * 2:
+            start, stop = ranges.popleft()
+            pending.append((start, submit(file_path, start, stop)))
+
+        while pending:
+            start, result = pending.popleft()
+            if ranges:
+                next_start, next_stop = ranges.popleft()
+                pending.append((next_start, submit(file_path, next_start, next_stop)))
+            for offset, text in enumerate(result()):
+                yield start + offset + 1, text
+
+def extract_pdf_text(file_path: str, max_workers: Optional[int] = None) -> Tuple[str, List[Dict[str, int]]]:
+    """
+    Returns the full text of a PDF together with its page offsets.
+
+    Offsets are a list of {"page", "start", "end"} character ranges into the
+    returned text, so later stages can map a position back to a page number
+    without re-parsing the file.
+    """
+    parts = []
+    page_offsets = []
+    position = 0
+    for page_number, text in iter_pdf_pages(file_path, max_workers=max_workers):
+        parts.append(text)
+        page_offsets.append({"page": page_number, "start": position, "end": position + len(text)})
+        position += len(text)
+    logger.info(f"Extracted {len(page_offsets)} pages ({position} characters) from {file_path}")
+    return "".join(parts), page_offsets
+
+def page_for_offset(page_offsets: List[Dict[str, int]], offset: int) -> Optional[int]:
+    """
+    Returns the page number containing a character offset, or None if out of range.
+    """
+    if not page_offsets or offset < 0:
+        return None
+    starts = [entry["start"] for entry in page_offsets]
+    index = bisect_right(starts, offset) - 1
+    if index < 0 or offset >= page_offsets[index]["end"]:
+        return None
+    return page_offsets[index]["page"]
+
+def find_page(raw_content: Optional[str], page_offsets: Optional[List[Dict[str, int]]], snippet: Optional[str]) -> Optional[int]:
+    """
+    Locates the page on which `snippet` first appears in the extracted text.
+    """
+    if not raw_content or not page_offsets or not snippet:
+        return None
+    offset = raw_content.find(snippet.strip())
+    if offset == -1:
+        offset = raw_content.lower().find(snippet.strip().lower())
+    if offset == -1:
+        return None
+    return page_for_offset(page_offsets, offset)
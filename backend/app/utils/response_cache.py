@@ -0,0 +1,296 @@
+# app/utils/response_cache.py
+#
+# Per-tenant cache for polled dashboard/analytics responses, keyed by
+# (company_id, endpoint, params). Entries are fresh for `ttl` seconds and may
+# then be served stale for up to `stale_ttl` more while one background refresh
+# recomputes them (stale-while-revalidate).
+#
+# Domain events (app.utils.domain_events) bump a per-(company, event)
+# generation counter. Every key embeds the generations of the events its
+# endpoint depends on, so an event makes exactly those entries unreachable:
+# invalidation is O(1), never scans keys, and the emitting process needs no
+# knowledge of which endpoints are cached.
+#
+# Generations must be shared by every process that writes: the Celery
+# workers and the deadline scheduler emit events too, and a bump made in
+# their memory never reaches the API's entries. The backend therefore
+# defaults to Redis whenever the job queue runs on Redis
+# (DOCUMENT_QUEUE_MODE=redis, the default). RESPONSE_CACHE_BACKEND=memory is
+# only correct for a single API process with no worker or scheduler writing
+# to the database; DOCUMENT_QUEUE_MODE=local defaults to it, so point that
+# setup at a Redis with RESPONSE_CACHE_BACKEND=redis when workers run.
+# An unreachable Redis disables caching rather than failing requests.
+import asyncio
+import functools
+import hashlib
+import inspect
+import json
+import os
+import threading
+import time
+import logging
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from fastapi.encoders import jsonable_encoder
+
+from app.database import SessionLocal
+from app.utils import domain_events
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_CACHE_BACKEND = os.getenv(  # memory | redis
+    "RESPONSE_CACHE_BACKEND", "redis" if os.getenv("DOCUMENT_QUEUE_MODE", "redis") == "redis" else "memory"
+)
+RESPONSE_CACHE_REDIS_URL = os.getenv("RESPONSE_CACHE_REDIS_URL", os.getenv("CELERY_BROKER_URL", "redis://localhost:6379/0"))
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", 30))  # seconds
+RESPONSE_CACHE_STALE_TTL = int(os.getenv("RESPONSE_CACHE_STALE_TTL", 300))  # seconds
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", 4096))
+RESPONSE_CACHE_REFRESH_WORKERS = int(os.getenv("RESPONSE_CACHE_REFRESH_WORKERS", 2))
+
+# ==================== BACKENDS ====================
+
+class CacheBackend:
+    """
+    Storage interface: JSON-compatible values with a time to live, plus
+    integer generation counters.
+    """
+    def get(self, key: str) -> Optional[Any]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: Any, ttl: int):
+        raise NotImplementedError
+
+    def generations(self, keys: List[str]) -> List[int]:
+        raise NotImplementedError
+
+    def bump(self, key: str) -> int:
+        raise NotImplementedError
+
+class MemoryBackend(CacheBackend):
+    def __init__(self, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._generations = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if not entry:
+                return None
+            if entry[0] <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key: str, value: Any, ttl: int):
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def generations(self, keys: List[str]) -> List[int]:
+        with self._lock:
+            return [self._generations.get(key, 0) for key in keys]
+
+    def bump(self, key: str) -> int:
+        with self._lock:
+            self._generations[key] += 1
+            return self._generations[key]
+
+class RedisBackend(CacheBackend):
+    def __init__(self, url: str = RESPONSE_CACHE_REDIS_URL):
+        import redis
+        self._redis = redis.Redis.from_url(url)
+
+    def get(self, key: str) -> Optional[Any]:
+        raw = self._redis.get(key)
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, key: str, value: Any, ttl: int):
+        self._redis.set(key, json.dumps(value), ex=ttl)
+
+    def generations(self, keys: List[str]) -> List[int]:
+        if not keys:
+            return []
+        return [int(raw) if raw is not None else 0 for raw in self._redis.mget(keys)]
+
+    def bump(self, key: str) -> int:
+        return int(self._redis.incr(key))
+
+def create_backend(name: str = RESPONSE_CACHE_BACKEND) -> CacheBackend:
+    if name == "redis":
+        return RedisBackend()
+    return MemoryBackend()
+
+# ==================== CACHE ====================
+
+class ResponseCache:
+    def __init__(self, backend: Optional[CacheBackend] = None):
+        self.backend = backend or create_backend()
+        self._refreshing = set()
+        self._refresh_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=RESPONSE_CACHE_REFRESH_WORKERS, thread_name_prefix="response-cache")
+        self._dependencies = {}  # endpoint -> events that invalidate it
+        for event_name in domain_events.ALL_EVENTS:
+            domain_events.subscribe(event_name, self.invalidate)
+
+    def set_backend(self, backend: CacheBackend):
+        self.backend = backend
+
+    @staticmethod
+    def _generation_key(company_id: int, event_name: str) -> str:
+        return f"rc:gen:{company_id}:{event_name}"
+
+    def invalidate_on(self, endpoint: str, events: Iterable[str]):
+        """
+        Declares which domain events invalidate `endpoint`.
+        """
+        self._dependencies[endpoint] = tuple(sorted(set(events)))
+
+    def key(self, company_id: int, endpoint: str, params: Optional[Dict[str, Any]] = None) -> Optional[str]:
+        """
+        Cache key for a company's endpoint call, or None when the backend is
+        unreachable (the caller then computes without caching).
+        """
+        digest = hashlib.sha256(
+            json.dumps(jsonable_encoder(params or {}), sort_keys=True, default=str).encode("utf-8")
+        ).hexdigest()[:32]
+        events = self._dependencies.get(endpoint, ())
+        try:
+            generations = self.backend.generations([self._generation_key(company_id, event_name) for event_name in events])
+        except Exception as e:
+            logger.warning(f"Response cache unavailable: {e}")
+            return None
+        version = ".".join(str(generation) for generation in generations) or "0"
+        return f"rc:{company_id}:{endpoint}:{version}:{digest}"
+
+    def invalidate(self, company_id: int, event_name: str):
+        """
+        Invalidates every entry of the company that depends on `event_name`.
+        """
+        self.backend.bump(self._generation_key(company_id, event_name))
+
+    def _store(self, key: str, value: Any, ttl: int, stale_ttl: int) -> Any:
+        value = jsonable_encoder(value)
+        if key is None:
+            return value
+        try:
+            self.backend.set(key, {"fresh_until": time.time() + ttl, "value": value}, ttl + stale_ttl)
+        except Exception as e:
+            logger.warning(f"Response cache write failed for {key}: {e}")
+        return value
+
+    def _lookup(self, key: Optional[str]):
+        if key is None:
+            return None
+        try:
+            return self.backend.get(key)
+        except Exception as e:
+            logger.warning(f"Response cache read failed for {key}: {e}")
+            return None
+
+    def _refresh_in_background(self, key: str, refresh: Callable[[], Any], ttl: int, stale_ttl: int):
+        with self._refresh_lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def run():
+            try:
+                self._store(key, refresh(), ttl, stale_ttl)
+            except Exception as e:
+                logger.warning(f"Background refresh of {key} failed: {e}")
+            finally:
+                with self._refresh_lock:
+                    self._refreshing.discard(key)
+
+        self._executor.submit(run)
+
+    def get_or_compute(
+        self,
+        key: Optional[str],
+        compute: Callable[[], Any],
+        refresh: Optional[Callable[[], Any]] = None,
+        ttl: int = RESPONSE_CACHE_TTL,
+        stale_ttl: int = RESPONSE_CACHE_STALE_TTL
+    ) -> Any:
+        """
+        Returns the cached value for `key`, computing it on a miss. A stale
+        hit is returned immediately and `refresh` (a callable that must not
+        rely on the caller's request-scoped session) recomputes it in a
+        background thread.
+        """
+        entry = self._lookup(key)
+        if entry is not None:
+            if entry["fresh_until"] <= time.time() and refresh is not None:
+                self._refresh_in_background(key, refresh, ttl, stale_ttl)
+            return entry["value"]
+        return self._store(key, compute(), ttl, stale_ttl)
+
+    async def aget_or_compute(
+        self,
+        key: Optional[str],
+        compute: Callable[[], Any],
+        refresh: Optional[Callable[[], Any]] = None,
+        ttl: int = RESPONSE_CACHE_TTL,
+        stale_ttl: int = RESPONSE_CACHE_STALE_TTL
+    ) -> Any:
+        """
+        Async variant of get_or_compute; `compute` may return an awaitable.
+        """
+        entry = self._lookup(key)
+        if entry is not None:
+            if entry["fresh_until"] <= time.time() and refresh is not None:
+                self._refresh_in_background(key, refresh, ttl, stale_ttl)
+            return entry["value"]
+        value = compute()
+        if inspect.isawaitable(value):
+            value = await value
+        return self._store(key, value, ttl, stale_ttl)
+
+response_cache = ResponseCache()
+
+def cached_endpoint(
+    endpoint: str,
+    invalidate_on: Iterable[str] = (),
+    ttl: int = RESPONSE_CACHE_TTL,
+    stale_ttl: int = RESPONSE_CACHE_STALE_TTL
+):
+    """
+    Caches an async route handler per company. The handler must take `db`
+    and `current_user` keyword arguments; every other argument is part of
+    the cache key. Background refreshes call the handler again with a fresh
+    session. Place it below the router decorator.
+    """
+    def decorator(func):
+        response_cache.invalidate_on(endpoint, invalidate_on)
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            company_id = getattr(kwargs.get("current_user"), "company_id", None)
+            if company_id is None:
+                return await func(*args, **kwargs)
+
+            params = {name: value for name, value in kwargs.items() if name not in ("db", "current_user")}
+
+            def refresh():
+                db = SessionLocal()
+                try:
+                    return asyncio.run(func(*args, **{**kwargs, "db": db}))
+                finally:
+                    db.close()
+
+            return await response_cache.aget_or_compute(
+                response_cache.key(company_id, endpoint, params),
+                lambda: func(*args, **kwargs),
+                refresh,
+                ttl=ttl,
+                stale_ttl=stale_ttl
+            )
+        return wrapper
+    return decorator
@@ -0,0 +1,264 @@
+# app/utils/semantic_index.py
+#
+# Semantic (vector) search over extracted document text, stored in a local
+# Chroma collection. Document.raw_content is split into overlapping chunks
+# after extraction and each chunk is embedded with a small CPU-only model
+# (all-MiniLM-L6-v2 through onnxruntime by default), so indexing and search
+# run offline once the model files are on disk.
+#
+# Chroma's persistent client is not safe for concurrent writers in several
+# processes; set CHROMA_HOST to share one Chroma server between the API and
+# the workers instead.
+import hashlib
+import os
+import logging
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+import chromadb
+from chromadb.utils import embedding_functions
+from sqlalchemy.orm import Session
+
+from app.models import Document
+from app.utils.pdf_extraction import page_for_offset
+
+logger = logging.getLogger(__name__)
+
+CHROMA_DB_PATH = os.getenv("CHROMA_DB_PATH", str(Path(__file__).resolve().parents[2] / "chroma_db"))
+CHROMA_HOST = os.getenv("CHROMA_HOST")
+CHROMA_PORT = int(os.getenv("CHROMA_PORT", 8000))
+COLLECTION_NAME = os.getenv("SEMANTIC_COLLECTION", "document_chunks")
+
+# "onnx" (bundled MiniLM, no torch needed) or "sentence-transformers"
+EMBEDDING_BACKEND = os.getenv("SEMANTIC_EMBEDDING_BACKEND", "onnx")
+EMBEDDING_MODEL = os.getenv("SEMANTIC_EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+# Directory holding pre-downloaded ONNX model files, for hosts without network access
+EMBEDDING_MODEL_DIR = os.getenv("SEMANTIC_EMBEDDING_MODEL_DIR")
+
+CHUNK_CHARS = int(os.getenv("SEMANTIC_CHUNK_CHARS", 1200))
+CHUNK_OVERLAP = int(os.getenv("SEMANTIC_CHUNK_OVERLAP", 200))
+MAX_CHUNKS_PER_DOCUMENT = int(os.getenv("SEMANTIC_MAX_CHUNKS", 400))
+UPSERT_BATCH_SIZE = 64
+SNIPPET_CHARS = 300
+
+_collection = None
+_collection_lock = threading.Lock()
+
+def _embedding_function():
+    if EMBEDDING_BACKEND == "sentence-transformers":
+        return embedding_functions.SentenceTransformerEmbeddingFunction(model_name=EMBEDDING_MODEL, device="cpu")
+    embedder = embedding_functions.ONNXMiniLM_L6_V2(preferred_providers=["CPUExecutionProvider"])
+    if EMBEDDING_MODEL_DIR:
+        embedder.DOWNLOAD_PATH = Path(EMBEDDING_MODEL_DIR)
+    return embedder
+
+def get_collection():
+    """
+    Lazily opens the chunk collection (the embedding model is only loaded
+    when it is first used).
+    """
+    global _collection
+    if _collection is None:
+        with _collection_lock:
+            if _collection is None:
+                if CHROMA_HOST:
+                    client = chromadb.HttpClient(host=CHROMA_HOST, port=CHROMA_PORT)
+                else:
+                    client = chromadb.PersistentClient(path=CHROMA_DB_PATH)
+                _collection = client.get_or_create_collection(
+                    name=COLLECTION_NAME,
+                    embedding_function=_embedding_function(),
+                    metadata={"hnsw:space": "cosine"}
+                )
+    return _collection
+
+def chunk_text(text: str, chunk_chars: int = CHUNK_CHARS, overlap: int = CHUNK_OVERLAP) -> List[Dict[str, Any]]:
+    """
+    Splits text into overlapping chunks ({"start", "text"}), preferring to
+    break at a paragraph, line or sentence boundary near the chunk end.
+    """
+    chunks = []
+    length = len(text or "")
+    start = 0
+    while start < length and len(chunks) < MAX_CHUNKS_PER_DOCUMENT:
+        end = min(start + chunk_chars, length)
+        if end < length:
+            window = text[start + chunk_chars // 2:end]
+            for separator in ("\n\n", "\n", ". "):
+                position = window.rfind(separator)
+                if position != -1:
+                    end = start + chunk_chars // 2 + position + len(separator)
+                    break
+        piece = text[start:end].strip()
+        if piece:
+            chunks.append({"start": start, "text": piece})
+        if end >= length:
+            break
+        start = max(end - overlap, start + 1)
+    return chunks
+
+def _content_hash(text: str) -> str:
+    return hashlib.sha256((text or "").encode("utf-8")).hexdigest()
+
+def _chunk_id(document_id: int, index: int) -> str:
+    return f"doc-{document_id}-{index}"
+
+def _indexed_hash(collection, document_id: int) -> Optional[str]:
+    existing = collection.get(where={"document_id": document_id}, limit=1, include=["metadatas"])
+    metadatas = existing.get("metadatas") or []
+    return metadatas[0].get("content_hash") if metadatas else None
+
+def index_document(db: Session, document_id: int, force: bool = False) -> int:
+    """
+    Embeds the raw text of one document. Unchanged documents are skipped
+    (the content hash is stored on every chunk); otherwise the old chunks are
+    replaced. Returns the number of chunks written.
+    """
+    document = db.query(
+        Document.id, Document.title, Document.company_id, Document.raw_content,
+        Document.page_offsets, Document.is_deleted
+    ).filter(Document.id == document_id).first()
+    if not document or document.is_deleted or not (document.raw_content or "").strip():
+        remove_document(document_id)
+        return 0
+
+    collection = get_collection()
+    content_hash = _content_hash(document.raw_content)
+    if not force and _indexed_hash(collection, document_id) == content_hash:
+        return 0
+
+    chunks = chunk_text(document.raw_content)
+    collection.delete(where={"document_id": document_id})
+    for offset in range(0, len(chunks), UPSERT_BATCH_SIZE):
+        batch = chunks[offset:offset + UPSERT_BATCH_SIZE]
+        collection.upsert(
+            ids=[_chunk_id(document_id, offset + i) for i in range(len(batch))],
+            documents=[chunk["text"] for chunk in batch],
+            metadatas=[
+                {
+                    "document_id": document_id,
+                    "company_id": document.company_id or 0,
+                    "chunk": offset + i,
+                    "start": chunk["start"],
+                    "page": page_for_offset(document.page_offsets, chunk["start"]) or 0,
+                    "content_hash": content_hash,
+                }
+                for i, chunk in enumerate(batch)
+            ]
+        )
+    logger.info(f"Indexed {len(chunks)} chunks for document {document_id}")
+    return len(chunks)
+
+def remove_document(document_id: int):
+    try:
+        get_collection().delete(where={"document_id": document_id})
+    except Exception as e:
+        logger.warning(f"Failed to remove document {document_id} from the semantic index: {e}")
+
+def _where(company_id: int, document_ids: Optional[Iterable[int]] = None, exclude_document_id: Optional[int] = None) -> Dict[str, Any]:
+    conditions = [{"company_id": company_id}]
+    if document_ids is not None:
+        conditions.append({"document_id": {"$in": list(document_ids)}})
+    if exclude_document_id is not None:
+        conditions.append({"document_id": {"$ne": exclude_document_id}})
+    return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+def _group_by_document(result: Dict[str, Any], limit: int) -> List[Dict[str, Any]]:
+    # Several chunks of one document may match; keep the closest per document
+    best = {}
+    for query_index in range(len(result.get("ids") or [])):
+        for text, metadata, distance in zip(
+            result["documents"][query_index], result["metadatas"][query_index], result["distances"][query_index]
+        ):
+            document_id = metadata["document_id"]
+            if document_id not in best or distance < best[document_id]["distance"]:
+                best[document_id] = {
+                    "document_id": document_id,
+                    "distance": distance,
+                    "page": metadata.get("page") or None,
+                    "snippet": text[:SNIPPET_CHARS],
+                }
+    hits = sorted(best.values(), key=lambda hit: hit["distance"])[:limit]
+    for hit in hits:
+        hit["score"] = round(1 - hit.pop("distance"), 4)
+    return hits
+
+def semantic_search(
+    company_id: int,
+    query: str,
+    limit: int = 10,
+    document_ids: Optional[Iterable[int]] = None
+) -> List[Dict[str, Any]]:
+    """
+    Documents of a company whose text is closest in meaning to `query`, best
+    first, with the matching chunk as snippet. `document_ids` restricts the
+    search to a subset (e.g. the evidence of one audit).
+    """
+    document_ids = list(document_ids) if document_ids is not None else None
+    if document_ids == []:
+        return []
+    result = get_collection().query(
+        query_texts=[query],
+        n_results=limit * 4,  # over-fetch chunks so grouping still yields `limit` documents
+        where=_where(company_id, document_ids),
+        include=["documents", "metadatas", "distances"]
+    )
+    return _group_by_document(result, limit)
+
+def similar_documents(
+    company_id: int,
+    document_id: int,
+    limit: int = 10,
+    document_ids: Optional[Iterable[int]] = None,
+    sample_chunks: int = 5
+) -> List[Dict[str, Any]]:
+    """
+    Documents whose chunks lie closest to the stored chunks of `document_id`.
+    Only the first `sample_chunks` chunks are used as queries, which keeps the
+    lookup cheap for long documents.
+    """
+    document_ids = list(document_ids) if document_ids is not None else None
+    if document_ids == []:
+        return []
+    collection = get_collection()
+    source = collection.get(
+        where={"document_id": document_id},
+        limit=sample_chunks,
+        include=["embeddings"]
+    )
+    embeddings = source.get("embeddings")
+    if embeddings is None or len(embeddings) == 0:
+        return []
+    result = collection.query(
+        query_embeddings=list(embeddings),
+        n_results=limit * 2,
+        where=_where(company_id, document_ids, exclude_document_id=document_id),
+        include=["documents", "metadatas", "distances"]
+    )
+    return _group_by_document(result, limit)
+
+def attach_documents(db: Session, hits: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Adds title and file type to search hits and drops documents that were
+    deleted since they were indexed.
+    """
+    if not hits:
+        return []
+    documents = {
+        row.id: row for row in db.query(Document.id, Document.title, Document.file_type, Document.created_at).filter(
+            Document.id.in_([hit["document_id"] for hit in hits]),
+            Document.is_deleted == False
+        ).all()
+    }
+    results = []
+    for hit in hits:
+        document = documents.get(hit["document_id"])
+        if document:
+            results.append({
+                **hit,
+                "title": document.title,
+                "file_type": document.file_type,
+                "created_at": document.created_at.isoformat() if document.created_at else None,
+            })
+    return results
@@ -0,0 +1,124 @@
+# app/utils/timer_wheel.py
+#
+# Hierarchical timing wheel (Varghese & Lauck): timers are hashed into
+# buckets by due tick, with coarser wheels for later timers. Scheduling and
+# cancelling are O(1); advancing fires the current bucket of the finest wheel
+# and, whenever a coarser wheel turns over, re-hashes its next bucket into the
+# finer ones. A timer is therefore touched at most once per level no matter
+# how many timers are pending, unlike a sorted queue that is re-examined on
+# every insert.
+#
+# With the default 1 second tick and (60, 60, 24) slots the wheel spans one
+# day; timers beyond that wait in an overflow list until the top wheel turns.
+from math import ceil, prod
+from typing import Any, Dict, Hashable, List, Optional, Sequence, Tuple
+
+class TimerWheel:
+    def __init__(self, now: float, tick: float = 1.0, slots: Sequence[int] = (60, 60, 24)):
+        self.tick = tick
+        self.slots = tuple(slots)
+        self._spans = [prod(self.slots[:level]) for level in range(len(self.slots))]
+        self._current = int(now // tick)
+        self._wheels: List[List[Dict[Hashable, Tuple[int, Any]]]] = [[{} for _ in range(size)] for size in self.slots]
+        self._overflow: Dict[Hashable, Tuple[int, Any]] = {}
+        self._ready: Dict[Hashable, Tuple[int, Any]] = {}
+        self._where: Dict[Hashable, Dict[Hashable, Tuple[int, Any]]] = {}
+
+    @property
+    def horizon(self) -> float:
+        """Seconds ahead that fit in the wheels without overflowing."""
+        return self.tick * prod(self.slots)
+
+    @property
+    def time(self) -> float:
+        """Time the wheel has advanced to; every timer due at or before it has expired."""
+        return self._current * self.tick
+
+    def __len__(self) -> int:
+        return len(self._where)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._where
+
+    def due_tick(self, key: Hashable) -> Optional[int]:
+        bucket = self._where.get(key)
+        return bucket[key][0] if bucket is not None else None
+
+    def _bucket(self, due: int) -> Dict[Hashable, Tuple[int, Any]]:
+        if due <= self._current:
+            return self._ready
+        for level, (span, size) in enumerate(zip(self._spans, self.slots)):
+            if due // span - self._current // span < size:
+                return self._wheels[level][(due // span) % size]
+        return self._overflow
+
+    def _place(self, key: Hashable, due: int, payload: Any):
+        bucket = self._bucket(due)
+        bucket[key] = (due, payload)
+        self._where[key] = bucket
+
+    def schedule(self, key: Hashable, due: float, payload: Any = None) -> bool:
+        """
+        Schedules `payload` to fire at `due` (seconds, same clock as `now`),
+        replacing any timer with the same key. Returns False if the key was
+        already scheduled for the same tick.
+        """
+        due_tick = int(ceil(due / self.tick))
+        if self.due_tick(key) == due_tick:
+            return False
+        self.cancel(key)
+        self._place(key, due_tick, payload)
+        return True
+
+    def cancel(self, key: Hashable) -> bool:
+        bucket = self._where.pop(key, None)
+        if bucket is None:
+            return False
+        del bucket[key]
+        return True
+
+    def _cascade(self, bucket: Dict[Hashable, Tuple[int, Any]]):
+        entries = list(bucket.items())
+        bucket.clear()
+        for key, (due, payload) in entries:
+            self._place(key, due, payload)
+
+    def advance(self, now: float) -> List[Tuple[Hashable, float, Any]]:
+        """Moves the wheel to `now` and returns the (key, due, payload) timers that expired, in due order."""
+        target = int(now // self.tick)
+        while self._current < target:
+            if len(self._where) == len(self._ready):  # nothing left in the wheels
+                self._current = target
+                break
+            self._current += 1
+            top = len(self.slots) - 1
+            if self._current % (self._spans[top] * self.slots[top]) == 0:
+                self._cascade(self._overflow)
+            for level in range(top, 0, -1):
+                span = self._spans[level]
+                if self._current % span == 0:
+                    self._cascade(self._wheels[level][(self._current // span) % self.slots[level]])
+            self._cascade(self._wheels[0][self._current % self.slots[0]])
+
+        expired = sorted(self._ready.items(), key=lambda item: item[1][0])
+        self._ready.clear()
+        for key, _ in expired:
+            del self._where[key]
+        return [(key, due * self.tick, payload) for key, (due, payload) in expired]
+
+    def next_expiry(self, limit: float) -> float:
+        """
+        Seconds until the next tick with work on it, capped at `limit`, so a
+        caller can sleep instead of polling every tick.
+        """
+        if self._ready:
+            return 0.0
+        bound = max(int(limit // self.tick), 1)
+        for step in range(1, min(bound, self.slots[0]) + 1):
+            tick = self._current + step
+            if self._wheels[0][tick % self.slots[0]] or any(
+                tick % self._spans[level] == 0 and self._wheels[level][(tick // self._spans[level]) % self.slots[level]]
+                for level in range(1, len(self.slots))
+            ):
+                return step * self.tick
+        return min(bound, self.slots[0]) * self.tick
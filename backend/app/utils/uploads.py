@@ -0,0 +1,241 @@
+# app/utils/uploads.py
+#
+# Single-pass ingest of uploaded files: the upload is copied to a temporary
+# file next to its destination in fixed-size chunks while its SHA-256 and
+# size are computed, the copy stops as soon as the size limit is exceeded,
+# and the MIME type is sniffed from the file's leading bytes rather than
+# taken from the client's Content-Type. The file only appears under its
+# final name once it has been fully written and accepted.
+#
+# ingest_uploads does the same for a multi-file request, expanding ZIP
+# archives into their members and storing several files concurrently.
+import asyncio
+import hashlib
+import os
+import tempfile
+import zipfile
+import logging
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # 1 MB
+SNIFF_BYTES = 8192
+BULK_UPLOAD_MAX_FILES = int(os.getenv("BULK_UPLOAD_MAX_FILES", 200))
+BULK_UPLOAD_CONCURRENCY = int(os.getenv("BULK_UPLOAD_CONCURRENCY", 4))
+ZIP_TYPES = ("application/zip", "application/x-zip-compressed")
+
+PDF = "application/pdf"
+JPEG = "image/jpeg"
+PNG = "image/png"
+XLSX = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+XLS = "application/vnd.ms-excel"
+CSV = "text/csv"
+
+@dataclass
+class IngestedFile:
+    path: str
+    sha256: str
+    size: int
+    mime_type: Optional[str]
+    filename: str = ""
+
+def _looks_like_text(head: bytes) -> bool:
+    if b"\x00" in head:
+        return False
+    try:
+        # A multi-byte character may be cut at the end of the sample
+        head.decode("utf-8")
+        return True
+    except UnicodeDecodeError as e:
+        if e.start >= len(head) - 3:
+            return True
+    try:
+        head.decode("cp1252")
+        return True
+    except UnicodeDecodeError:
+        return False
+
+def sniff_mime_type(head: bytes, path: str, filename: str = "", declared: Optional[str] = None) -> Optional[str]:
+    """
+    MIME type from magic bytes, or None when the content is none of the
+    supported types. ZIP and OLE2 containers are told apart by their
+    contents; plain text is accepted as CSV when the upload says it is one.
+    """
+    if head.startswith(b"%PDF-"):
+        return PDF
+    if head.startswith(b"\xff\xd8\xff"):
+        return JPEG
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return PNG
+    if head.startswith(b"PK\x03\x04"):
+        try:
+            with zipfile.ZipFile(path) as archive:
+                if any(name.startswith("xl/") for name in archive.namelist()):
+                    return XLSX
+        except zipfile.BadZipFile:
+            pass
+        return None
+    if head.startswith(b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"):
+        # OLE2 compound file: also used by .doc/.ppt, so rely on the name
+        if filename.lower().endswith(".xls") or declared == XLS:
+            return XLS
+        return None
+    if head and _looks_like_text(head) and (filename.lower().endswith(".csv") or declared == CSV):
+        return CSV
+    return None
+
+def ingest_upload(
+    file,
+    destination: str,
+    max_size: Optional[int] = None,
+    allowed_types: Optional[Iterable[str]] = None
+) -> IngestedFile:
+    """
+    Streams an UploadFile to `destination` in one pass. Raises 400 as soon as
+    the upload exceeds `max_size` bytes or when its sniffed type is not in
+    `allowed_types`; nothing is left on disk in either case.
+    """
+    allowed_types = list(allowed_types) if allowed_types is not None else None
+    if max_size is not None and getattr(file, "size", None) and file.size > max_size:
+        # Size known from the multipart part: reject without reading it
+        raise HTTPException(status_code=400, detail=f"File size exceeds limit of {max_size / 1024 / 1024} MB")
+
+    directory = os.path.dirname(destination) or "."
+    os.makedirs(directory, exist_ok=True)
+    sha256 = hashlib.sha256()
+    size = 0
+    head = b""
+    handle, temp_path = tempfile.mkstemp(dir=directory, suffix=".part")
+    try:
+        with os.fdopen(handle, "wb") as buffer:
+            for chunk in iter(lambda: file.file.read(UPLOAD_CHUNK_SIZE), b""):
+                size += len(chunk)
+                if max_size is not None and size > max_size:
+                    raise HTTPException(status_code=400, detail=f"File size exceeds limit of {max_size / 1024 / 1024} MB")
+                if len(head) < SNIFF_BYTES:
+                    head += chunk[:SNIFF_BYTES - len(head)]
+                sha256.update(chunk)
+                buffer.write(chunk)
+
+        mime_type = sniff_mime_type(head, temp_path, file.filename or "", file.content_type)
+        if allowed_types is not None and mime_type not in allowed_types:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Invalid file type. Allowed types are: {', '.join(allowed_types)}"
+            )
+        os.replace(temp_path, destination)
+    except HTTPException:
+        _discard(temp_path)
+        raise
+    except Exception as e:
+        logger.error(f"Error saving file {destination}: {e}")
+        _discard(temp_path)
+        raise HTTPException(status_code=500, detail="File upload failed")
+    finally:
+        file.file.close()
+
+    return IngestedFile(
+        path=destination, sha256=sha256.hexdigest(), size=size, mime_type=mime_type, filename=file.filename or ""
+    )
+
+def _discard(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+# ==================== MULTI-FILE UPLOADS ====================
+
+@dataclass
+class _ArchiveMember:
+    """UploadFile-like view of one file inside an uploaded ZIP."""
+    file: Any
+    filename: str
+    size: int
+    content_type: Optional[str] = None
+
+def _is_zip_upload(file) -> bool:
+    return (file.filename or "").lower().endswith(".zip") or file.content_type in ZIP_TYPES
+
+def _archive_members(archive: zipfile.ZipFile) -> List[zipfile.ZipInfo]:
+    return [
+        info for info in archive.infolist()
+        if not info.is_dir()
+        and not info.filename.startswith("__MACOSX/")
+        and not os.path.basename(info.filename).startswith(".")
+    ]
+
+def _open_archives(files) -> Tuple[List[Tuple[Any, Optional[zipfile.ZipFile], List[zipfile.ZipInfo]]], List[Dict[str, str]]]:
+    groups, rejected = [], []
+    for file in files:
+        if not _is_zip_upload(file):
+            groups.append((file, None, []))
+            continue
+        try:
+            archive = zipfile.ZipFile(file.file)
+        except zipfile.BadZipFile:
+            rejected.append({"filename": file.filename, "reason": "Not a valid ZIP archive"})
+            continue
+        groups.append((file, archive, _archive_members(archive)))
+    return groups, rejected
+
+def _ingest_group(file, archive, members, destination_for, max_size, allowed_types):
+    # Members of one archive share its file handle, so they are read in turn
+    stored, rejected = [], []
+    if archive is None:
+        entries = [(file, None)]
+    else:
+        entries = [
+            (_ArchiveMember(file=None, filename=os.path.basename(info.filename), size=info.file_size), info)
+            for info in members
+        ]
+    for upload, info in entries:
+        try:
+            if info is not None:
+                upload.file = archive.open(info)
+            stored.append(ingest_upload(upload, destination_for(upload.filename), max_size, allowed_types))
+        except HTTPException as e:
+            rejected.append({"filename": upload.filename, "reason": e.detail})
+    if archive is not None:
+        archive.close()
+        file.file.close()
+    return stored, rejected
+
+async def ingest_uploads(
+    files,
+    destination_for: Callable[[str], str],
+    max_size: Optional[int] = None,
+    allowed_types: Optional[Iterable[str]] = None,
+    max_files: int = BULK_UPLOAD_MAX_FILES
+) -> Tuple[List[IngestedFile], List[Dict[str, str]]]:
+    """
+    Stores many uploads (ZIP archives are expanded into their members) with
+    up to BULK_UPLOAD_CONCURRENCY files written at once. `destination_for`
+    maps a file name to its storage path. Returns the stored files and the
+    rejected ones ({"filename", "reason"}); one bad file never fails the rest.
+    """
+    allowed_types = list(allowed_types) if allowed_types is not None else None
+    groups, rejected = await run_in_threadpool(_open_archives, files)
+    count = sum(len(members) if archive is not None else 1 for _, archive, members in groups)
+    if count > max_files:
+        for file, archive, _ in groups:
+            if archive is not None:
+                archive.close()
+        raise HTTPException(status_code=400, detail=f"Too many files: {count} (limit {max_files})")
+
+    semaphore = asyncio.Semaphore(BULK_UPLOAD_CONCURRENCY)
+
+    async def run(group):
+        async with semaphore:
+            return await run_in_threadpool(_ingest_group, *group, destination_for, max_size, allowed_types)
+
+    stored = []
+    for group_stored, group_rejected in await asyncio.gather(*(run(group) for group in groups)):
+        stored.extend(group_stored)
+        rejected.extend(group_rejected)
+    return stored, rejected
@@ -0,0 +1,245 @@
+# app/utils/version_deltas.py
+#
+# Optional delta storage for the versions of text documents (CSV, plain
+# text). Re-uploads of a spreadsheet export usually change a handful of rows,
+# yet every version kept a full copy of the file. With VERSION_DELTAS_ENABLED
+# a worker re-encodes each new DocumentVersion as a reverse line delta against
+# the next newer content (the following version or the document's current
+# file) and drops its blob reference, so the blob store can reclaim the file.
+#
+# Every VERSION_SNAPSHOT_INTERVAL-th version is kept as a full file, which
+# bounds a reconstruction to fewer than that many deltas starting from a full
+# file. Reconstructed versions are cached under VERSION_CACHE_DIR by content
+# hash, so repeated and ranged reads of a version are plain file reads.
+#
+# Deltas operate on lines and are applied to bytes, so a version is rebuilt
+# byte for byte; its SHA-256 is checked before the full copy is released.
+# XLSX files are not delta-encoded: they are ZIP archives whose compressed
+# bytes change wholesale on every save and could not be reproduced exactly
+# from a row delta. Identical re-uploads of any type are still stored once by
+# the blob store.
+import hashlib
+import os
+import struct
+import tempfile
+import zlib
+import logging
+from difflib import SequenceMatcher
+from typing import List, Optional, Tuple
+
+from sqlalchemy.orm import Session, selectinload
+
+from app.models import Document, DocumentVersion, DocumentVersionDelta
+from app.utils import blob_store
+from app.utils.uploads import CSV
+
+logger = logging.getLogger(__name__)
+
+VERSION_DELTAS_ENABLED = os.getenv("VERSION_DELTAS_ENABLED", "false").lower() == "true"
+VERSION_SNAPSHOT_INTERVAL = int(os.getenv("VERSION_SNAPSHOT_INTERVAL", 10))
+VERSION_DELTA_MAX_BYTES = int(os.getenv("VERSION_DELTA_MAX_BYTES", 64 * 1024 * 1024))
+VERSION_DELTA_MAX_RATIO = 0.5  # keep the full file unless the delta at least halves it
+VERSION_CACHE_DIR = os.getenv("VERSION_CACHE_DIR", os.path.join("uploads", "version_cache"))
+VERSION_CACHE_MAX_FILES = int(os.getenv("VERSION_CACHE_MAX_FILES", 256))
+DELTA_TYPES = (CSV, "text/plain")
+
+_MAGIC = b"VD1"
+_COPY = 0    # tag, first base line, line count
+_INSERT = 1  # tag, byte length, bytes
+_COPY_OP = struct.Struct(">BII")
+_INSERT_OP = struct.Struct(">BI")
+
+def is_delta_candidate(file_type: Optional[str]) -> bool:
+    return VERSION_DELTAS_ENABLED and file_type in DELTA_TYPES
+
+# ==================== DELTA FORMAT ====================
+
+def encode_delta(base: bytes, target: bytes) -> bytes:
+    """
+    Compressed list of copy-lines-from-base / insert-bytes operations that
+    turns `base` into `target`.
+    """
+    base_lines = base.splitlines(keepends=True)
+    target_lines = target.splitlines(keepends=True)
+    ops = [_MAGIC]
+    matcher = SequenceMatcher(None, base_lines, target_lines, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            ops.append(_COPY_OP.pack(_COPY, i1, i2 - i1))
+        elif j2 > j1:
+            inserted = b"".join(target_lines[j1:j2])
+            ops.append(_INSERT_OP.pack(_INSERT, len(inserted)))
+            ops.append(inserted)
+    return zlib.compress(b"".join(ops))
+
+def apply_delta(base: bytes, delta: bytes) -> bytes:
+    data = zlib.decompress(delta)
+    if not data.startswith(_MAGIC):
+        raise ValueError("Unknown version delta format")
+    base_lines = base.splitlines(keepends=True)
+    parts = []
+    offset = len(_MAGIC)
+    while offset < len(data):
+        if data[offset] == _COPY:
+            _, start, count = _COPY_OP.unpack_from(data, offset)
+            parts.extend(base_lines[start:start + count])
+            offset += _COPY_OP.size
+        else:
+            _, length = _INSERT_OP.unpack_from(data, offset)
+            offset += _INSERT_OP.size
+            parts.append(data[offset:offset + length])
+            offset += length
+    return b"".join(parts)
+
+# ==================== RECONSTRUCTION ====================
+
+def _content_sha(version: DocumentVersion) -> Optional[str]:
+    if version.delta_record is not None:
+        return version.delta_record.content_sha256
+    return blob_store.sha_for_path(version.file_path)
+
+def _cache_path(sha256: str, document: Document) -> str:
+    extension = os.path.splitext(document.file_path or "")[1].lower()
+    return os.path.join(VERSION_CACHE_DIR, f"{sha256}{extension}")
+
+def _cached(sha256: str, document: Document) -> Optional[str]:
+    path = _cache_path(sha256, document)
+    try:
+        os.utime(path)  # most recently used survives pruning
+        return path
+    except OSError:
+        return None
+
+def _write_cache(sha256: str, document: Document, content: bytes) -> str:
+    os.makedirs(VERSION_CACHE_DIR, exist_ok=True)
+    handle, temp_path = tempfile.mkstemp(dir=VERSION_CACHE_DIR, suffix=".part")
+    with os.fdopen(handle, "wb") as buffer:
+        buffer.write(content)
+    path = _cache_path(sha256, document)
+    os.replace(temp_path, path)
+    _prune_cache()
+    return path
+
+def _prune_cache():
+    try:
+        entries = [entry for entry in os.scandir(VERSION_CACHE_DIR) if not entry.name.endswith(".part")]
+    except FileNotFoundError:
+        return
+    if len(entries) <= VERSION_CACHE_MAX_FILES:
+        return
+    entries.sort(key=lambda entry: entry.stat().st_mtime)
+    for entry in entries[:len(entries) - VERSION_CACHE_MAX_FILES]:
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
+
+def _read(path: str) -> bytes:
+    with open(path, "rb") as source:
+        return source.read()
+
+def _reconstruct(db: Session, document: Document, version: DocumentVersion) -> bytes:
+    # Newer versions in order; a base is always newer than the delta that
+    # uses it, so the walk ends even when an old content comes back later
+    newer = db.query(DocumentVersion).options(selectinload(DocumentVersion.delta_record)).filter(
+        DocumentVersion.document_id == version.document_id,
+        DocumentVersion.version_number > version.version_number
+    ).order_by(DocumentVersion.version_number).all()
+
+    deltas: List[bytes] = []
+    current = version
+    while True:
+        record = current.delta_record
+        deltas.append(record.delta)
+        base_path = _cached(record.base_sha256, document)
+        if base_path:
+            break
+        base = next((
+            row for row in newer
+            if row.version_number > current.version_number and _content_sha(row) == record.base_sha256
+        ), None)
+        if base is None:
+            if blob_store.sha_for_path(document.file_path) != record.base_sha256:
+                raise LookupError(f"Base content of version {version.id} is missing")
+            base_path = document.file_path
+            break
+        if base.delta_record is None:
+            base_path = base.file_path
+            break
+        current = base
+
+    content = _read(base_path)
+    for delta in reversed(deltas):
+        content = apply_delta(content, delta)
+    return content
+
+def version_file(db: Session, document: Document, version: DocumentVersion) -> Tuple[Optional[str], Optional[str]]:
+    """
+    (path, sha256) of a version's file. Delta-stored versions are rebuilt
+    into the reconstruction cache on first access.
+    """
+    record = version.delta_record
+    if record is None:
+        return version.file_path, blob_store.sha_for_path(version.file_path)
+    cached = _cached(record.content_sha256, document)
+    if cached:
+        return cached, record.content_sha256
+    content = _reconstruct(db, document, version)
+    if hashlib.sha256(content).hexdigest() != record.content_sha256:
+        raise ValueError(f"Reconstructed version {version.id} does not match its hash")
+    return _write_cache(record.content_sha256, document, content), record.content_sha256
+
+# ==================== ENCODING ====================
+
+def encode_version(db: Session, version_id: int) -> str:
+    """
+    Replaces a version's full file with a delta against the next newer
+    content when that saves at least half of it. Returns what was done.
+    """
+    version = db.query(DocumentVersion).filter(
+        DocumentVersion.id == version_id
+    ).with_for_update().first()
+    if version is None:
+        return "missing"
+    document = version.document
+    if version.delta_record is not None or not is_delta_candidate(document.file_type):
+        return "skipped"
+    if version.version_number % VERSION_SNAPSHOT_INTERVAL == 0:
+        return "snapshot"
+    target_sha = blob_store.sha_for_path(version.file_path)
+    if target_sha is None or not os.path.exists(version.file_path):
+        return "skipped"  # files outside the blob store are left alone
+
+    next_version = db.query(DocumentVersion).filter(
+        DocumentVersion.document_id == version.document_id,
+        DocumentVersion.version_number > version.version_number
+    ).order_by(DocumentVersion.version_number).first()
+    if next_version is not None:
+        base_path, base_sha = version_file(db, document, next_version)
+    else:
+        base_path, base_sha = document.file_path, blob_store.sha_for_path(document.file_path)
+    if base_sha is None or not base_path or not os.path.exists(base_path):
+        return "skipped"
+
+    target_size = os.path.getsize(version.file_path)
+    if max(target_size, os.path.getsize(base_path)) > VERSION_DELTA_MAX_BYTES:
+        return "skipped"
+    base, target = _read(base_path), _read(version.file_path)
+    delta = encode_delta(base, target)
+    if len(delta) > target_size * VERSION_DELTA_MAX_RATIO:
+        return "snapshot"
+    if hashlib.sha256(apply_delta(base, delta)).hexdigest() != target_sha:
+        logger.error(f"Delta for version {version.id} does not reproduce its file; keeping the full copy")
+        return "skipped"
+
+    version.delta_record = DocumentVersionDelta(
+        document_id=version.document_id,
+        content_sha256=target_sha,
+        base_sha256=base_sha,
+        size=target_size,
+        delta=delta
+    )
+    # Releases the blob reference; collect_garbage reclaims the file
+    version.file_path = None
+    db.commit()
+    return "delta"
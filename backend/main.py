@@ -22,9 +22,13 @@ from app.routers.audit.analytics_routes import analytics_router
 from app.routers.audit.enhanced_routes import enhanced_router
 from app.routers.audit.document_submission_routes import router as document_submission_router
 from app.routers.audit.compliance_routes import compliance_router
+from app.routers.security_routes import router as security_router
+from app.routers.verification_routes import router as verification_router
 from app.database import Base, engine
+from app.schema_updates import apply_schema_updates
 
 Base.metadata.create_all(bind=engine)
+apply_schema_updates(engine)
 
 app = FastAPI(title="FinAudit AI API")
 
@@ -60,6 +64,8 @@ app.include_router(analytics_router)
 app.include_router(enhanced_router)
 app.include_router(document_submission_router)
 app.include_router(compliance_router)
+app.include_router(security_router, prefix="/api", tags=["Audit Security"])
+app.include_router(verification_router, prefix="/api", tags=["Submission Verification"])
 
 @app.get("/")
 async def root():
@@ -0,0 +1,4 @@
+import os
+
+# app.database needs a URL at import time; the tests never connect to it
+os.environ.setdefault("DATABASE_URL", "postgresql+psycopg2://localhost/finaudit_test")
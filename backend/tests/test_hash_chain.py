@@ -0,0 +1,89 @@
+from datetime import datetime
+from types import SimpleNamespace
+
+from app.utils.hash_chain import (
+    GENESIS, TRAIL, VERIFICATION, _ChainCheck, _legacy_link_hash, canonical_json, link_hash, trail_payload
+)
+
+def test_canonical_json_ignores_key_order_and_whitespace():
+    assert canonical_json({"b": 1, "a": [1, 2]}) == canonical_json({"a": [1, 2], "b": 1}) == '{"a":[1,2],"b":1}'
+
+def test_canonical_json_keeps_unicode_and_stringifies_other_values():
+    assert canonical_json({"note": "café", "at": datetime(2024, 1, 2, 3, 4, 5)}) == '{"at":"2024-01-02 03:04:05","note":"café"}'
+
+def test_link_hash_depends_on_the_previous_link_and_payload():
+    payload = {"status": "approved"}
+    assert link_hash(GENESIS, payload) == link_hash(GENESIS, dict(payload))
+    assert link_hash(GENESIS, payload) != link_hash("0" * 64, payload)
+    assert link_hash(GENESIS, payload) != link_hash(GENESIS, {"status": "rejected"})
+    assert link_hash(GENESIS, payload) != _legacy_link_hash(GENESIS, payload)
+
+def _blocks(payloads, legacy=0):
+    blocks, previous = [], GENESIS
+    for number, payload in enumerate(payloads, 1):
+        encode = _legacy_link_hash if number <= legacy else link_hash
+        current = encode(previous, payload)
+        blocks.append(SimpleNamespace(block_number=number, previous_hash=previous, current_hash=current, verification_data=payload))
+        previous = current
+    return blocks
+
+def _tip(blocks, legacy=0):
+    return SimpleNamespace(length=len(blocks), tip_hash=blocks[-1].current_hash if blocks else GENESIS, legacy_length=legacy)
+
+def _check(blocks, tip):
+    check = _ChainCheck(1, VERIFICATION, tip)
+    for block in blocks:
+        check.add_block(block)
+    return check.result()
+
+PAYLOADS = [{"status": status, "round": number} for number, status in enumerate(["pending", "needs_revision", "approved"], 1)]
+
+def test_intact_chain_is_valid():
+    blocks = _blocks(PAYLOADS)
+    result = _check(blocks, _tip(blocks))
+    assert result["valid"] and result["links"] == 3 and result["tip_hash"] == blocks[-1].current_hash
+
+def test_chain_with_legacy_prefix_is_valid():
+    blocks = _blocks(PAYLOADS, legacy=2)
+    assert _check(blocks, _tip(blocks, legacy=2))["valid"]
+
+def test_chain_without_tip_uses_legacy_hashing():
+    blocks = _blocks(PAYLOADS, legacy=3)
+    assert _check(blocks, None)["valid"]
+
+def test_edited_payload_breaks_the_chain_at_that_block():
+    blocks = _blocks(PAYLOADS)
+    blocks[1].verification_data = {"status": "approved", "round": 2}
+    result = _check(blocks, _tip(blocks))
+    assert not result["valid"] and result["broken_at"] == 2
+
+def test_truncated_chain_is_caught_by_the_tip():
+    blocks = _blocks(PAYLOADS)
+    result = _check(blocks[:2], _tip(blocks))
+    assert not result["valid"] and result["broken_at"] == 3
+
+def _trail_row(previous, action, timestamp):
+    row = SimpleNamespace(
+        submission_id=1, action=action, actor_id=5, actor_type="user", details={"stage": action},
+        ip_address=None, user_agent="pytest", session_id=None, timestamp=timestamp
+    )
+    row.hash_chain = link_hash(previous, trail_payload(row))
+    return row
+
+def test_trail_rows_are_verified_after_the_legacy_prefix():
+    legacy = SimpleNamespace(hash_chain="legacy-hash")
+    first = _trail_row(legacy.hash_chain, "submitted", datetime(2024, 1, 1))
+    second = _trail_row(first.hash_chain, "approved", datetime(2024, 1, 2))
+    tip = SimpleNamespace(length=3, tip_hash=second.hash_chain, legacy_length=1)
+
+    check = _ChainCheck(1, TRAIL, tip)
+    for row in (legacy, first, second):
+        check.add_trail_row(row)
+    result = check.result()
+    assert result["valid"] and result["unverifiable_links"] == 1
+
+    check = _ChainCheck(1, TRAIL, tip)
+    second.details = {"stage": "rejected"}
+    for row in (legacy, first, second):
+        check.add_trail_row(row)
+    assert check.result()["broken_at"] == 3
@@ -0,0 +1,127 @@
+from collections import Counter
+from datetime import datetime
+
+from sqlalchemy.orm.attributes import set_committed_value
+
+from app.models import (
+    Audit, AuditStatus, AuditType, DocumentRequirement, DocumentSubmission, EvidenceStatus, FindingSeverity,
+    FindingStatus, WorkflowStage
+)
+from app.utils.kpi_store import (
+    SUBMISSION_ATTRIBUTES, CompanyKPIs, _accumulate, _previous_state, _restates, audit_counters, finding_counters,
+    submission_counters
+)
+
+def _audit(**overrides):
+    audit = {
+        "company_id": 1, "status": AuditStatus.in_progress, "audit_type": AuditType.financial,
+        "compliance_frameworks": ["SOX", "IFRS"], "requires_approval": True, "approval_status": "pending",
+        "start_date": datetime(2024, 1, 1), "end_date": None, "deadline": datetime(2024, 3, 1),
+        "peer_reviewed": False, "ai_risk_score": 7.5,
+    }
+    audit.update(overrides)
+    return audit
+
+def _submission(**overrides):
+    submission = {
+        "requirement_id": 3, "verification_status": EvidenceStatus.pending, "workflow_stage": WorkflowStage.under_review,
+        "revision_round": 1, "submitted_at": datetime(2024, 2, 1),
+    }
+    submission.update(overrides)
+    return submission
+
+def _delta(old, new, contribution, context=None):
+    deltas = Counter()
+    _accumulate(deltas, 1, contribution(old, context), -1)
+    _accumulate(deltas, 1, contribution(new, context), 1)
+    return {key: value for key, value in deltas.items() if value}
+
+def test_audit_counters():
+    counters = audit_counters(_audit())
+    assert counters[("audits_total", "")] == 1
+    assert counters[("audits_status", "in_progress")] == 1
+    assert counters[("audits_framework", "SOX")] == counters[("audits_framework", "IFRS")] == 1
+    assert counters[("audits_approval", "pending")] == 1
+    assert counters[("audits_risk_score_sum", "")] == 7.5
+    assert ("audits_completed_month", "2024-02") not in counters
+
+def test_completing_an_audit_moves_only_its_status_counters():
+    before = _audit()
+    after = _audit(status=AuditStatus.completed, end_date=datetime(2024, 2, 20))
+    assert _delta(before, after, audit_counters) == {
+        (1, "audits_status", "in_progress"): -1,
+        (1, "audits_status", "completed"): 1,
+        (1, "audits_completed_peer_known", ""): 1,
+        (1, "audits_completed_month", "2024-02"): 1,
+        (1, "audits_completed_on_time", ""): 1,
+        (1, "audits_duration_days_sum", ""): 50,
+        (1, "audits_duration_count", ""): 1,
+    }
+
+def test_approving_a_submission_counts_first_pass_and_timeliness():
+    deadline = datetime(2024, 2, 15)
+    before = _submission()
+    after = _submission(verification_status=EvidenceStatus.approved, workflow_stage=WorkflowStage.approved)
+    assert _delta(before, after, submission_counters, deadline) == {
+        (1, "submissions_status", "pending"): -1,
+        (1, "submissions_status", "approved"): 1,
+        (1, "submissions_stage", "under_review"): -1,
+        (1, "submissions_stage", "approved"): 1,
+        (1, "submissions_first_pass_approved", ""): 1,
+    }
+    assert submission_counters(after, deadline)[("submissions_on_time", "")] == 1
+    assert submission_counters(after, datetime(2024, 1, 15))[("submissions_late", "")] == 1
+
+def test_finding_counters():
+    finding = {
+        "audit_id": 2, "severity": FindingSeverity.major, "status": FindingStatus.resolved, "finding_type": None,
+        "ai_detected": True, "created_at": datetime(2024, 1, 10), "resolved_at": datetime(2024, 2, 9),
+    }
+    counters = finding_counters(finding)
+    assert counters[("findings_ai_detected", "")] == 1
+    assert counters[("findings_new_month", "2024-01")] == 1
+    assert counters[("findings_resolved_month", "2024-02")] == 1
+    assert counters[("findings_resolve_days_sum", "")] == 30
+    assert not any(metric == "findings_type" for metric, _ in counters)
+
+def _loaded_submission(**values):
+    submission = DocumentSubmission()
+    for attr, value in _submission(**values).items():
+        set_committed_value(submission, attr, value)
+    return submission
+
+def test_previous_state_reports_committed_values():
+    submission = _loaded_submission()
+    submission.workflow_stage = WorkflowStage.approved
+    previous, changed = _previous_state(submission, SUBMISSION_ATTRIBUTES)
+    assert changed
+    assert previous == _submission()
+
+def test_previous_state_of_an_unchanged_row():
+    previous, changed = _previous_state(_loaded_submission(), SUBMISSION_ATTRIBUTES)
+    assert not changed
+    assert previous == _submission()
+
+def test_previous_state_is_unknown_without_committed_values():
+    submission = DocumentSubmission()
+    submission.workflow_stage = WorkflowStage.approved
+    previous, changed = _previous_state(submission, SUBMISSION_ATTRIBUTES)
+    assert changed
+    assert previous is None
+
+def test_company_kpis_view():
+    kpis = CompanyKPIs([
+        ("audits_status", "completed", 3.0), ("audits_status", "planned", 0.0),
+        ("audits_risk_score_sum", "", 15.0), ("audits_risk_score_count", "", 4.0),
+    ])
+    assert kpis.count("audits_status", "completed") == 3
+    assert kpis.buckets("audits_status") == {"completed": 3}
+    assert kpis.average("audits_risk_score") == 3.75
+    assert kpis.value("missing") == 0
+
+def test_moving_a_deadline_restates_the_company():
+    requirement = {"audit_id": 2, "is_mandatory": True, "deadline": datetime(2024, 2, 15)}
+    assert _restates(DocumentRequirement, requirement, {**requirement, "deadline": datetime(2024, 3, 1)})
+    assert not _restates(DocumentRequirement, requirement, {**requirement, "is_mandatory": False})
+    assert not _restates(DocumentRequirement, None, requirement)
+    assert not _restates(Audit, _audit(), _audit(deadline=datetime(2024, 4, 1)))
@@ -0,0 +1,74 @@
+import hashlib
+
+import pytest
+
+from app.utils.merkle import (
+    EMPTY_ROOT, append_leaf, frontier_root, inclusion_ranges, leaf_hash, merkle_root, node_hash, perfect_subtrees,
+    range_hash, verify_inclusion
+)
+
+def _mth(leaves):
+    # RFC 6962 section 2.1, written directly from the definition
+    if len(leaves) == 1:
+        return leaves[0]
+    k = 1 << ((len(leaves) - 1).bit_length() - 1)
+    return hashlib.sha256(b"\x01" + _mth(leaves[:k]) + _mth(leaves[k:])).digest()
+
+def _leaves(count):
+    return [leaf_hash(b"record %d" % index) for index in range(count)]
+
+def _grow(count):
+    frontier, nodes = [], {}
+    for size, leaf in enumerate(_leaves(count)):
+        for level, position, node in append_leaf(frontier, size, leaf):
+            nodes[(level, position)] = node
+    return frontier, nodes
+
+def test_leaves_and_nodes_are_domain_separated():
+    assert leaf_hash(b"ab") != node_hash(b"a", b"b")
+
+def test_empty_tree():
+    assert merkle_root([]) == frontier_root([]) == EMPTY_ROOT
+
+@pytest.mark.parametrize("count", list(range(1, 18)) + [31, 32, 33, 100])
+def test_roots_match_the_rfc_definition(count):
+    leaves = _leaves(count)
+    frontier, _ = _grow(count)
+    assert merkle_root(leaves) == frontier_root(frontier) == _mth(leaves).hex()
+
+def test_frontier_holds_one_subtree_per_set_bit():
+    for count in range(1, 70):
+        frontier, _ = _grow(count)
+        assert len(frontier) == bin(count).count("1")
+
+@pytest.mark.parametrize("count", [1, 2, 3, 5, 8, 13, 21])
+def test_range_hash_of_proof_ranges_from_stored_nodes(count):
+    leaves = _leaves(count)
+    _, nodes = _grow(count)
+    for index in range(count):
+        for start, size in inclusion_ranges(index, count):
+            assert all(key in nodes for key in perfect_subtrees(start, size))
+            assert range_hash(start, size, nodes) == _mth(leaves[start:start + size])
+
+@pytest.mark.parametrize("count", [1, 2, 3, 4, 7, 10, 16, 17])
+def test_every_leaf_has_a_verifiable_inclusion_proof(count):
+    leaves = _leaves(count)
+    frontier, nodes = _grow(count)
+    root = frontier_root(frontier)
+    for index, leaf in enumerate(leaves):
+        path = [range_hash(start, size, nodes) for start, size in inclusion_ranges(index, count)]
+        assert verify_inclusion(leaf, index, count, path, root)
+
+def test_inclusion_proof_rejects_tampering():
+    count, index = 11, 6
+    leaves = _leaves(count)
+    frontier, nodes = _grow(count)
+    root = frontier_root(frontier)
+    path = [range_hash(start, size, nodes) for start, size in inclusion_ranges(index, count)]
+
+    assert not verify_inclusion(leaf_hash(b"forged"), index, count, path, root)
+    assert not verify_inclusion(leaves[index], index + 1, count, path, root)
+    assert not verify_inclusion(leaves[index], index, count, path[:-1], root)
+    assert not verify_inclusion(leaves[index], index, count, path + [path[0]], root)
+    assert not verify_inclusion(leaves[index], index, count, list(reversed(path)), root)
+    assert not verify_inclusion(leaves[index], count, count, path, root)
@@ -0,0 +1,90 @@
+from datetime import date, datetime
+from decimal import Decimal
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import Column, DateTime, Integer, create_engine
+from sqlalchemy.orm import Session, declarative_base
+
+from app.utils.pagination import cached_count, decode_cursor, encode_cursor, keyset_page
+
+Base = declarative_base()
+
+class Row(Base):
+    __tablename__ = "rows"
+
+    id = Column(Integer, primary_key=True)
+    created_at = Column(DateTime)
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        # Repeated and missing sort values exercise the id tie-break and NULLS LAST
+        session.add_all([
+            Row(id=row_id, created_at=None if row_id % 7 == 0 else datetime(2024, 1, 1 + row_id % 5))
+            for row_id in range(1, 41)
+        ])
+        session.commit()
+        yield session
+
+@pytest.mark.parametrize("value", [
+    None, 42, "open", datetime(2024, 5, 6, 7, 8, 9), date(2024, 5, 6), Decimal("12.50")
+])
+def test_cursor_round_trip(value):
+    assert decode_cursor(encode_cursor(value, 17)) == (value, 17)
+
+def test_cursor_is_url_safe():
+    cursor = encode_cursor("a/b+c", 1)
+    assert "=" not in cursor and "/" not in cursor and "+" not in cursor
+
+@pytest.mark.parametrize("cursor", ["not a cursor", "e30", encode_cursor("x", 1)[:-2] + "!!"])
+def test_invalid_cursor_is_a_bad_request(cursor):
+    with pytest.raises(HTTPException) as raised:
+        decode_cursor(cursor)
+    assert raised.value.status_code == 400
+
+def _walk(db, limit, **kwargs):
+    ids, cursor, pages = [], None, 0
+    while True:
+        page = keyset_page(db.query(Row), Row.id, cursor, limit, **kwargs)
+        ids.extend(row.id for row in page["items"])
+        pages += 1
+        assert page["has_more"] == (page["next_cursor"] is not None)
+        if not page["has_more"]:
+            return ids, pages
+        cursor = page["next_cursor"]
+
+def _expected(db, descending):
+    rows = db.query(Row).all()
+    dated = sorted((row for row in rows if row.created_at), key=lambda row: (row.created_at, row.id), reverse=descending)
+    undated = sorted((row for row in rows if not row.created_at), key=lambda row: row.id, reverse=descending)
+    return [row.id for row in dated + undated]
+
+@pytest.mark.parametrize("descending", [False, True])
+@pytest.mark.parametrize("limit", [1, 3, 7, 40, 100])
+def test_keyset_pages_cover_every_row_once(db, descending, limit):
+    ids, pages = _walk(db, limit, sort_column=Row.created_at, descending=descending)
+    assert ids == _expected(db, descending)
+    assert pages == -(-40 // limit)  # no trailing empty page
+
+@pytest.mark.parametrize("descending", [False, True])
+def test_keyset_by_id(db, descending):
+    ids, _ = _walk(db, 6, descending=descending)
+    assert ids == sorted(range(1, 41), reverse=descending)
+
+def test_keyset_entity_maps_tuple_rows(db):
+    query = db.query(Row, Row.id * 2)
+    page = keyset_page(query, Row.id, None, 5, entity=lambda row: row[0])
+    assert [row[0].id for row in page["items"]] == [1, 2, 3, 4, 5]
+    following = keyset_page(query, Row.id, page["next_cursor"], 5, entity=lambda row: row[0])
+    assert following["items"][0][0].id == 6
+
+def test_cached_count_reuses_the_total_until_it_expires(db):
+    key = ("rows", "test_cached_count")
+    assert cached_count(db.query(Row), key, ttl=60) == 40
+    db.add(Row(id=41))
+    db.commit()
+    assert cached_count(db.query(Row), key, ttl=60) == 40
+    assert cached_count(db.query(Row), ("rows", "fresh"), ttl=60) == 41
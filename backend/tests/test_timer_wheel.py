@@ -0,0 +1,79 @@
+import random
+
+import pytest
+
+from app.utils.timer_wheel import TimerWheel
+
+# Small wheels (8 x 4 x 3 ticks) so cascades and overflow happen within a few hundred ticks
+SLOTS = (8, 4, 3)
+
+def test_fires_in_due_order_with_payloads():
+    wheel = TimerWheel(100.0)
+    wheel.schedule("late", 103.5, "b")
+    wheel.schedule("early", 101.2, "a")
+    assert wheel.advance(101.9) == []
+    assert wheel.advance(105.0) == [("early", 102.0, "a"), ("late", 104.0, "b")]
+    assert len(wheel) == 0
+
+def test_past_due_timer_fires_on_the_next_advance():
+    wheel = TimerWheel(100.0)
+    wheel.schedule("overdue", 50.0)
+    assert [key for key, _, _ in wheel.advance(100.0)] == ["overdue"]
+
+def test_reschedule_and_cancel():
+    wheel = TimerWheel(0.0, slots=SLOTS)
+    assert wheel.schedule("a", 10.0)
+    assert not wheel.schedule("a", 10.0)  # same tick
+    assert wheel.schedule("a", 300.0)
+    assert wheel.due_tick("a") == 300
+    assert wheel.advance(20.0) == []
+    assert wheel.cancel("a") and "a" not in wheel
+    assert not wheel.cancel("a")
+    assert wheel.advance(400.0) == []
+
+def test_next_expiry_sleeps_until_the_next_busy_tick():
+    wheel = TimerWheel(0.0, slots=SLOTS)
+    assert wheel.next_expiry(5.0) == 5.0
+    wheel.schedule("a", 3.0)
+    assert wheel.next_expiry(60.0) == 3.0
+    assert wheel.next_expiry(0.2) == 1.0  # never below one tick
+    wheel.schedule("now", -1.0)
+    assert wheel.next_expiry(60.0) == 0.0
+
+@pytest.mark.parametrize("seed", range(10))
+def test_every_timer_fires_once_and_never_early(seed):
+    generator = random.Random(seed)
+    start = generator.uniform(0, 1e6)
+    wheel = TimerWheel(start, slots=SLOTS)
+    timers = {}
+    for key in range(300):
+        timers[key] = start + generator.uniform(-5, 400)  # beyond the 96 tick span too
+        wheel.schedule(key, timers[key], key)
+    for key in generator.sample(sorted(timers), 30):
+        assert wheel.cancel(key)
+        del timers[key]
+
+    fired, now = set(), start
+    while now < start + 450:
+        now += generator.uniform(0.1, 20)
+        for key, due, payload in wheel.advance(now):
+            assert key not in fired and payload == key
+            assert timers[key] <= due <= now
+            fired.add(key)
+    assert fired == set(timers)
+    assert len(wheel) == 0
+
+@pytest.mark.parametrize("seed", range(5))
+def test_timers_fire_within_a_tick_of_their_due_time(seed):
+    generator = random.Random(seed)
+    start = generator.uniform(0, 1e5)
+    wheel = TimerWheel(start, slots=SLOTS)
+    timers = {}
+    for key in range(200):
+        timers[key] = start + generator.uniform(0, 500)
+        wheel.schedule(key, timers[key])
+    now = start
+    while timers:
+        now += 0.5
+        for key, _, _ in wheel.advance(now):
+            assert 0 <= now - timers.pop(key) < 1.5
@@ -0,0 +1,48 @@
+import random
+import zlib
+
+import pytest
+
+from app.utils.version_deltas import apply_delta, encode_delta
+
+BASE = b"".join(b"%d,account %d,%d.00\r\n" % (row, row % 17, row * 13) for row in range(500))
+
+@pytest.mark.parametrize("target", [
+    BASE,
+    b"",
+    BASE.replace(b"250,", b"250-edited,"),
+    b"id,account,amount\r\n" + BASE,
+    BASE + b"500,account 7,6500.00",  # no trailing newline
+    BASE[: len(BASE) // 2] + BASE[len(BASE) // 2:].replace(b"\r\n", b"\n"),  # mixed line endings
+    b"\x00\xff binary \x80\n" * 3,
+])
+def test_apply_delta_rebuilds_the_target_byte_for_byte(target):
+    assert apply_delta(BASE, encode_delta(BASE, target)) == target
+
+def test_delta_from_empty_base():
+    assert apply_delta(b"", encode_delta(b"", BASE)) == BASE
+
+def test_random_edits_round_trip():
+    generator = random.Random(7)
+    lines = BASE.splitlines(keepends=True)
+    for _ in range(25):
+        edited = list(lines)
+        for _ in range(generator.randint(1, 20)):
+            index = generator.randrange(len(edited))
+            choice = generator.random()
+            if choice < 0.3:
+                del edited[index]
+            elif choice < 0.6:
+                edited.insert(index, b"inserted %d\n" % generator.randrange(10 ** 6))
+            else:
+                edited[index] = edited[index].upper()
+        target = b"".join(edited)
+        assert apply_delta(BASE, encode_delta(BASE, target)) == target
+
+def test_small_edit_gives_a_small_delta():
+    target = BASE.replace(b"250,", b"250-edited,")
+    assert len(encode_delta(BASE, target)) < len(zlib.compress(target)) // 10
+
+def test_unknown_format_is_rejected():
+    with pytest.raises(ValueError):
+        apply_delta(BASE, zlib.compress(b"XX9 not a delta"))